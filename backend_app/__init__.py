@@ -17,6 +17,11 @@ def create_app(test_config=None):
         app.secret_key = b'"#$(()(!"()))!"#'
     else:
         app.config.from_mapping(test_config)
+    # The API connects on its first request, see api._visualizer
+    app.config.setdefault('MONGO_URI', 'mongodb://localhost:27017')
+    app.config.setdefault('MONGO_DB', 'fleet_db')
+    # Creating existing indexes is a no-op; turn off for a user without createIndex
+    app.config.setdefault('MONGO_ENSURE_INDEXES', True)
 
     try:
         os.makedirs(app.instance_path)
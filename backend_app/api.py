@@ -1,17 +1,52 @@
 from datetime import datetime
+from threading import Lock
 
-from flask import Blueprint, session, jsonify, request
+from flask import Blueprint, current_app, session, jsonify, request
 from flask_cors import CORS
 
-from .vehicle_data import VehicleDataVisualizer
+from . import events
+from .config import render_config
+from .formats import check_format, encode_frame
+from .render import PlotRenderer
+from .schemas_objects import gpsdata_to_dict
+from .spatial import parse_bbox
 from .utils import extract_fields
 
 main = Blueprint('main', __name__)
 
 CORS(main, resources={r"/*": {"origins": "http://localhost:5500.*"}})
 
-visualizer = VehicleDataVisualizer()
-db = visualizer.db
+# One pool of render processes for every app, started on the first plot
+_renderer = PlotRenderer(render_config['workers'])
+_visualizer_lock = Lock()
+
+
+def _visualizer():
+    """The VehicleDataVisualizer of the current app, created on first use.
+
+    Importing vehicle_data loads pandas and pymongo and the visualizer opens
+    the MongoDB client, neither is needed until a request reads the data.
+    The indexes the queries rely on are created then, unless
+    MONGO_ENSURE_INDEXES is off.
+    """
+    extensions = current_app.extensions
+    with _visualizer_lock:
+        if 'visualizer' not in extensions:
+            from .vehicle_data import VehicleDataVisualizer
+            visualizer = VehicleDataVisualizer(current_app.config['MONGO_URI'], current_app.config['MONGO_DB'],
+                                               renderer=_renderer)
+            if current_app.config['MONGO_ENSURE_INDEXES']:
+                visualizer.db.ensure_indexes()
+            extensions['visualizer'] = visualizer
+        return extensions['visualizer']
+
+
+def _render(fmt, plot, plot_data, **params):
+    """The PNG plot, or the data behind it in a data format; "" when there is no data."""
+    if fmt == "png":
+        return plot(**params)
+    return encode_frame(plot_data(**params), fmt)
+
 
 @main.route("/", methods=["GET", "POST"])
 def home():
@@ -22,22 +57,79 @@ def home():
 
 @main.route("/api/vehicles", methods=["GET"])
 def get_vehicles():
-    vehicles = db.get_all_vehicles()
+    vehicles = _visualizer().db.get_all_vehicles()
     return jsonify({"status": 200, "data": vehicles})
 
 
 @main.route("/api/fields", methods=["GET"])
 def get_fields():
+    visualizer = _visualizer()
     fields = visualizer.get_fields()
     return jsonify({"status": 200, "data": fields})
 
 
+@main.route("/api/plot/cache", methods=["GET"])
+def plot_cache_stats():
+    visualizer = _visualizer()
+    return jsonify({"status": 200, "data": visualizer.plot_cache.stats()})
+
+
+@main.route("/api/stream/metrics", methods=["GET"])
+def stream_metrics():
+    return jsonify({"status": 200, "data": events.decode_stats()})
+
+
+@main.route("/api/positions", methods=["GET"])
+def positions():
+    # The store is filled by the stream, which HTTP only deployments never start from a Socket.IO connect
+    events.start_positions()
+    # ?units=a,b or ?units=a&units=b, every unit when missing
+    units = [unit for value in request.args.getlist("units") for unit in value.split(",") if unit]
+    # Optionally within ?bbox=south,west,north,east and/or ?lat=..&lon=..&radius_km=..
+    try:
+        bbox = parse_bbox(request.args["bbox"]) if "bbox" in request.args else None
+        radius = None
+        if {"lat", "lon", "radius_km"} & set(request.args):
+            radius = (request.args.get("lat", type=float), request.args.get("lon", type=float),
+                      request.args.get("radius_km", type=float))
+            if None in radius or not -90 <= radius[0] <= 90 or not -180 <= radius[1] <= 180 or radius[2] < 0:
+                raise ValueError("A radius query needs lat, lon and a non negative radius_km")
+    except ValueError as error:
+        return jsonify({"status": 400, "data": str(error)})
+
+    selected = set(units) if units else None
+    if bbox is not None:
+        in_bbox = events.index.within_bbox(bbox)
+        selected = set(in_bbox) if selected is None else selected.intersection(in_bbox)
+    distances = None
+    if radius is not None:
+        distances = dict(events.index.within_radius(*radius))
+        selected = set(distances) if selected is None else selected.intersection(distances)
+
+    snapshot = events.store.snapshot(selected)
+    if distances is None:
+        data = [gpsdata_to_dict(snapshot[unit], None) for unit in sorted(snapshot)]
+    else:
+        # Nearest first, with the distance to the point
+        data = [dict(gpsdata_to_dict(snapshot[unit], None), distance_km=distances[unit])
+                for unit in sorted(snapshot, key=lambda unit: (distances[unit], unit))]
+    return jsonify({"status": 200, "data": data})
+
+
 @main.route("/api/speed-over-time", methods=["POST"])
 def speed_over_time():
+    visualizer = _visualizer()
     data = request.get_json()
     units_id, start_date, end_date = extract_fields(data)
-
-    plot = visualizer.create_time_series_plot(
+    fmt = data.get("format", "png")
+    error = check_format(fmt)
+    if error:
+        return jsonify({"status": 400, "data": error})
+
+    plot = _render(
+        fmt,
+        visualizer.create_time_series_plot,
+        visualizer.time_series_data,
         units_id=units_id,
         field="vehicle-speed",
         start_date=start_date,
@@ -52,10 +144,18 @@ def speed_over_time():
 
 @main.route("/api/daily-distance", methods=["POST"])
 def daily_distance():
+    visualizer = _visualizer()
     data = request.get_json()
     units_id, start_date, end_date = extract_fields(data)
-
-    plot = visualizer.plot_daily_distance(
+    fmt = data.get("format", "png")
+    error = check_format(fmt)
+    if error:
+        return jsonify({"status": 400, "data": error})
+
+    plot = _render(
+        fmt,
+        visualizer.plot_daily_distance,
+        visualizer.daily_distance_data,
         units_id=units_id,
         start_date=start_date,
         end_date=end_date
@@ -69,10 +169,18 @@ def daily_distance():
 
 @main.route('/api/average-speed-distance', methods=['POST'])
 def average_speed_distance():
+    visualizer = _visualizer()
     data = request.get_json()
     unit_id, start_date, end_date = extract_fields(data)
-
-    plot = visualizer.plot_daily_average(
+    fmt = data.get("format", "png")
+    error = check_format(fmt)
+    if error:
+        return jsonify({"status": 400, "data": error})
+
+    plot = _render(
+        fmt,
+        visualizer.plot_daily_average,
+        visualizer.daily_average_data,
         unit_id=unit_id,
         start_date=start_date,
         end_date=end_date
@@ -86,15 +194,23 @@ def average_speed_distance():
 
 @main.route("/api/plot/timeseries", methods=["POST"])
 def plot_timeseries():
+    visualizer = _visualizer()
     data = request.get_json()
     units_id, start_date, end_date = extract_fields(data)
+    fmt = data.get("format", "png")
+    error = check_format(fmt)
+    if error:
+        return jsonify({"status": 400, "data": error})
     field = data.get("field", "")
     if field == "":
         return jsonify({"status": 400, "data": "Field parameter is required."})
     if units_id == None:
         return jsonify({"status": 400, "data": "units_id parameter is required."})
 
-    plot = visualizer.create_time_series_plot(
+    plot = _render(
+        fmt,
+        visualizer.create_time_series_plot,
+        visualizer.time_series_data,
         units_id=units_id,
         field=field,
         start_date=start_date,
@@ -109,15 +225,23 @@ def plot_timeseries():
 
 @main.route("/api/plot/distribution", methods=["POST"])
 def plot_distribution():
+    visualizer = _visualizer()
     data = request.get_json()
     units_id, start_date, end_date = extract_fields(data)
+    fmt = data.get("format", "png")
+    error = check_format(fmt)
+    if error:
+        return jsonify({"status": 400, "data": error})
     field = data.get("field", "")
     if field == "":
         return jsonify({"status": 400, "data": "Field parameter is required."})
     if units_id == None:
         return jsonify({"status": 400, "data": "units_id parameter is required."})
 
-    plot = visualizer.create_distribution_plot(
+    plot = _render(
+        fmt,
+        visualizer.create_distribution_plot,
+        visualizer.distribution_data,
         units_id=units_id,
         field=field,
         start_date=start_date,
@@ -132,15 +256,23 @@ def plot_distribution():
 
 @main.route("/api/plot/boxplot", methods=["POST"])
 def plot_boxplot():
+    visualizer = _visualizer()
     data = request.get_json()
     units_id, start_date, end_date = extract_fields(data)
+    fmt = data.get("format", "png")
+    error = check_format(fmt)
+    if error:
+        return jsonify({"status": 400, "data": error})
     field = data.get("field", "")
     if field == "":
         return jsonify({"status": 400, "data": "Field parameter is required."})
     if units_id == None:
         return jsonify({"status": 400, "data": "units_id parameter is required."})
 
-    plot = visualizer.create_box_plot(
+    plot = _render(
+        fmt,
+        visualizer.create_box_plot,
+        visualizer.box_plot_data,
         units_id=units_id,
         field=field,
         start_date=start_date,
@@ -155,8 +287,13 @@ def plot_boxplot():
 
 @main.route("/api/plot/scatter", methods=["POST"])
 def plot_scatter():
+    visualizer = _visualizer()
     data = request.get_json()
     units_id, start_date, end_date = extract_fields(data)
+    fmt = data.get("format", "png")
+    error = check_format(fmt)
+    if error:
+        return jsonify({"status": 400, "data": error})
     field_x = data.get("field_x", "")
     field_y = data.get("field_y", "")
     if field_x == "" or field_y == "":
@@ -164,7 +301,10 @@ def plot_scatter():
     if units_id == None:
         return jsonify({"status": 400, "data": "units_id parameter is required."})
     
-    plot = visualizer.create_scatter_plot(
+    plot = _render(
+        fmt,
+        visualizer.create_scatter_plot,
+        visualizer.scatter_data,
         units_id=units_id,
         field_x=field_x,
         field_y=field_y,
@@ -180,13 +320,21 @@ def plot_scatter():
 
 @main.route("/api/plot/heatmap", methods=["POST"])
 def plot_heatmap():
+    visualizer = _visualizer()
     data = request.get_json()
     unit_id, start_date, end_date = extract_fields(data)
+    fmt = data.get("format", "png")
+    error = check_format(fmt)
+    if error:
+        return jsonify({"status": 400, "data": error})
 
     if not unit_id:
         return jsonify({"status": 400, "data": "unit_id parameter is required."})
     
-    plot = visualizer.create_correlation_heatmap(
+    plot = _render(
+        fmt,
+        visualizer.create_correlation_heatmap,
+        visualizer.correlation_data,
         unit_id=unit_id,
         start_date=start_date,
         end_date=end_date
@@ -0,0 +1,239 @@
+"""
+Caches that avoid repeating work across requests.
+"""
+import functools
+import inspect
+import time
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+from cachetools import TLRUCache
+
+from .utils import to_naive_utc
+
+
+def _normalize(value: Any) -> Hashable:
+    """Turn a request parameter into a hashable, order independent value."""
+    if isinstance(value, datetime):
+        return to_naive_utc(value).replace(microsecond=0)
+    if isinstance(value, dict):
+        return tuple(sorted(((_normalize(name), _normalize(item)) for name, item in value.items()), key=repr))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        # Ordered by repr, the items may be of types that do not compare
+        return tuple(sorted((_normalize(item) for item in value), key=repr))
+    return value
+
+
+class PlotCache:
+    """Rendered plots keyed by the request parameters.
+
+    Entries are evicted least recently used first once the cached plots add
+    up to maxsize characters, and expire after ttl seconds. Plots whose time
+    window ended in the past cannot change anymore and are kept past_ttl
+    seconds instead.
+    """
+
+    def __init__(self, maxsize: int = 64 * 2**20, ttl: float = 30, past_ttl: float = 3600):
+        self.ttl = ttl
+        self.past_ttl = past_ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = TLRUCache(maxsize=maxsize, ttu=self._time_to_use, getsizeof=len)
+        self._lock = Lock()
+
+    @staticmethod
+    def key(plot_type: str, params: Dict[str, Any]) -> Tuple:
+        """Cache key of a plot from its type and parameters."""
+        return (plot_type,) + tuple(sorted((name, _normalize(value)) for name, value in params.items()))
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            plot = self._cache.get(key)
+            if plot is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return plot
+
+    def set(self, key: Tuple, plot: str) -> None:
+        with self._lock:
+            try:
+                self._cache[key] = plot
+            except ValueError:
+                # Larger than the whole cache
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit and miss counters along with the current size."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._cache),
+                'size': self._cache.currsize,
+                'maxsize': self._cache.maxsize,
+            }
+
+    def _time_to_use(self, key: Tuple, plot: str, now: float) -> float:
+        end_date = dict(key[1:]).get('end_date')
+        # Normalized to naive UTC by key()
+        if isinstance(end_date, datetime) and end_date < datetime.now(timezone.utc).replace(tzinfo=None):
+            return now + self.past_ttl
+        return now + self.ttl
+
+
+class _CachedWindow:
+    """Rows of a query from start (None: the beginning) up to covered_until."""
+    __slots__ = ('start', 'covered_until', 'open_ended', 'frame', 'size', 'expires')
+
+    def __init__(self, start: Optional[datetime], covered_until: datetime, open_ended: bool, frame: pd.DataFrame, expires: float):
+        self.start = start
+        self.covered_until = covered_until
+        self.open_ended = open_ended
+        self.frame = frame
+        self.size = int(frame.memory_usage(deep=True).sum()) if not frame.empty else 0
+        self.expires = expires
+
+    def covers_start(self, start: Optional[datetime]) -> bool:
+        return self.start is None or (start is not None and start >= self.start)
+
+
+class FrameCache:
+    """Query result DataFrames reused across overlapping time windows.
+
+    An entry holds every row of a query from its start time up to the time it
+    covers. A request whose window falls inside it is served by slicing the
+    cached frame. When the cached window extends into the present, a request
+    reaching past it only fetches the rows from the covered time on and
+    replaces the cached rows from that time. Rows are stored some time after
+    their timestamp, so an open window is only considered covered up to lag
+    seconds before it was fetched. Entries are evicted least recently used
+    first once they add up to maxsize bytes, and expire ttl seconds after the
+    first fetch.
+    """
+    # Rows of the same vehicle and time are the same row
+    KEY_COLUMNS = ('unit-id', 'timestamp')
+
+    def __init__(self, maxsize: int = 256 * 2**20, ttl: float = 600, lag: float = 60):
+        self.ttl = ttl
+        self.lag = timedelta(seconds=lag)
+        self.hits = 0
+        self.tail_fetches = 0
+        self.misses = 0
+        self._cache = TLRUCache(maxsize=maxsize, ttu=lambda key, window, now: window.expires,
+                                getsizeof=lambda window: window.size)
+        self._lock = Lock()
+
+    def get(self, key: Hashable, start: Optional[datetime], end: Optional[datetime],
+            fetch: Callable[[Optional[datetime], Optional[datetime]], pd.DataFrame]) -> pd.DataFrame:
+        """Rows of the query key between start and end, calling fetch(start, end) for what is not cached."""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        with self._lock:
+            window = self._cache.get(key)
+
+        if window is not None and window.covers_start(start):
+            if end is not None and end <= window.covered_until:
+                with self._lock:
+                    self.hits += 1
+                return self._slice(window.frame, start, end)
+
+            if window.open_ended:
+                # The tail replaces the cached rows from covered_until on, those may have changed since
+                tail = fetch(window.covered_until, None)
+                head = window.frame
+                if not head.empty:
+                    head = head[head['timestamp'] < window.covered_until]
+                frames = [frame for frame in (head, tail) if not frame.empty]
+                frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+                if not frame.empty and set(self.KEY_COLUMNS) <= set(frame.columns):
+                    frame = frame.drop_duplicates(list(self.KEY_COLUMNS), keep='last', ignore_index=True)
+                self._store(key, _CachedWindow(window.start, now - self.lag, True, frame, window.expires))
+                with self._lock:
+                    self.tail_fetches += 1
+                return self._slice(frame, start, end)
+
+        frame = fetch(start, end)
+        open_ended = end is None or end >= now - self.lag
+        covered_until = now - self.lag if open_ended else end
+        self._store(key, _CachedWindow(start, covered_until, open_ended, frame, time.monotonic() + self.ttl))
+        with self._lock:
+            self.misses += 1
+        # The cached frame must not change with the caller's
+        return frame.copy()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit, tail fetch and miss counters along with the current size."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'tail_fetches': self.tail_fetches,
+                'misses': self.misses,
+                'entries': len(self._cache),
+                'size': self._cache.currsize,
+                'maxsize': self._cache.maxsize,
+            }
+
+    def _store(self, key: Hashable, window: _CachedWindow) -> None:
+        with self._lock:
+            try:
+                self._cache[key] = window
+            except ValueError:
+                # Larger than the whole cache
+                self._cache.pop(key, None)
+
+    @staticmethod
+    def _slice(frame: pd.DataFrame, start: Optional[datetime], end: Optional[datetime]) -> pd.DataFrame:
+        if frame.empty:
+            return pd.DataFrame()
+        mask = pd.Series(True, index=frame.index)
+        if start is not None:
+            mask &= frame['timestamp'] >= start
+        if end is not None:
+            mask &= frame['timestamp'] <= end
+        sliced = frame[mask]
+        if sliced.empty:
+            return pd.DataFrame()
+        return sliced.reset_index(drop=True)
+
+
+def cached_plot(plot_type: str):
+    """Serve the decorated plot method from the instance's plot_cache.
+
+    Empty results (no data) are not cached.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            params.pop('self')
+
+            key = self.plot_cache.key(plot_type, params)
+            try:
+                hash(key)
+            except TypeError:
+                # A parameter the key cannot hold, rendered without the cache
+                return method(self, *args, **kwargs)
+            plot = self.plot_cache.get(key)
+            if plot is None:
+                plot = method(self, *args, **kwargs)
+                if plot != "":
+                    self.plot_cache.set(key, plot)
+            return plot
+
+        return wrapper
+
+    return decorator
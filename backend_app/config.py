@@ -7,3 +7,35 @@ config = {
 sr_config = {
     'url': 'http://localhost:8081'
 }
+
+# Plot rendering config, workers=None starts one render process per CPU
+render_config = {
+    'workers': None,
+}
+
+# Live GPS stream config, positions are sent tick_hz times per second and every
+# unit is sent again every keyframe_every ticks (0 disables keyframes)
+stream_config = {
+    'tick_hz': 5,
+    'keyframe_every': 25,
+    # kafka consumes in the web process, ingest receives the positions from
+    # the ingestion workers (python ingest.py) on ingest_config['addresses']
+    'source': 'kafka',
+}
+
+# Decoding of the GPS messages, see backend_app.decoder. mode is one of strict,
+# fast or sampled (validates 1 in sample_every), trusted_topics=None trusts all
+decode_config = {
+    'mode': 'strict',
+    'sample_every': 100,
+    'trusted_topics': None,
+}
+
+# Standalone ingestion, see backend_app.ingest. workers=None starts one consumer
+# process per CPU, all in group.id, sending the positions to every address.
+# List one address per web process, each listens on the first one free
+ingest_config = {
+    'workers': None,
+    'group.id': 'gps_ingest',
+    'addresses': [('127.0.0.1', 9870)],
+}
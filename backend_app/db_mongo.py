@@ -1,47 +1,444 @@
-from pymongo import MongoClient
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from pymongo import ASCENDING, MongoClient
+from datetime import date, datetime, time, timedelta
+from itertools import chain, islice
+from typing import Iterable, List, Dict, Any, Optional, Tuple
 import pandas as pd
 import numpy as np
 
+from .cache import FrameCache
+from .utils import to_naive_utc
+
+# Documents requested per round trip and converted to columns at once
+_CURSOR_BATCH_SIZE = 10000
+
+# Fields the canonical queries of explain_queries read: the GPS points of the
+# distance and a telemetry field of the plots. They are not in the (unit-id,
+# timestamp) index, so these queries fetch the documents and are never covered
+_EXPLAIN_FIELDS = {
+    'vehicles': ['latitude', 'longitude'],
+    'vehicles_variables': ['vehicle-speed'],
+}
+
+_DTYPES = {
+    'null': np.float64,
+    'int': np.int64,
+    'float': np.float64,
+    'datetime': 'datetime64[us]',
+    'object': object,
+}
+
+_MISSING = {
+    'null': np.nan,
+    'int': 0,
+    'float': np.nan,
+    'datetime': np.datetime64('NaT'),
+    'object': None,
+}
+
+
+def _value_kind(values: List[Any]) -> str:
+    """Narrowest column kind able to hold all the values."""
+    kind = 'null'
+    has_none = False
+    for value_type in set(map(type, values)):
+        if value_type is type(None):
+            has_none = True
+            continue
+        if issubclass(value_type, bool):
+            value_kind = 'object'
+        elif issubclass(value_type, int):
+            value_kind = 'int'
+        elif issubclass(value_type, float):
+            value_kind = 'float'
+        elif issubclass(value_type, datetime):
+            value_kind = 'datetime'
+        else:
+            value_kind = 'object'
+        kind = _promote(kind, value_kind)
+
+    if kind == 'int' and has_none:
+        return 'float'
+    return kind
+
+
+def _promote(kind_a: str, kind_b: str) -> str:
+    """Common kind of two column kinds."""
+    if kind_a == kind_b or kind_b == 'null':
+        return kind_a
+    if kind_a == 'null':
+        return kind_b
+    if {kind_a, kind_b} == {'int', 'float'}:
+        return 'float'
+    return 'object'
+
+
+class _ColumnarFrameBuilder:
+    """Builds a DataFrame from documents without keeping all of them in memory.
+
+    Documents are appended in batches, and each batch is written column by
+    column into typed NumPy buffers that grow geometrically. A column is
+    widened (int -> float -> object) when a batch does not fit its type.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._capacity = capacity
+        self._rows = 0
+        self._columns: Dict[str, np.ndarray] = {}
+        self._kinds: Dict[str, str] = {}
+
+    def append(self, batch: List[Dict[str, Any]]) -> None:
+        """Append a batch of documents as rows."""
+        size = len(batch)
+        if size == 0:
+            return
+        start, end = self._rows, self._rows + size
+        self._reserve(end)
+
+        keys = dict.fromkeys(chain.from_iterable(batch))
+        for key in keys:
+            values = [doc.get(key) for doc in batch]
+            kind = _value_kind(values)
+            if key not in self._columns:
+                # Rows before this batch do not have the field
+                self._kinds[key] = 'float' if kind == 'int' and start > 0 else kind
+                self._columns[key] = np.full(self._capacity, _MISSING[self._kinds[key]], dtype=_DTYPES[self._kinds[key]])
+            else:
+                self._widen(key, _promote(self._kinds[key], kind))
+            self._write(key, start, end, values)
+
+        for key in self._columns.keys() - keys.keys():
+            if self._kinds[key] == 'int':
+                self._widen(key, 'float')
+            self._columns[key][start:end] = _MISSING[self._kinds[key]]
+
+        self._rows = end
+
+    def frame(self) -> pd.DataFrame:
+        """Build the DataFrame with the rows appended so far."""
+        if self._rows == 0:
+            return pd.DataFrame()
+
+        data = {}
+        for key in list(self._columns):
+            column = self._columns.pop(key)
+            if self._kinds[key] == 'null':
+                column = np.full(self._rows, None, dtype=object)
+            elif len(column) != self._rows:
+                # Copy so the unused capacity is released
+                column = column[:self._rows].copy()
+            data[key] = column
+        return pd.DataFrame(data, copy=False)
+
+    def _reserve(self, rows: int) -> None:
+        if rows <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < rows:
+            capacity *= 2
+        for key, column in self._columns.items():
+            grown = np.full(capacity, _MISSING[self._kinds[key]], dtype=column.dtype)
+            grown[:self._capacity] = column
+            self._columns[key] = grown
+        self._capacity = capacity
+
+    def _widen(self, key: str, kind: str) -> None:
+        current = self._kinds[key]
+        if kind == current:
+            return
+        if current == 'null':
+            # Nothing but missing values so far
+            if kind == 'int' and self._rows > 0:
+                kind = 'float'
+            column = np.full(self._capacity, _MISSING[kind], dtype=_DTYPES[kind])
+        else:
+            column = self._columns[key].astype(_DTYPES[kind])
+        self._columns[key] = column
+        self._kinds[key] = kind
+
+    def _write(self, key: str, start: int, end: int, values: List[Any]) -> None:
+        kind = self._kinds[key]
+        if kind == 'datetime' and any(value is not None and value.tzinfo is not None for value in values):
+            # NumPy would drop the timezone
+            self._widen(key, 'object')
+        elif kind == 'datetime':
+            # pandas parses datetime objects much faster than NumPy
+            self._columns[key][start:end] = pd.array(values, dtype=_DTYPES[kind]).to_numpy()
+            return
+        elif kind != 'object':
+            try:
+                self._columns[key][start:end] = np.asarray(values, dtype=_DTYPES[kind])
+                return
+            except (TypeError, ValueError, OverflowError):
+                self._widen(key, 'object')
+        self._columns[key][start:end] = np.fromiter(values, dtype=object, count=end - start)
+
+
+def _plan_summary(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarize the winning plan of an explain() output."""
+    winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    # The slot based engine nests the classic plan under queryPlan
+    plan = winning_plan.get("queryPlan", winning_plan)
+
+    stages = []
+    indexes = []
+    pending = [plan]
+    while pending:
+        stage = pending.pop()
+        stages.append(stage.get("stage"))
+        if "indexName" in stage:
+            indexes.append(stage["indexName"])
+        if "inputStage" in stage:
+            pending.append(stage["inputStage"])
+        pending.extend(stage.get("inputStages", []))
+
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "uses_index": "IXSCAN" in stages and "COLLSCAN" not in stages,
+        # Covered: answered from the index alone, without fetching documents
+        "covered": "IXSCAN" in stages and "COLLSCAN" not in stages and "FETCH" not in stages,
+    }
+
+
+def _load_frame(documents: Iterable[Dict[str, Any]], batch_size: int = _CURSOR_BATCH_SIZE) -> pd.DataFrame:
+    """Consume documents (e.g. a cursor) batch by batch into a DataFrame."""
+    builder = _ColumnarFrameBuilder()
+    documents = iter(documents)
+    while True:
+        batch = list(islice(documents, batch_size))
+        if not batch:
+            break
+        builder.append(batch)
+    return builder.frame()
+
+
 class FleetDatabase:
-    def __init__(self, uri : str = "mongodb://localhost:27017", db_name: str = "fleet_db"):
+    # Query results cache, disabled unless a size is given
+    frame_cache: Optional[FrameCache] = None
+
+    def __init__(self, uri : str = "mongodb://localhost:27017", db_name: str = "fleet_db", cache_size: int = 256 * 2**20):
         self.client = MongoClient(uri)
         self.db = self.client[db_name]
         self.vehicles = self.db['vehicles']
         self.vehicles_variables = self.db['vehicles_variables']
+        if cache_size:
+            self.frame_cache = FrameCache(maxsize=cache_size)
+
+    @property
+    def daily_distance(self):
+        """Collection with the materialized distance per vehicle and closed day."""
+        return self.db['daily_distance']
+
+    @property
+    def daily_distance_state(self):
+        """Collection with the last day materialized for each vehicle."""
+        return self.db['daily_distance_state']
+
+    def ensure_indexes(self) -> List[str]:
+        """Create the indexes the queries rely on, if they do not exist yet.
+
+        Returns the names of the indexes.
+        """
+        by_unit_and_time = [("unit-id", ASCENDING), ("timestamp", ASCENDING)]
+        by_unit_and_day = [("unit-id", ASCENDING), ("date", ASCENDING)]
+        return [
+            self.vehicles.create_index(by_unit_and_time),
+            self.vehicles_variables.create_index(by_unit_and_time),
+            self.daily_distance.create_index(by_unit_and_day, unique=True),
+            self.daily_distance_state.create_index([("unit-id", ASCENDING)], unique=True),
+        ]
+
+    def explain_queries(self) -> Dict[str, Dict[str, Any]]:
+        """Run explain() on the canonical queries and report which ones use an index.
+
+        Each query maps to its plan stages, the indexes used, whether it uses an
+        index without a collection scan and whether it is covered by the index.
+        Only first_timestamp reads indexed fields alone and can be covered, the
+        others are checked for index use.
+        """
+        end_time = datetime.now()
+        start_time = end_time - timedelta(days=1)
+        units_ids = self.get_all_vehicles()[:1]
+        query = self._build_query(units_ids, start_time, end_time)
+        day_query = {"unit-id": {"$in": units_ids}, "date": {"$gte": start_time, "$lte": end_time}}
+
+        # Explained with the projections get_vehicle_data sends, the plans the app actually gets
+        cursors = {
+            "vehicles": self.vehicles.find(query, self._projection(_EXPLAIN_FIELDS["vehicles"])),
+            "vehicles_variables": self.vehicles_variables.find(query, self._projection(_EXPLAIN_FIELDS["vehicles_variables"])),
+            "first_timestamp": self.vehicles.find({"unit-id": {"$in": units_ids}}, {"_id": 0, "timestamp": 1}).sort("timestamp", 1).limit(1),
+            "daily_distance": self.daily_distance.find(day_query),
+            "daily_distance_state": self.daily_distance_state.find({"unit-id": {"$in": units_ids}}),
+        }
+        return {name: _plan_summary(cursor.explain()) for name, cursor in cursors.items()}
 
     def get_all_vehicles(self) -> List[str]:
         """Return all the vehicles IDs from the database."""
         return self.vehicles.distinct("unit-id")
 
-    def get_vehicle_data(self, units_ids: List[str], start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, is_distance: bool = False) -> pd.DataFrame:
-        """Retrieve data for the specified vehicles within the given time range."""
-        query = {"unit-id": {"$in": units_ids}}
+    def get_vehicle_data(self, units_ids: List[str], start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, is_distance: bool = False, fields: Optional[List[str]] = None) -> pd.DataFrame:
+        """Retrieve data for the specified vehicles within the given time range.
 
-        if start_time and end_time:
-            query["timestamp"] = {"$gte": start_time, "$lte": end_time}
-        elif start_time:
-            query["timestamp"] = {"$gte": start_time}
-        elif end_time:
-            query["timestamp"] = {"$lte": end_time}
+        If fields is given only those fields, plus unit-id and timestamp, are read from the database.
+        Timezone-aware bounds are converted to UTC, the naive timestamps the database returns.
+        """
+        start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+        if self.frame_cache is None:
+            return self._query_vehicle_data(units_ids, start_time, end_time, is_distance, fields)
 
-        if is_distance:
-            vehicles_data = self.vehicles.find(query)
-        else:
-            vehicles_data = self.vehicles_variables.find(query)
-        data = list(vehicles_data)
+        key = (is_distance, tuple(sorted(units_ids)), None if fields is None else tuple(sorted(fields)))
+        return self.frame_cache.get(
+            key, start_time, end_time,
+            lambda start, end: self._query_vehicle_data(units_ids, start, end, is_distance, fields)
+        )
+
+    def get_daily_stats(self, units_ids: List[str], fields: List[str], start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, is_distance: bool = False) -> pd.DataFrame:
+        """Compute count, mean, min and max of each field per vehicle and day in the database.
+
+        Returns one row per unit-id and date with the columns <field>_count, <field>_mean,
+        <field>_min and <field>_max.
+        """
+        group = {
+            "_id": {
+                "unit-id": "$unit-id",
+                "date": {"$dateTrunc": {"date": "$timestamp", "unit": "day"}},
+            }
+        }
+        for field in fields:
+            group[f"{field}_count"] = {"$sum": {"$cond": [{"$isNumber": f"${field}"}, 1, 0]}}
+            group[f"{field}_mean"] = {"$avg": f"${field}"}
+            group[f"{field}_min"] = {"$min": f"${field}"}
+            group[f"{field}_max"] = {"$max": f"${field}"}
+
+        pipeline = [
+            {"$match": self._build_query(units_ids, start_time, end_time)},
+            {"$group": group},
+            {"$sort": {"_id.unit-id": 1, "_id.date": 1}},
+        ]
+        collection = self.vehicles if is_distance else self.vehicles_variables
+        data = list(collection.aggregate(pipeline))
 
         if not data:
             return pd.DataFrame()
-        
-        vehicles_df = pd.DataFrame(data)
-        vehicles_df['timestamp'] = pd.to_datetime(vehicles_df['timestamp'])
-        return vehicles_df
-    
+
+        stats_df = pd.DataFrame(data)
+        keys = pd.DataFrame(stats_df.pop("_id").tolist())
+        stats_df.insert(0, "unit-id", keys["unit-id"])
+        stats_df.insert(1, "date", pd.to_datetime(keys["date"]).dt.date)
+        return stats_df
+
+    def get_first_timestamp(self, units_ids: List[str], is_distance: bool = True) -> Optional[datetime]:
+        """Return the oldest timestamp stored for the specified vehicles."""
+        collection = self.vehicles if is_distance else self.vehicles_variables
+        first = list(collection.find({"unit-id": {"$in": units_ids}}, {"_id": 0, "timestamp": 1}).sort("timestamp", 1).limit(1))
+        if not first:
+            return None
+        return pd.Timestamp(first[0]["timestamp"]).to_pydatetime()
+
+    def get_daily_distance(self, units_ids: List[str], first_day: Optional[date] = None, last_day: Optional[date] = None) -> pd.DataFrame:
+        """Read the materialized daily distance of the specified vehicles between two days (inclusive)."""
+        query = {"unit-id": {"$in": units_ids}}
+        day_range = {}
+        if first_day is not None:
+            day_range["$gte"] = datetime.combine(first_day, time.min)
+        if last_day is not None:
+            day_range["$lte"] = datetime.combine(last_day, time.min)
+        if day_range:
+            query["date"] = day_range
+
+        data = list(self.daily_distance.find(query, {"_id": 0, "unit-id": 1, "date": 1, "distance_km": 1}))
+        if not data:
+            return pd.DataFrame()
+
+        distance_df = pd.DataFrame(data, columns=["unit-id", "date", "distance_km"])
+        distance_df["date"] = pd.to_datetime(distance_df["date"]).dt.date
+        return distance_df
+
+    def save_daily_distance(self, units_ids: List[str], first_day: date, last_day: date, daily_distance: pd.DataFrame) -> None:
+        """Replace the materialized daily distance of the specified vehicles between two days (inclusive)."""
+        self.daily_distance.delete_many({
+            "unit-id": {"$in": units_ids},
+            "date": {"$gte": datetime.combine(first_day, time.min), "$lte": datetime.combine(last_day, time.min)},
+        })
+        if daily_distance.empty:
+            return
+        self.daily_distance.insert_many([
+            {"unit-id": unit_id, "date": datetime.combine(day, time.min), "distance_km": float(distance)}
+            for unit_id, day, distance in daily_distance[["unit-id", "date", "distance_km"]].itertuples(index=False)
+        ])
+
+    def get_rollup_watermarks(self, units_ids: List[str]) -> Dict[str, date]:
+        """Return, for each vehicle with materialized days, the last day materialized."""
+        return {unit_id: closed_through for unit_id, (_, closed_through) in self.get_rollup_ranges(units_ids).items()}
+
+    def get_rollup_ranges(self, units_ids: List[str]) -> Dict[str, Tuple[Optional[date], date]]:
+        """Return, for each vehicle with materialized days, the first and last days materialized.
+
+        The first day is None when it was not recorded (every day up to the last one is materialized).
+        """
+        states = self.daily_distance_state.find({"unit-id": {"$in": units_ids}}, {"_id": 0})
+        return {
+            state["unit-id"]: (state["first_day"].date() if state.get("first_day") is not None else None,
+                               state["closed_through"].date())
+            for state in states
+        }
+
+    def set_rollup_watermarks(self, units_ids: List[str], closed_through: date, first_day: Optional[date] = None) -> None:
+        """Record that the daily distance of the vehicles is materialized from first_day up to closed_through."""
+        if not units_ids:
+            return
+        self.daily_distance_state.delete_many({"unit-id": {"$in": units_ids}})
+        self.daily_distance_state.insert_many([
+            {"unit-id": unit_id, "closed_through": datetime.combine(closed_through, time.min),
+             "first_day": datetime.combine(first_day, time.min) if first_day is not None else None}
+            for unit_id in units_ids
+        ])
+
+    def clear_daily_distance(self, units_ids: List[str]) -> None:
+        """Drop the materialized daily distance of the specified vehicles."""
+        self.daily_distance_state.delete_many({"unit-id": {"$in": units_ids}})
+        self.daily_distance.delete_many({"unit-id": {"$in": units_ids}})
+
     def get_range_data(self, unit_ids: List[str], start_date: str, end_date: str) -> pd.DataFrame:
         """Get data for vehicles within a specific date range."""
         start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
         end_datetime = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59, second=59)
 
         return self.get_vehicle_data(unit_ids, start_datetime, end_datetime)
+
+    def _query_vehicle_data(self, units_ids: List[str], start_time: Optional[datetime], end_time: Optional[datetime], is_distance: bool, fields: Optional[List[str]]) -> pd.DataFrame:
+        """Run the query of get_vehicle_data against the database."""
+        query = self._build_query(units_ids, start_time, end_time)
+
+        projection = self._projection(fields) if fields is not None else None
+        if is_distance:
+            vehicles_data = self.vehicles.find(query, projection)
+        else:
+            vehicles_data = self.vehicles_variables.find(query, projection)
+        vehicles_df = _load_frame(vehicles_data.batch_size(_CURSOR_BATCH_SIZE))
+
+        if vehicles_df.empty:
+            return pd.DataFrame()
+
+        vehicles_df['timestamp'] = pd.to_datetime(vehicles_df['timestamp'])
+        return vehicles_df
+
+    @staticmethod
+    def _projection(fields: List[str]) -> Dict[str, int]:
+        """Projection of get_vehicle_data reading only fields, plus unit-id and timestamp."""
+        projection = {"_id": 0, "unit-id": 1, "timestamp": 1}
+        projection.update({field: 1 for field in fields})
+        return projection
+
+    def _build_query(self, units_ids: List[str], start_time: Optional[datetime], end_time: Optional[datetime]) -> Dict[str, Any]:
+        """Build the filter on unit-id and timestamp range shared by the queries."""
+        query = {"unit-id": {"$in": units_ids}}
+
+        if start_time and end_time:
+            query["timestamp"] = {"$gte": start_time, "$lte": end_time}
+        elif start_time:
+            query["timestamp"] = {"$gte": start_time}
+        elif end_time:
+            query["timestamp"] = {"$lte": end_time}
+
+        return query
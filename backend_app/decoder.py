@@ -0,0 +1,111 @@
+"""
+Decoding of the GPS messages of the unit topics.
+
+Validating every message against the JSON schema costs more than anything
+else on the streaming path, and the producers are our own units. The
+decode mode trades that validation for throughput:
+
+    strict   validate every message with the schema registry JSONDeserializer
+    fast     strip the schema registry header and parse the JSON, no validation
+    sampled  fast, but validate one message in sample_every
+
+The mode applies to the trusted topics, all of them unless a set of topics
+is given; the other topics are always decoded strictly. Messages that fail
+to decode or validate are dropped and counted in the stats.
+"""
+import json
+from threading import Lock
+from typing import Any, Dict, Iterable, Optional
+
+from confluent_kafka.serialization import MessageField, SerializationContext, SerializationError
+from confluent_kafka.schema_registry.json_schema import JSONDeserializer
+
+from .schema import gps_data_schema_str
+from .schemas_objects import GPSData, dict_to_gpsdata
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - depends on the environment
+    _loads = json.loads
+
+DECODE_MODES = ('strict', 'fast', 'sampled')
+
+# Schema registry framing: a zero magic byte and the 4 byte schema id precede the payload
+_MAGIC_BYTE = 0
+_HEADER_SIZE = 5
+
+
+class PositionDecoder:
+    """Decodes unit topic messages to GPSData in one of DECODE_MODES.
+
+    Args:
+        mode: Decode mode of the trusted topics.
+        sample_every: Messages per validated message in the sampled mode.
+        trusted_topics: Topics decoded in mode, None trusts every topic.
+    """
+
+    def __init__(self, mode: str = 'strict', sample_every: int = 100, trusted_topics: Optional[Iterable[str]] = None):
+        if mode not in DECODE_MODES:
+            raise ValueError(f"Unknown decode mode '{mode}', expected one of {', '.join(DECODE_MODES)}")
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1")
+        self.mode = mode
+        self.sample_every = sample_every
+        self.trusted_topics = None if trusted_topics is None else frozenset(trusted_topics)
+        self._deserializer = JSONDeserializer(gps_data_schema_str, from_dict=dict_to_gpsdata)
+        self._lock = Lock()
+        self._counts = dict.fromkeys(('decoded', 'validated', 'validation_failures', 'malformed'), 0)
+        # Messages seen in the sampled mode, counted when the message is picked so
+        # that concurrent decodes still validate exactly one in sample_every
+        self._sampled = 0
+
+    def decode(self, message) -> Optional[GPSData]:
+        """GPSData of the message, None if it is malformed or fails validation."""
+        topic = message.topic()
+        mode = self.mode if self.trusted_topics is None or topic in self.trusted_topics else 'strict'
+        if mode == 'sampled':
+            with self._lock:
+                seen = self._sampled
+                self._sampled += 1
+            mode = 'strict' if seen % self.sample_every == 0 else 'fast'
+
+        if mode == 'strict':
+            return self._validate(message.value(), topic)
+        return self._parse(message.value())
+
+    def stats(self) -> Dict[str, Any]:
+        """Decode counters: messages decoded, validated, failing validation and malformed."""
+        with self._lock:
+            return dict(self._counts, mode=self.mode, sample_every=self.sample_every)
+
+    def _validate(self, value: bytes, topic: str) -> Optional[GPSData]:
+        try:
+            data = self._deserializer(value, SerializationContext(topic, MessageField.VALUE))
+        except SerializationError:
+            self._count('validation_failures')
+            return None
+        except (ValueError, KeyError, TypeError):
+            self._count('malformed')
+            return None
+        if data is None:
+            self._count('malformed')
+            return None
+        self._count('validated', 'decoded')
+        return data
+
+    def _parse(self, value: bytes) -> Optional[GPSData]:
+        try:
+            if value[0] != _MAGIC_BYTE:
+                raise ValueError("Not a schema registry message")
+            data = dict_to_gpsdata(_loads(value[_HEADER_SIZE:]), None)
+        except (ValueError, KeyError, TypeError, IndexError):
+            self._count('malformed')
+            return None
+        self._count('decoded')
+        return data
+
+    def _count(self, *names: str) -> None:
+        with self._lock:
+            for name in names:
+                self._counts[name] += 1
@@ -1,95 +1,118 @@
 import json
-from threading import Event, Lock
+import os
+import socket
+from collections import defaultdict
 
-from typing import Dict
+from typing import Any, Dict, Optional
 
 # Flask
-from flask import session
-from flask_socketio import emit, send
+from flask import request
+from flask_socketio import emit, join_room, leave_room, rooms
 
 # Kafka
-from confluent_kafka import Consumer, KafkaException
-from confluent_kafka.serialization import SerializationContext, MessageField
-from confluent_kafka.schema_registry.json_schema import JSONDeserializer
+from confluent_kafka import Consumer
 
-from .schemas_objects import GPSData, dict_to_gpsdata, gpsdata_to_dict
-from .schema import gps_data_schema_str
-from .config import config
-from .utils import is_valid_uuid
+from .schemas_objects import GPSData, gpsdata_moved, gpsdata_to_json
+from .config import config, decode_config, ingest_config, stream_config
+from .decoder import PositionDecoder
+from .ingest import PositionListener
+from .spatial import SpatialIndex, Viewports, parse_bbox
+from .stream import CoalescingEmitter, GPSStream, PositionStore
 
 from . import socketio
 
-consumer = None
-thread = None
-thread_stop_event = Event()
-thread_lock = Lock()
 
-def set_consumer_config():
-    config['group.id'] = 'gps_group'
-    config['auto.offset.reset'] = 'latest'
+def consumer_config() -> Dict[str, Any]:
+    """Kafka config of the stream consumer.
 
-
-def send_coordinate_data(event: Event) -> None:
+    Every web process must receive every unit, so each one consumes in a
+    group of its own instead of sharing the partitions with the others.
     """
-    Will continously send data to the client in the background
+    return dict(config, **{
+        'group.id': f'gps_group-{socket.gethostname()}-{os.getpid()}',
+        'auto.offset.reset': 'latest',
+        'enable.auto.commit': False,
+    })
+
+
+# Minimum age in seconds of the cached unit topics before an unknown unit lists them again
+TOPICS_RECHECK = 5.0
+
+decoder = PositionDecoder(**decode_config)
+
+
+def deserialize_position(message) -> Optional[GPSData]:
+    return decoder.decode(message)
+
+
+def decode_stats() -> Dict[str, Any]:
+    """Decode counters of the configured source: this process' decoder, or the ingestion workers' ones."""
+    if stream_config['source'] == 'ingest':
+        return listener.stats()
+    return decoder.stats()
+
 
-    :param event: threading event to stop the thread
+# The 'gps data' event is {'status': 200, 'code': 'new data', 'units': [position, ...]}
+_GPS_DATA_PREFIX = '{"status": 200, "code": "new data", "units": ['
+_GPS_DATA_SUFFIX = ']}'
+
+
+def gps_data_event(*positions: GPSData) -> str:
+    """JSON of the 'gps data' event of the positions, encoded straight from the GPSData."""
+    return _GPS_DATA_PREFIX + ', '.join(gpsdata_to_json(position) for position in positions) + _GPS_DATA_SUFFIX
+
+
+# Clients subscribed with a bounding box, by session id
+viewports = Viewports()
+
+
+def emit_positions(positions: Dict[str, GPSData]) -> None:
+    """Send each client the positions of the units it subscribed to, or inside its bounding box.
+
+    A client receives a single 'gps data' event with all of its positions.
     """
-    global consumer
-    json_deserializer = JSONDeserializer(gps_data_schema_str, from_dict=dict_to_gpsdata)
-
-    topics_data = dict()
-    topics_set = set()
-    # Getting data from kafka
-    while event.is_set():
-        # Number of topics might change with time
-        topics = consumer.list_topics()
-        for topic in topics.topics.keys():
-            if topic not in topics_set and is_valid_uuid(topic):
-                topics_set.add(topic)
-                topics_data[topic] = None
-        num_topics = len(topics_set)
-        try:
-            # Try to get one message per topic
-            events = consumer.consume(num_messages=num_topics, timeout=1)
-            if len(events) == 0:
-                continue
-            messages_list = []
-            for evt in events:
-                data = json_deserializer(evt.value(), SerializationContext(evt.topic(), MessageField.VALUE))
-                if data is not None:
-                    # Store the latest message per topic
-                    topics_data[evt.topic()] = data
-            # Prepare the data to be sent to client
-            for topic in topics_set:
-                data = topics_data[topic]
-                if data is not None:
-                    messages_list.append(gpsdata_to_dict(data, None))
-            data = {
-                'status': 200,
-                'code': 'new data',
-                'units': messages_list
-            }
-            json_str = json.dumps(data)
-            socketio.emit('gps data', json_str)
-        except Exception as e:
-            pass
+    clients = defaultdict(dict)
+    manager = socketio.server.manager
+    for unit, position in positions.items():
+        for client, _ in manager.get_participants('/', unit):
+            clients[client][unit] = position
+        if len(viewports):
+            for client in viewports.containing(position.latitude, position.longitude):
+                clients[client][unit] = position
+    for client, client_positions in clients.items():
+        socketio.emit('gps data', gps_data_event(*client_positions.values()), to=client)
+
+
+emitter = CoalescingEmitter(emit_positions, stream_config['tick_hz'], stream_config['keyframe_every'], gpsdata_moved)
+store = PositionStore()
+index = SpatialIndex()
+
+
+def publish_position(unit: str, position: GPSData) -> None:
+    """Record the consumed position and queue it for the subscribers of the unit."""
+    store.update(unit, position)
+    index.update(unit, position.latitude, position.longitude)
+    emitter.update(unit, position)
+
+
+stream = GPSStream(lambda: Consumer(consumer_config()), deserialize_position, publish_position)
+# With the standalone ingestion the stream only lists the unit topics
+listener = PositionListener(ingest_config['addresses'], publish_position)
+
+
+def start_positions() -> None:
+    """Start sending positions, from the configured stream_config['source']."""
+    emitter.start(socketio.start_background_task)
+    if stream_config['source'] == 'ingest':
+        listener.start(socketio.start_background_task)
+    else:
+        stream.start(socketio.start_background_task)
 
 
 @socketio.on('connect')
 def connect(auth):
-    # Connect to kafka but don't subscribe to any topic
-    set_consumer_config()
-    global consumer
-    global thread
-    global thread_stop_event
-    consumer = Consumer(config)
     # Get the topics name from the map
-    topics = consumer.list_topics()
-    topics_list = []
-    for topic in topics.topics.keys():
-        if is_valid_uuid(topic):
-            topics_list.append({'unit': topic})
+    topics_list = [{'unit': unit} for unit in stream.list_units()]
     data = {
         'status': 200,
         'code': 'available units',
@@ -99,34 +122,43 @@ def connect(auth):
     # Send to client
     emit('units', {'data': json_str})
 
-    # Start background task for gps data
-    with thread_lock:
-        if thread is None:
-            thread_stop_event.set()
-            thread = socketio.start_background_task(send_coordinate_data, thread_stop_event)
+    # The stream is shared by every client, the first one starts it
+    start_positions()
 
 
 @socketio.on('subscribe')
 def subscribe(_json):
-    global consumer
-    # Get the list of topics to subscribe
+    # Get the list of topics to subscribe, and the bounding box of the units to receive
     data = json.loads(_json)
-    if len(data['units']) == 0:
+    units = data.get('units', [])
+    bbox = None
+    if data.get('bbox') is not None:
+        try:
+            bbox = parse_bbox(data['bbox'])
+        except ValueError as error:
+            err_obj = {
+                'status': 400,
+                'code': 'invalid bounding box',
+                'message': str(error)
+            }
+            emit('error', json.dumps(err_obj))
+            return
+    if len(units) == 0 and bbox is None:
         err_obj = {
             'status': 400,
             'code': 'empty list of units'
         }
         json_str = json.dumps(err_obj)
         emit('error', json_str)
+        return
 
-    # Validate topics
-    topics_list = consumer.list_topics()
-    topics = set()
-    for topic in topics_list.topics.keys():
-        topics.add(topic)
+    # Validate topics, listing them again if a unit is not known yet (its topic may be new)
+    topics = set(stream.list_units())
+    if not topics.issuperset(units):
+        topics = set(stream.list_units(max_age=TOPICS_RECHECK))
     invalid_topics = []
     valid_topics = []
-    for unit in data['units']:
+    for unit in units:
         if unit not in topics:
             invalid_topics.append(unit)
         else:
@@ -138,27 +170,28 @@ def subscribe(_json):
             'units': invalid_topics
         }
         emit('error', json.dumps(err_obj))
-    try:
-        consumer.subscribe(valid_topics)
-        err_obj = {
-            'status': 200,
-            'code': 'subscribed'
-        }
-        emit('error', json.dumps(err_obj))
-    except KafkaException:
-        # Handle case
-        pass
+
+    # A subscription replaces the previous one, the client's rooms are its units
+    for room in rooms():
+        if room != request.sid and room not in valid_topics:
+            leave_room(room)
+    for unit in valid_topics:
+        join_room(unit)
+    viewports.set(request.sid, bbox)
+    err_obj = {
+        'status': 200,
+        'code': 'subscribed'
+    }
+    emit('error', json.dumps(err_obj))
+
+    # Send the known positions right away instead of waiting for the units to move
+    if bbox is not None:
+        valid_topics = list(dict.fromkeys(valid_topics + index.within_bbox(bbox)))
+    snapshot = store.snapshot(valid_topics)
+    if snapshot:
+        emit('gps data', gps_data_event(*snapshot.values()))
 
 
 @socketio.on('disconnect')
-def disconnect():
-    global consumer
-    global thread
-    global thread_stop_event
-    thread_stop_event.clear()
-    with thread_lock:
-        if thread is not None:
-            thread.join()
-            thread = None
-    # Close connection to kafka
-    consumer.close()
+def disconnect(reason=None):
+    viewports.set(request.sid, None)
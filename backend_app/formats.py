@@ -0,0 +1,70 @@
+"""
+Data formats the plot endpoints can answer with instead of a PNG.
+
+json returns the plot data as a mapping of column name to list of values,
+arrow returns it as a base64 encoded Arrow IPC stream (requires pyarrow).
+"""
+import base64
+import importlib.util
+import math
+from datetime import date
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+FORMATS = ('png', 'json', 'arrow')
+
+
+def check_format(fmt: str) -> Optional[str]:
+    """Error message if fmt cannot be served, None otherwise."""
+    if fmt not in FORMATS:
+        return f"Unsupported format '{fmt}', expected one of {', '.join(FORMATS)}."
+    if fmt == 'arrow' and importlib.util.find_spec('pyarrow') is None:
+        return "The arrow format is not available, pyarrow is not installed."
+    return None
+
+
+def encode_frame(frame: 'pd.DataFrame', fmt: str) -> Union[str, Dict[str, List[Any]]]:
+    """Encode the plot data in a data format, "" if there is no data."""
+    if frame.empty:
+        return ""
+    if fmt == 'json':
+        return to_columns(frame)
+    if fmt == 'arrow':
+        return to_arrow(frame)
+    raise ValueError(f"Not a data format: {fmt}")
+
+
+def to_columns(frame: 'pd.DataFrame') -> Dict[str, List[Any]]:
+    """Columns as JSON serializable lists, dates in ISO format and missing values as None."""
+    return {str(name): [_json_value(value) for value in series.tolist()] for name, series in frame.items()}
+
+
+def to_arrow(frame: 'pd.DataFrame') -> str:
+    """Frame as a base64 encoded Arrow IPC stream."""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return base64.b64encode(sink.getvalue().to_pybytes()).decode()
+
+
+def _json_value(value: Any) -> Any:
+    import pandas as pd
+
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_json_value(item) for item in value]
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
@@ -0,0 +1,297 @@
+"""
+Kafka ingestion in worker processes, out of the web process.
+
+The workers (python ingest.py) consume the unit topics in one consumer
+group, so Kafka spreads the partitions across them, and decode the
+messages. Each unit topic has a single partition: the range assignor would
+give partition 0 of every topic to the same worker, the cooperative sticky
+one spreads the topics across the workers. Each worker sends the latest
+position of the units it read to the web processes as UDP datagrams on the
+local host, where PositionListener hands them to the same emitter the
+in-process stream feeds.
+
+Every web process serves clients subscribed to any unit, so each one needs
+every position: ingest_config['addresses'] lists one address per web
+process, the workers send each datagram to all of them and each web process
+listens on the first one no other process holds. Consumption then scales with the number of cores
+and does not compete with the HTTP requests for the web process' GIL.
+
+A datagram holds newline separated lines of the topic the position was
+read from, a space and the position JSON, see gpsdata_to_json. The web
+process publishes each position under its topic, like the in-process
+stream, not under the uuid of the payload. Positions are superseded by the
+next ones, so a lost datagram only delays a unit until its next update or
+keyframe. Every STATS_INTERVAL seconds each worker also sends the counters
+of its decoder in a datagram starting with STATS_PREFIX. The listener keeps
+the latest report of each worker index, so a restarted worker replaces the
+counters of the one it took over from, and drops the reports of workers
+silent for STATS_TTL seconds.
+"""
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config import config, decode_config, ingest_config
+from .decoder import PositionDecoder, _loads
+from .schemas_objects import GPSData, dict_to_gpsdata, gpsdata_to_json
+from .stream import UNIT_TOPICS, _start_thread, drain_latest
+
+Address = Tuple[str, int]
+
+# Stays under the 65507 bytes a UDP datagram can carry
+MAX_DATAGRAM = 60000
+
+# Decoder counters of a worker: the prefix followed by the JSON of PositionDecoder.stats() and its index
+STATS_PREFIX = b'#stats '
+STATS_INTERVAL = 1.0
+# Reports older than this are from workers that stopped
+STATS_TTL = 5 * STATS_INTERVAL
+
+# Counters of PositionDecoder.stats() summed across the workers
+_STATS_COUNTERS = ('decoded', 'validated', 'validation_failures', 'malformed')
+
+
+def ingest_consumer_config(group_id: str) -> Dict[str, Any]:
+    """Kafka config of the ingestion workers, which share the partitions of group_id."""
+    return dict(config, **{
+        'group.id': group_id,
+        'auto.offset.reset': 'latest',
+        'enable.auto.commit': False,
+        # Spreads the single partition topics across the workers
+        'partition.assignment.strategy': 'cooperative-sticky',
+    })
+
+
+def encode_datagrams(positions: Iterable[Tuple[str, GPSData]], max_size: int = MAX_DATAGRAM) -> Iterator[bytes]:
+    """Pack the (topic, position) pairs into as few datagrams of at most max_size bytes as possible."""
+    lines = []
+    size = 0
+    for topic, position in positions:
+        line = topic.encode() + b' ' + gpsdata_to_json(position).encode()
+        if lines and size + len(line) + 1 > max_size:
+            yield b'\n'.join(lines)
+            lines = []
+            size = 0
+        lines.append(line)
+        size += len(line) + 1
+    if lines:
+        yield b'\n'.join(lines)
+
+
+def decode_datagram(datagram: bytes) -> List[Tuple[str, GPSData]]:
+    """(topic, position) pairs of a datagram built by encode_datagrams."""
+    positions = []
+    for line in datagram.split(b'\n'):
+        if not line:
+            continue
+        topic, _, payload = line.partition(b' ')
+        if not topic or not payload:
+            raise ValueError("A position line is the topic, a space and the position JSON")
+        positions.append((topic.decode(), dict_to_gpsdata(_loads(payload), None)))
+    return positions
+
+
+def encode_stats(stats: Dict[str, Any], worker: int) -> bytes:
+    """Stats datagram of the decoder counters of the worker with that index."""
+    return STATS_PREFIX + json.dumps(dict(stats, worker=worker)).encode()
+
+
+def forward(consumer, decoder: PositionDecoder, send: Callable[[bytes], None], max_messages: int = 1000,
+            time_budget: float = 0.05, timeout: float = 1.0) -> int:
+    """Drain the consumer and send the latest position of each unit, returns the number sent."""
+    positions = []
+    for topic, message in drain_latest(consumer, max_messages, time_budget, timeout).items():
+        position = decoder.decode(message)
+        if position is not None:
+            positions.append((topic, position))
+    for datagram in encode_datagrams(positions):
+        send(datagram)
+    return len(positions)
+
+
+def _send_all(sock: socket.socket, addresses: List[Address]) -> Callable[[bytes], None]:
+    """Send function of a worker, which fans each datagram out to every web process."""
+    def send(datagram: bytes) -> None:
+        for address in addresses:
+            try:
+                sock.sendto(datagram, address)
+            except OSError:
+                # A web process that is not listening must not stop the others' updates
+                pass
+    return send
+
+
+def run_worker(addresses: List[Address], group_id: str, decode: Dict[str, Any], stop: Optional[Any] = None,
+               index: int = 0) -> None:
+    """Consume and forward until stop is set, the body of the ingestion process with that index."""
+    # Imported here, the web process only needs the listener side
+    from confluent_kafka import Consumer
+
+    consumer = Consumer(ingest_consumer_config(group_id))
+    consumer.subscribe([UNIT_TOPICS])
+    decoder = PositionDecoder(**decode)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    send = _send_all(sock, addresses)
+    next_stats = time.monotonic()
+    try:
+        while stop is None or not stop.is_set():
+            forward(consumer, decoder, send)
+            if time.monotonic() >= next_stats:
+                send(encode_stats(decoder.stats(), index))
+                next_stats = time.monotonic() + STATS_INTERVAL
+    except KeyboardInterrupt:
+        pass
+    finally:
+        consumer.close()
+        sock.close()
+
+
+def run(workers: Optional[int] = None, addresses: Optional[List[Address]] = None, group_id: Optional[str] = None,
+        decode: Optional[Dict[str, Any]] = None) -> None:
+    """Run the ingestion workers until interrupted, restarting those that die.
+
+    Args:
+        workers (int): Worker processes, one per CPU if None. Kafka spreads the
+            unit topics across them, workers beyond the number of units stay idle.
+        addresses (List[(str, int)]): Where the web processes listen, one
+            address per process, see PositionListener.
+        group_id (str): Consumer group of the workers.
+        decode (Dict[str, Any]): PositionDecoder arguments, see config.decode_config.
+    """
+    workers = workers or ingest_config['workers'] or os.cpu_count() or 1
+    addresses = [tuple(address) for address in addresses or ingest_config['addresses']]
+    group_id = group_id or ingest_config['group.id']
+    decode = decode if decode is not None else decode_config
+
+    context = multiprocessing.get_context('spawn')
+    stop = context.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    def start(index: int):
+        process = context.Process(target=run_worker, args=(addresses, group_id, decode, stop, index),
+                                  name=f'ingest-{index}')
+        process.start()
+        return process
+
+    processes = [start(index) for index in range(workers)]
+    try:
+        while not stop.is_set():
+            for index, process in enumerate(processes):
+                process.join(timeout=1.0 / workers)
+                if not process.is_alive() and not stop.is_set():
+                    processes[index] = start(index)
+    except KeyboardInterrupt:
+        stop.set()
+    for process in processes:
+        process.join()
+
+
+class PositionListener:
+    """Receives the positions sent by the ingestion workers and publishes them.
+
+    Args:
+        addresses: Local addresses the workers send to. The listener binds the
+            first one free, each web process gets its own.
+        publish: Called with the unit id (the topic) and its position, like GPSStream's.
+        timeout: Seconds a receive waits before checking whether to stop.
+    """
+
+    def __init__(self, addresses: Iterable[Address], publish: Callable[[str, GPSData], None], timeout: float = 1.0):
+        self.addresses = [tuple(address) for address in addresses]
+        # The address bound, once started
+        self.address = None
+        self.publish = publish
+        self.timeout = timeout
+        self.socket = None
+        # (time received, latest decoder counters) of each worker, by index
+        self._worker_stats = {}
+        self._thread = None
+        self._running = Event()
+        self._lock = Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._running.is_set()
+
+    def start(self, start_task: Callable[[Callable[[], None]], Any] = _start_thread) -> None:
+        """Bind the socket and start receiving, unless already started.
+
+        Raises:
+            OSError: If every address is in use, there are more web processes
+                than ingest_config['addresses'].
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.socket = self._bind()
+            self.address = self.socket.getsockname()
+            self.socket.settimeout(self.timeout)
+            self._running.set()
+            self._thread = start_task(self._run)
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._running.clear()
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            if self.socket is not None and self._thread is None:
+                self.socket.close()
+                self.socket = None
+                self.address = None
+
+    def _bind(self) -> socket.socket:
+        for address in self.addresses:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.bind(address)
+            except OSError:
+                # Taken by another web process
+                sock.close()
+                continue
+            return sock
+        raise OSError(f"No free address to receive the ingested positions on, all of {self.addresses} are in use")
+
+    def stats(self) -> Dict[str, Any]:
+        """Decoder counters summed across the workers, as PositionDecoder.stats() with the number of workers."""
+        expired = time.monotonic() - STATS_TTL
+        with self._lock:
+            for worker in [worker for worker, (received, _) in self._worker_stats.items() if received < expired]:
+                del self._worker_stats[worker]
+            reports = [report for _, report in sorted(self._worker_stats.values(), key=lambda item: item[0])]
+        stats = {counter: sum(report.get(counter, 0) for report in reports) for counter in _STATS_COUNTERS}
+        latest = reports[-1] if reports else {}
+        return dict(stats, mode=latest.get('mode'), sample_every=latest.get('sample_every'), workers=len(reports))
+
+    def receive(self) -> int:
+        """Receive a datagram and publish its positions, returns the number published."""
+        datagram = self.socket.recv(65535)
+        try:
+            if datagram.startswith(STATS_PREFIX):
+                report = _loads(datagram[len(STATS_PREFIX):])
+                with self._lock:
+                    self._worker_stats[report['worker']] = (time.monotonic(), report)
+                return 0
+            positions = decode_datagram(datagram)
+        except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+            return 0
+        for topic, position in positions:
+            self.publish(topic, position)
+        return len(positions)
+
+    def _run(self) -> None:
+        while self._running.is_set():
+            try:
+                self.receive()
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._running.is_set():
+                    continue
+                break
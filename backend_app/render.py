@@ -0,0 +1,221 @@
+"""
+Rendering of plot specs to base64 PNG images.
+
+A spec is a plain dict with a kind and the arrays and labels to draw, so it
+can be sent to another process. PlotRenderer renders specs in a pool of
+worker processes: rendering is CPU bound, so concurrent requests of the
+threaded server would otherwise run one at a time and a slow plot would
+hold the GIL for the whole server.
+
+Each render draws on its own Figure with an Agg canvas instead of going
+through pyplot, so no figure is registered globally and nothing has to be
+closed: a figure is freed as soon as its render returns.
+
+matplotlib and seaborn are imported on the first render, processes that
+never render (or render in the worker pool) do not pay for them.
+"""
+import base64
+import functools
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+
+def render_png(spec: Dict[str, Any]) -> str:
+    """Render a plot spec to a base64 encoded PNG."""
+    _setup()
+    fig = _RENDERERS[spec['kind']](spec)
+    return _fig_to_base64(fig)
+
+
+@functools.lru_cache(maxsize=None)
+def _setup() -> None:
+    """Import the plotting libraries and apply the style, once per process."""
+    import matplotlib.style
+    import seaborn as sns
+
+    matplotlib.style.use('seaborn-v0_8')
+    sns.set_palette('husl')
+
+
+def _figure(spec: Dict[str, Any], figsize) -> 'Figure':
+    """A figure of its own with an Agg canvas, not registered with pyplot."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=spec.get('figsize', figsize))
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _lines(spec: Dict[str, Any]):
+    fig = _figure(spec, (12, 6))
+    ax = fig.subplots()
+    for series in spec['series']:
+        ax.plot(series['x'], series['y'], marker=spec.get('marker'), label=series['label'], linewidth=2)
+
+    ax.set_title(spec['title'], fontsize=14, fontweight='bold')
+    ax.set_xlabel(spec['xlabel'], fontsize=12)
+    ax.set_ylabel(spec['ylabel'], fontsize=12)
+    ax.legend()
+    ax.grid(True, alpha=0.6)
+
+    fig.tight_layout()
+    return fig
+
+
+def _histograms(spec: Dict[str, Any]):
+    """Side by side histograms of raw values."""
+    fig = _figure(spec, (12, 6))
+    axes = fig.subplots(1, len(spec['panels']))
+    for ax, panel in zip(np.atleast_1d(axes), spec['panels']):
+        ax.hist(panel['values'], bins=panel.get('bins', 20), color=panel['color'], edgecolor='black')
+        ax.set_title(panel['title'], fontsize=12, fontweight='bold')
+        ax.set_xlabel(panel['xlabel'], fontsize=10)
+        ax.set_ylabel(panel['ylabel'], fontsize=10)
+        ax.grid(True, alpha=0.6)
+
+    fig.suptitle(spec['title'], fontsize=14, fontweight='bold')
+
+    fig.tight_layout()
+    return fig
+
+
+def _binned(spec: Dict[str, Any]):
+    """Overlaid histograms from precomputed bin edges and counts."""
+    fig = _figure(spec, (10, 6))
+    ax = fig.subplots()
+    for series in spec['series']:
+        edges = series['edges']
+        ax.hist(edges[:-1], bins=edges, weights=series['counts'], alpha=0.5, label=series['label'])
+
+    ax.set_title(spec['title'], fontsize=14, fontweight='bold')
+    ax.set_xlabel(spec['xlabel'], fontsize=12)
+    ax.set_ylabel(spec['ylabel'], fontsize=12)
+    ax.legend()
+    ax.grid(True, alpha=0.6)
+
+    fig.tight_layout()
+    return fig
+
+
+def _box(spec: Dict[str, Any]):
+    """Box plots from precomputed statistics, see matplotlib.axes.Axes.bxp."""
+    fig = _figure(spec, (10, 6))
+    ax = fig.subplots()
+    ax.bxp(spec['stats'])
+    ax.set_title(spec['title'], fontsize=14, fontweight='bold')
+    ax.set_ylabel(spec['ylabel'], fontsize=12)
+    ax.grid(True, alpha=0.3)
+
+    fig.tight_layout()
+    return fig
+
+
+def _scatter(spec: Dict[str, Any]):
+    import matplotlib
+
+    fig = _figure(spec, (10, 8))
+    ax = fig.subplots()
+    colors = matplotlib.colormaps['Set3'](np.linspace(0, 1, max(len(spec['series']), 1)))
+    for series, color in zip(spec['series'], colors):
+        ax.scatter(series['x'], series['y'], alpha=0.6, label=series['label'], color=color)
+
+    ax.set_title(spec['title'], fontsize=14, fontweight='bold')
+    ax.set_xlabel(spec['xlabel'], fontsize=12)
+    ax.set_ylabel(spec['ylabel'], fontsize=12)
+    ax.legend()
+    ax.grid(True, alpha=0.6)
+
+    fig.tight_layout()
+    return fig
+
+
+def _heatmap(spec: Dict[str, Any]):
+    matrix = np.asarray(spec['matrix'])
+    labels = spec['labels']
+    fig = _figure(spec, (12, 10))
+    ax = fig.subplots()
+    im = ax.imshow(matrix, cmap='coolwarm', aspect='auto', vmin=-1, vmax=1)
+    ax.set_xticks(range(len(labels)))
+    ax.set_yticks(range(len(labels)))
+    ax.set_xticklabels(labels, rotation=45, ha='right')
+    ax.set_yticklabels(labels)
+
+    # Add correlation values
+    for i in range(len(labels)):
+        for j in range(len(labels)):
+            ax.text(j, i, f'{matrix[i, j]:.2f}', ha="center", va="center", color="black", fontweight='bold')
+
+    ax.set_title(spec['title'], fontsize=14, fontweight='bold')
+
+    cbar = fig.colorbar(im, ax=ax)
+    cbar.set_label(spec['colorbar_label'], rotation=270, labelpad=15)
+    fig.tight_layout()
+    return fig
+
+
+_RENDERERS = {
+    'lines': _lines,
+    'histograms': _histograms,
+    'binned': _binned,
+    'box': _box,
+    'scatter': _scatter,
+    'heatmap': _heatmap,
+}
+
+
+def _fig_to_base64(fig: 'Figure') -> str:
+    """Convert a Matplotlib figure to base64-encoded PNG bytes."""
+    image_buffer = io.BytesIO()
+    fig.savefig(image_buffer, format='png', bbox_inches='tight')
+    return base64.b64encode(image_buffer.getvalue()).decode()
+
+
+class PlotRenderer:
+    """Renders plot specs in a pool of worker processes.
+
+    The pool is started on the first render. workers=None starts one worker
+    per CPU, workers=0 renders in the calling thread instead.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self._pool = None
+        self._lock = Lock()
+
+    def render(self, spec: Dict[str, Any]) -> str:
+        """Base64 encoded PNG of the spec."""
+        if self.workers == 0:
+            return render_png(spec)
+
+        pool = self._get_pool()
+        try:
+            return pool.submit(render_png, spec).result()
+        except BrokenProcessPool:
+            # A worker died, start a new pool for the next renders
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Forking a threaded server is unsafe, workers start from a fresh interpreter
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
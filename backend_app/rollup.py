@@ -0,0 +1,175 @@
+"""
+Materialized daily distance per vehicle.
+
+The distance traveled on a closed day never changes, so it is computed once
+from the raw GPS points and stored in the daily_distance collection. Each
+vehicle has a watermark with the first and last days materialized; reads
+take the days in that range from the rollup and only compute the rest (the
+current day, or days before the backfill started) from the raw points.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .db_mongo import FleetDatabase
+from .utils import segment_distances_km, to_naive_utc
+
+# Vehicles and days read from the raw points per query when materializing
+_UNITS_PER_QUERY = 50
+_DAYS_PER_QUERY = 31
+
+# A window ending at or after this time of the day covers the whole day
+_END_OF_DAY = time(23, 59, 59)
+
+_GPS_FIELDS = ['latitude', 'longitude']
+
+
+def daily_distance(vehicles: pd.DataFrame) -> pd.DataFrame:
+    """Reduce GPS points to the distance traveled per vehicle and day.
+
+    Consecutive points are paired only when they belong to the same unit
+    and the same day; segments with missing coordinates count as zero.
+    """
+    columns = ['unit-id', 'timestamp', 'latitude', 'longitude']
+    vehicles = vehicles[columns].sort_values(by=['unit-id', 'timestamp'], kind='mergesort')
+    units = vehicles['unit-id'].to_numpy()
+    dates = vehicles['timestamp'].dt.date.to_numpy()
+    lat = pd.to_numeric(vehicles['latitude'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    lon = pd.to_numeric(vehicles['longitude'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    segments = segment_distances_km(lat, lon)
+
+    # Drop the segments that cross a unit or day boundary
+    same_day = (units[1:] == units[:-1]) & (dates[1:] == dates[:-1])
+    segments = np.where(same_day & ~np.isnan(segments), segments, 0.0)
+
+    distance = np.zeros(len(vehicles))
+    distance[1:] = segments
+    daily = pd.DataFrame({'unit-id': units, 'date': dates, 'distance_km': distance})
+    return daily.groupby(['unit-id', 'date'], sort=True)['distance_km'].sum().reset_index()
+
+
+def read_daily_distance(db: FleetDatabase, units_ids: List[str], start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> pd.DataFrame:
+    """Daily distance of the vehicles in the time window.
+
+    Whole days within each vehicle's materialized range come from the
+    rollup, the remaining time is computed from the raw GPS points. Days
+    are UTC days, timezone-aware bounds are converted to UTC first.
+    """
+    start_date, end_date = to_naive_utc(start_date), to_naive_utc(end_date)
+    frames = []
+    for materialized, units in _group_by_watermark(db, units_ids).items():
+        raw_windows = [(start_date, end_date)]
+        if materialized is not None:
+            first_day, last_day = _full_days(start_date, end_date, *materialized)
+            if first_day is None or first_day <= last_day:
+                frames.append(db.get_daily_distance(units, first_day, last_day))
+                raw_windows = []
+                if first_day is not None and (start_date is None or start_date < _day_start(first_day)):
+                    raw_windows.append((start_date, _day_start(first_day) - timedelta(microseconds=1)))
+                if end_date is None or _day_start(last_day + timedelta(days=1)) <= end_date:
+                    raw_windows.append((_day_start(last_day + timedelta(days=1)), end_date))
+
+        for window_start, window_end in raw_windows:
+            vehicles = db.get_vehicle_data(units, window_start, window_end, True, fields=_GPS_FIELDS)
+            if not vehicles.empty:
+                frames.append(daily_distance(vehicles))
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+
+    result = pd.concat(frames, ignore_index=True)
+    return result.sort_values(by=['unit-id', 'date'], kind='mergesort').reset_index(drop=True)
+
+
+def update_daily_distance(db: FleetDatabase, units_ids: Optional[List[str]] = None, since: Optional[date] = None, until: Optional[date] = None) -> int:
+    """Materialize the closed days that are not in the rollup yet.
+
+    Args:
+        db (FleetDatabase): Database to read the GPS points from and write the rollup to.
+        units_ids (List[str]): Vehicles to update, all of them if None.
+        since (date): First day to materialize for vehicles without a watermark,
+            defaults to the day of their oldest GPS point.
+        until (date): Last day to materialize, defaults to yesterday (UTC).
+
+    Returns:
+        int: Number of (vehicle, day) rows written.
+    """
+    if units_ids is None:
+        units_ids = db.get_all_vehicles()
+    if until is None:
+        until = _today() - timedelta(days=1)
+
+    written = 0
+    for materialized, units in _group_by_watermark(db, units_ids).items():
+        for i in range(0, len(units), _UNITS_PER_QUERY):
+            chunk = units[i:i + _UNITS_PER_QUERY]
+            if materialized is not None:
+                materialized_from, closed_through = materialized
+                first_day = closed_through + timedelta(days=1)
+            elif since is not None:
+                materialized_from = first_day = since
+            else:
+                first_timestamp = db.get_first_timestamp(chunk)
+                if first_timestamp is None:
+                    continue
+                materialized_from = first_day = first_timestamp.date()
+
+            while first_day <= until:
+                last_day = min(first_day + timedelta(days=_DAYS_PER_QUERY - 1), until)
+                vehicles = db.get_vehicle_data(chunk, _day_start(first_day), _day_end(last_day), True, fields=_GPS_FIELDS)
+                distance = daily_distance(vehicles) if not vehicles.empty else pd.DataFrame()
+                db.save_daily_distance(chunk, first_day, last_day, distance)
+                # Advance the watermark per window so an interrupted run resumes where it stopped
+                db.set_rollup_watermarks(chunk, last_day, materialized_from)
+                written += len(distance)
+                first_day = last_day + timedelta(days=1)
+
+    return written
+
+
+def backfill_daily_distance(db: FleetDatabase, units_ids: Optional[List[str]] = None, since: Optional[date] = None, until: Optional[date] = None) -> int:
+    """Rebuild the rollup of the vehicles from scratch, see update_daily_distance."""
+    if units_ids is None:
+        units_ids = db.get_all_vehicles()
+    db.clear_daily_distance(units_ids)
+    return update_daily_distance(db, units_ids, since, until)
+
+
+def _group_by_watermark(db: FleetDatabase, units_ids: List[str]) -> Dict[Optional[Tuple[Optional[date], date]], List[str]]:
+    # Vehicles by (first day, last day) materialized, None for those without a rollup
+    ranges = db.get_rollup_ranges(units_ids)
+    groups = defaultdict(list)
+    for unit_id in units_ids:
+        groups[ranges.get(unit_id)].append(unit_id)
+    return groups
+
+
+def _full_days(start_date: Optional[datetime], end_date: Optional[datetime], materialized_from: Optional[date],
+               closed_through: date) -> Tuple[Optional[date], date]:
+    """First and last materialized days entirely inside the window."""
+    first_day = None
+    if start_date is not None:
+        first_day = start_date.date() if start_date.time() == time.min else start_date.date() + timedelta(days=1)
+    if materialized_from is not None and (first_day is None or first_day < materialized_from):
+        first_day = materialized_from
+    last_day = closed_through
+    if end_date is not None:
+        last_window_day = end_date.date() if end_date.time() >= _END_OF_DAY else end_date.date() - timedelta(days=1)
+        last_day = min(last_day, last_window_day)
+    return first_day, last_day
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _day_end(day: date) -> datetime:
+    return datetime.combine(day, time.max)
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
@@ -2,8 +2,15 @@
 Contains all the oject representations for the schemas,
 along with their dict_to_obj funtion.
 """
+import json
+import math
+from json.encoder import encode_basestring_ascii
+
 
 class GPSData(object):
+    # One per Kafka message, slots keep them small and fast to build
+    __slots__ = ('uuid', 'latitude', 'longitude', 'height', 'velocity', 'datetime')
+
     def __init__(self, uuid, latitude, longitude, height, velocity, datetime):
         self.uuid = uuid
         self.latitude = latitude
@@ -23,3 +30,24 @@ def gpsdata_to_dict(gpsdata, ctx):
             "height": gpsdata.height,
             "velocity": gpsdata.velocity,
             "datetime": gpsdata.datetime,}
+
+def gpsdata_moved(previous, gpsdata):
+    """Whether anything but the timestamp changed between two readings."""
+    return (previous.latitude != gpsdata.latitude or previous.longitude != gpsdata.longitude
+            or previous.height != gpsdata.height or previous.velocity != gpsdata.velocity)
+
+def _json_number(value):
+    if type(value) is float and math.isfinite(value):
+        return float.__repr__(value)
+    if type(value) is int:
+        return int.__repr__(value)
+    return json.dumps(value)
+
+def gpsdata_to_json(gpsdata):
+    """JSON of gpsdata_to_dict(gpsdata) as json.dumps writes it, without building the dict."""
+    return (f'{{"uuid": {encode_basestring_ascii(gpsdata.uuid) if type(gpsdata.uuid) is str else json.dumps(gpsdata.uuid)}, '
+            f'"latitude": {_json_number(gpsdata.latitude)}, '
+            f'"longitude": {_json_number(gpsdata.longitude)}, '
+            f'"height": {_json_number(gpsdata.height)}, '
+            f'"velocity": {_json_number(gpsdata.velocity)}, '
+            f'"datetime": {_json_number(gpsdata.datetime)}}}')
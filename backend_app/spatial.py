@@ -0,0 +1,189 @@
+"""
+Spatial index over the live positions of the units.
+
+The index buckets each unit in a grid cell of cell_deg degrees of latitude
+and longitude, moved between cells as its positions are consumed. Bounding
+box and radius queries only look at the units of the cells they overlap,
+and radius queries measure the candidates at once with the array
+haversine. Bounding boxes are (south, west, north, east) in degrees, a west
+greater than east crosses the antimeridian.
+
+Viewports keeps the bounding box each Socket.IO client subscribed with, to
+send it the units inside it.
+"""
+import math
+from collections import defaultdict
+from threading import Lock
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .utils import _EARTH_RADIUS_KM, haversine_km
+
+BBox = Tuple[float, float, float, float]
+
+
+def parse_bbox(values: Sequence) -> BBox:
+    """(south, west, north, east) of a sequence of 4 numbers or a comma separated string.
+
+    Raises:
+        ValueError: If the values are not a valid bounding box.
+    """
+    if isinstance(values, str):
+        values = values.split(',')
+    try:
+        south, west, north, east = (float(value) for value in values)
+    except (TypeError, ValueError):
+        raise ValueError("A bounding box is 4 numbers: south, west, north, east") from None
+    if not -90 <= south <= north <= 90:
+        raise ValueError("The bounding box latitudes must satisfy -90 <= south <= north <= 90")
+    if not (-180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("The bounding box longitudes must be between -180 and 180")
+    return south, west, north, east
+
+
+def bbox_contains(bbox: BBox, latitude: float, longitude: float) -> bool:
+    south, west, north, east = bbox
+    if not south <= latitude <= north:
+        return False
+    if west <= east:
+        return west <= longitude <= east
+    return longitude >= west or longitude <= east
+
+
+def radius_bbox(latitude: float, longitude: float, radius_km: float) -> BBox:
+    """Smallest bounding box holding every point within radius_km of the point."""
+    angle = radius_km / _EARTH_RADIUS_KM
+    south = latitude - math.degrees(angle)
+    north = latitude + math.degrees(angle)
+    if south <= -90 or north >= 90 or angle >= math.pi / 2:
+        # The circle holds a pole, every longitude is in range
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+
+    dlon = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude)))))
+    west = longitude - dlon
+    east = longitude + dlon
+    if east - west >= 360:
+        return south, -180.0, north, 180.0
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
+
+
+class SpatialIndex:
+    """Grid of the latest (latitude, longitude) of each unit, safe to use from any thread.
+
+    Args:
+        cell_deg: Side of the grid cells in degrees.
+    """
+
+    def __init__(self, cell_deg: float = 0.5):
+        self.cell_deg = cell_deg
+        self._cells = defaultdict(set)
+        self._points = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def update(self, unit: str, latitude: float, longitude: float) -> None:
+        """Move the unit to its new position, units without a valid one are removed."""
+        try:
+            valid = math.isfinite(latitude) and math.isfinite(longitude)
+        except TypeError:
+            valid = False
+        if not valid:
+            self.remove(unit)
+            return
+
+        cell = self._cell(latitude, longitude)
+        with self._lock:
+            previous = self._points.get(unit)
+            if previous is not None and previous[2] != cell:
+                self._discard(unit, previous[2])
+            self._cells[cell].add(unit)
+            self._points[unit] = (latitude, longitude, cell)
+
+    def remove(self, unit: str) -> None:
+        with self._lock:
+            previous = self._points.pop(unit, None)
+            if previous is not None:
+                self._discard(unit, previous[2])
+
+    def within_bbox(self, bbox: BBox) -> List[str]:
+        """Units inside the bounding box, sorted."""
+        with self._lock:
+            points = [(unit, self._points[unit]) for unit in self._candidates(bbox)]
+        return sorted(unit for unit, (latitude, longitude, _) in points if bbox_contains(bbox, latitude, longitude))
+
+    def within_radius(self, latitude: float, longitude: float, radius_km: float) -> List[Tuple[str, float]]:
+        """(unit, distance in km) of the units within radius_km of the point, nearest first."""
+        with self._lock:
+            units = list(self._candidates(radius_bbox(latitude, longitude, radius_km)))
+            points = np.array([self._points[unit][:2] for unit in units], dtype=float).reshape(-1, 2)
+        distances = haversine_km(np.array([latitude, longitude], dtype=float), points)
+        inside = np.flatnonzero(distances <= radius_km)
+        inside = inside[np.argsort(distances[inside], kind='stable')]
+        return [(units[i], float(distances[i])) for i in inside]
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor((latitude + 90) / self.cell_deg), math.floor((longitude + 180) / self.cell_deg)
+
+    def _discard(self, unit: str, cell: Tuple[int, int]) -> None:
+        units = self._cells[cell]
+        units.discard(unit)
+        if not units:
+            del self._cells[cell]
+
+    def _candidates(self, bbox: BBox) -> Iterator[str]:
+        # Units of the cells overlapping the box, to be checked against it. Called with the lock held
+        south, west, north, east = bbox
+        first_row, first_col = self._cell(south, west)
+        last_row, last_col = self._cell(north, east)
+        if west <= east:
+            columns = [(first_col, last_col)]
+        else:
+            columns = [(first_col, self._cell(0, 180)[1]), (self._cell(0, -180)[1], last_col)]
+
+        rows = last_row - first_row + 1
+        if rows * sum(last - first + 1 for first, last in columns) > len(self._cells):
+            # A large box overlaps more cells than are occupied
+            cells = [cell for cell in self._cells
+                     if first_row <= cell[0] <= last_row and any(first <= cell[1] <= last for first, last in columns)]
+        else:
+            cells = [(row, col) for row in range(first_row, last_row + 1)
+                     for first, last in columns for col in range(first, last + 1) if (row, col) in self._cells]
+        for cell in cells:
+            yield from self._cells[cell]
+
+
+class Viewports:
+    """Bounding box of each client subscribed with one, safe to use from any thread."""
+
+    def __init__(self):
+        self._viewports = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._viewports)
+
+    def set(self, client: str, bbox: Optional[BBox]) -> None:
+        """Replace the client's bounding box, None removes it."""
+        with self._lock:
+            if bbox is None:
+                self._viewports.pop(client, None)
+            else:
+                self._viewports[client] = bbox
+
+    def get(self, client: str) -> Optional[BBox]:
+        return self._viewports.get(client)
+
+    def containing(self, latitude: float, longitude: float) -> List[str]:
+        """Clients whose bounding box holds the point."""
+        if not (isinstance(latitude, (int, float)) and isinstance(longitude, (int, float))):
+            return []
+        with self._lock:
+            viewports = list(self._viewports.items())
+        return [client for client, bbox in viewports if bbox_contains(bbox, latitude, longitude)]
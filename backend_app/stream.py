@@ -0,0 +1,309 @@
+"""
+Live GPS positions from Kafka, shared by every Socket.IO client.
+
+Each unit publishes its positions to a topic named after its UUID. A single
+consumer per process reads all of those topics and hands every position to
+a publish callback, which emits it to the Socket.IO room of the unit. Kafka
+load stays the same however many dashboards are open, and each client only
+receives the units it subscribed to.
+
+The unit topics are discovered through the subscription pattern, the poll
+loop never lists the topics. TopicRegistry caches them for the handlers
+that need the list, refreshing the cluster metadata on an interval and
+updating it when a rebalance assigns the partitions of new topics.
+
+Each poll drains what the consumer has buffered, up to a message count or
+a time budget, and only deserializes the latest message of each unit: under
+a burst the stream skips to the freshest positions instead of falling
+behind. Positions are not emitted as they arrive: CoalescingEmitter keeps the
+latest one per unit and sends, at a fixed tick and in a single batch, only
+the units that moved since the previous tick, with an optional keyframe of every unit now and
+then for the clients that missed an update.
+
+PositionStore keeps the latest position of every unit as it is consumed,
+for the clients that need the positions now rather than on the next update:
+the snapshot sent on subscribe and the REST endpoint.
+"""
+import threading
+import time
+from threading import Event, Lock
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional
+
+from .utils import is_valid_uuid
+
+# Topics of the units, librdkafka subscribes to every topic matching a leading ^ pattern
+UNIT_TOPICS = '^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
+
+
+def _start_thread(target: Callable[[], None]) -> threading.Thread:
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def drain_latest(consumer, max_messages: int = 1000, time_budget: float = 0.05, timeout: float = 1.0) -> Dict[str, Any]:
+    """Consume the available messages and keep the latest one of each topic.
+
+    Waits up to timeout seconds for messages, then keeps consuming without
+    waiting until max_messages were read, the consumer has caught up or
+    time_budget seconds have passed since the first messages arrived.
+    Messages with an error are dropped.
+
+    Returns:
+        Dict[str, Message]: Latest message per topic, in order of arrival.
+    """
+    latest = {}
+    read = 0
+    deadline = None
+    wait = timeout
+    while read < max_messages:
+        batch = consumer.consume(num_messages=max_messages - read, timeout=wait)
+        if not batch:
+            break
+        read += len(batch)
+        for message in batch:
+            if not message.error():
+                latest[message.topic()] = message
+
+        if deadline is None:
+            deadline = time.monotonic() + time_budget
+        if time.monotonic() >= deadline:
+            break
+        wait = 0
+    return latest
+
+
+class TopicRegistry:
+    """Cached set of the unit topics.
+
+    Args:
+        list_topics: Returns the names of every topic of the cluster.
+        refresh_interval: Seconds the cached set is used before listing the topics again.
+    """
+
+    def __init__(self, list_topics: Callable[[], Iterable[str]], refresh_interval: float = 60.0):
+        self.list_topics = list_topics
+        self.refresh_interval = refresh_interval
+        self._units = frozenset()
+        self._refreshed = None
+        self._lock = Lock()
+
+    def units(self, max_age: Optional[float] = None) -> FrozenSet[str]:
+        """Unit topics, listed again if the cache is older than max_age (default: refresh_interval) seconds."""
+        max_age = self.refresh_interval if max_age is None else max_age
+        with self._lock:
+            if self._refreshed is None or time.monotonic() - self._refreshed >= max_age:
+                self._units = frozenset(topic for topic in self.list_topics() if is_valid_uuid(topic))
+                self._refreshed = time.monotonic()
+            return self._units
+
+    def update(self, topics: Iterable[str]) -> None:
+        """Add the unit topics among topics, e.g. those of the partitions assigned on a rebalance."""
+        with self._lock:
+            self._units = self._units | {topic for topic in topics if is_valid_uuid(topic)}
+
+
+class PositionStore:
+    """Latest position of each unit, safe to update and read from any thread."""
+
+    def __init__(self):
+        self._positions = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def update(self, unit: str, position: Any) -> None:
+        with self._lock:
+            self._positions[unit] = position
+
+    def snapshot(self, units: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Latest position of the units (all of them if None), units never seen are left out."""
+        with self._lock:
+            if units is None:
+                return dict(self._positions)
+            return {unit: self._positions[unit] for unit in units if unit in self._positions}
+
+
+class GPSStream:
+    """A Kafka consumer subscribed to every unit topic, polled in a background thread.
+
+    Args:
+        consumer_factory: Creates the confluent_kafka Consumer.
+        deserialize: Turns a message into a position, None to skip it.
+        publish: Called with the unit id and its position for every message.
+        max_messages: Messages consumed at most per poll, see drain_latest.
+        time_budget: Seconds a poll keeps consuming once messages arrived.
+        poll_timeout: Seconds a poll waits for messages.
+        topics_refresh: Seconds the list of unit topics is cached, see TopicRegistry.
+    """
+
+    def __init__(self, consumer_factory: Callable[[], Any], deserialize: Callable[[Any], Any],
+                 publish: Callable[[str, Any], None], max_messages: int = 1000, time_budget: float = 0.05,
+                 poll_timeout: float = 1.0, topics_refresh: float = 60.0):
+        self.consumer_factory = consumer_factory
+        self.deserialize = deserialize
+        self.publish = publish
+        self.max_messages = max_messages
+        self.time_budget = time_budget
+        self.poll_timeout = poll_timeout
+        self.consumer = None
+        self.topics = TopicRegistry(self._list_topics, topics_refresh)
+        self._thread = None
+        self._running = Event()
+        self._lock = Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._running.is_set()
+
+    def start(self, start_task: Callable[[Callable[[], None]], Any] = _start_thread) -> None:
+        """Create the consumer and start polling it, unless already started."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self.consumer is None:
+                self.consumer = self.consumer_factory()
+            self.consumer.subscribe([UNIT_TOPICS], on_assign=self._on_assign)
+            self._running.set()
+            self._thread = start_task(self._run)
+
+    def stop(self) -> None:
+        """Stop polling and close the consumer."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._running.clear()
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            if self.consumer is not None and self._thread is None:
+                self.consumer.close()
+                self.consumer = None
+
+    def list_units(self, max_age: Optional[float] = None) -> List[str]:
+        """Ids of the units with a topic, from the TopicRegistry."""
+        return sorted(self.topics.units(max_age))
+
+    def poll(self) -> int:
+        """Drain the consumer and publish the latest position of each unit, returns the number published."""
+        published = 0
+        # Superseded messages are never deserialized
+        for unit, message in drain_latest(self.consumer, self.max_messages, self.time_budget, self.poll_timeout).items():
+            position = self.deserialize(message)
+            if position is not None:
+                self.publish(unit, position)
+                published += 1
+        return published
+
+    def _list_topics(self) -> Iterable[str]:
+        with self._lock:
+            if self.consumer is None:
+                self.consumer = self.consumer_factory()
+            consumer = self.consumer
+        return consumer.list_topics().topics.keys()
+
+    def _on_assign(self, consumer, partitions) -> None:
+        # The pattern subscription picked up new topics
+        self.topics.update(partition.topic for partition in partitions)
+
+    def _run(self) -> None:
+        while self._running.is_set():
+            try:
+                self.poll()
+            except Exception:
+                # A bad message or a broker hiccup must not end the stream
+                time.sleep(self.poll_timeout)
+
+
+class CoalescingEmitter:
+    """Emits the latest position of each unit at a fixed rate.
+
+    Args:
+        emit: Called once per tick with the positions sent, by unit id.
+        tick_hz: Flushes per second.
+        keyframe_every: Every that many ticks, send the latest position of
+            every unit even if it did not change. 0 disables keyframes.
+        moved: Tells whether a unit moved between its previous and its new
+            position. Defaults to comparing the fields of position dicts
+            other than IGNORED_FIELDS.
+    """
+    # A unit whose fields other than these did not change has not moved
+    IGNORED_FIELDS = ('datetime',)
+
+    def __init__(self, emit: Callable[[Dict[str, Any]], None], tick_hz: float = 5.0, keyframe_every: int = 0,
+                 moved: Optional[Callable[[Any, Any], bool]] = None):
+        self.emit = emit
+        self.tick_hz = tick_hz
+        self.keyframe_every = keyframe_every
+        self.moved = moved if moved is not None else self._moved
+        self.ticks = 0
+        self._pending = {}
+        self._sent = {}
+        self._thread = None
+        self._running = Event()
+        self._lock = Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._running.is_set()
+
+    def update(self, unit: str, position: Any) -> None:
+        """Record the latest position of the unit, sent on the next tick."""
+        with self._lock:
+            self._pending[unit] = position
+
+    def flush(self) -> int:
+        """Send the units that moved since the last flush (all of them on a keyframe), returns the number sent."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        self.ticks += 1
+        keyframe = self.keyframe_every > 0 and self.ticks % self.keyframe_every == 0
+
+        batch = {}
+        for unit, position in pending.items():
+            previous = self._sent.get(unit)
+            self._sent[unit] = position
+            if keyframe or previous is None or self.moved(previous, position):
+                batch[unit] = position
+        if keyframe:
+            for unit, position in self._sent.items():
+                if unit not in pending:
+                    batch[unit] = position
+        if batch:
+            self.emit(batch)
+        return len(batch)
+
+    def start(self, start_task: Callable[[Callable[[], None]], Any] = _start_thread) -> None:
+        """Start flushing in the background, unless already started."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._running.set()
+            self._thread = start_task(self._run)
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._running.clear()
+        if thread is not None:
+            thread.join()
+
+    def _moved(self, previous: Dict[str, Any], position: Dict[str, Any]) -> bool:
+        return any(previous.get(field) != value for field, value in position.items() if field not in self.IGNORED_FIELDS)
+
+    def _run(self) -> None:
+        interval = 1.0 / self.tick_hz
+        next_tick = time.monotonic() + interval
+        while self._running.is_set():
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind, skip the missed ticks instead of flushing in a burst
+                next_tick = time.monotonic()
+            next_tick += interval
+            try:
+                self.flush()
+            except Exception:
+                # An emit failing must not stop the ticks
+                continue
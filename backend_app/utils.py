@@ -1,10 +1,12 @@
 """
 Auxiliary functions for the backend
 """
-from typing import Tuple
+from typing import Optional, Tuple
 import uuid
 import math
-from datetime import datetime
+from datetime import datetime, timezone
+
+import numpy as np
 
 _EARTH_RADIUS_KM = 6371.0088
 
@@ -47,6 +49,107 @@ def geodesic_km(point_a: Tuple[float, float], point_b: Tuple[float, float]) -> f
     return _EARTH_RADIUS_KM * c
 
 
+def haversine_km(point_a: np.ndarray, point_b: np.ndarray) -> np.ndarray:
+    """Array version of geodesic_km.
+
+    Args:
+        point_a (np.ndarray): (..., 2) array of (latitude, longitude) pairs.
+        point_b (np.ndarray): (..., 2) array of (latitude, longitude) pairs,
+            broadcastable against point_a.
+
+    Returns:
+        np.ndarray: Distances in kilometers. Pairs with a NaN coordinate give NaN.
+    """
+    point_a = np.radians(np.asarray(point_a, dtype=float))
+    point_b = np.radians(np.asarray(point_b, dtype=float))
+    φ1, λ1 = point_a[..., 0], point_a[..., 1]
+    φ2, λ2 = point_b[..., 0], point_b[..., 1]
+
+    sin_dφ = np.sin((φ2 - φ1) / 2)
+    sin_dλ = np.sin((λ2 - λ1) / 2)
+    a = sin_dφ**2 + np.cos(φ1) * np.cos(φ2) * sin_dλ**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return _EARTH_RADIUS_KM * c
+
+
+def segment_distances_km(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Distance between each pair of consecutive points of a path.
+
+    Args:
+        latitudes (np.ndarray): Latitudes of the path, in order.
+        longitudes (np.ndarray): Longitudes of the path, in order.
+
+    Returns:
+        np.ndarray: n - 1 distances in kilometers, NaN where a coordinate is missing.
+    """
+    points = np.column_stack((np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)))
+    return haversine_km(points[:-1], points[1:])
+
+
+def path_length_km(latitudes: np.ndarray, longitudes: np.ndarray, cumulative: bool = False):
+    """Length of the path going through the given points.
+
+    Segments with a missing coordinate are skipped.
+
+    Args:
+        latitudes (np.ndarray): Latitudes of the path, in order.
+        longitudes (np.ndarray): Longitudes of the path, in order.
+        cumulative (bool): Return the distance traveled up to each point instead of the total.
+
+    Returns:
+        float | np.ndarray: Total length in kilometers, or an array with one running total per point.
+    """
+    segments = np.nan_to_num(segment_distances_km(latitudes, longitudes), nan=0.0)
+    if not cumulative:
+        return float(segments.sum())
+    return np.concatenate(([0.0], np.cumsum(segments)))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Pick the points that best preserve the shape of a series (Largest-Triangle-Three-Buckets).
+
+    The first and last points are always kept. The points in between are
+    split into threshold - 2 buckets and each bucket keeps the point forming
+    the largest triangle with the point kept in the previous bucket and the
+    average of the next bucket.
+
+    Args:
+        x (np.ndarray): Increasing x coordinates of the series.
+        y (np.ndarray): y coordinates of the series, without missing values.
+        threshold (int): Number of points to keep.
+
+    Returns:
+        np.ndarray: Sorted indices of the kept points, all of them if there are
+        no more than threshold.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    edges = np.append((np.arange(threshold - 1) * every).astype(np.intp) + 1, n)
+    indices = np.empty(threshold, dtype=np.intp)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    selected = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2]
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # Twice the triangle area, the factor does not change the argmax
+        areas = np.abs((x[selected] - avg_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (avg_y - y[selected]))
+        selected = start + int(np.argmax(areas))
+        indices[i + 1] = selected
+
+    return indices
+
+
 def get_color_palette(n_colors: int) -> list:
     """Generate a color palette """
     colors = [
@@ -67,6 +170,16 @@ def get_color_palette(n_colors: int) -> list:
     return colors + additional_colors
 
 
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """UTC datetime without tzinfo, the form MongoDB returns timestamps in.
+
+    Naive datetimes are taken to already be in UTC and returned as is.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
 def extract_fields(data: dict):
     """ Extract unit_id (or units_id), start_date, end_date from data dict """
     unit_id = data.get('unit_id') or data.get('units_id')
@@ -1,24 +1,25 @@
-import matplotlib
-matplotlib.use('Agg')  # Use a non-interactive backend for matplotlib
-import matplotlib.pyplot as plt
-import io
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import base64
 from datetime import datetime
 
 from typing import List, Dict, Any, Optional
 
+from .cache import PlotCache, cached_plot
 from .db_mongo import FleetDatabase
-from .utils import geodesic_km
+from .render import PlotRenderer
+from .rollup import read_daily_distance
+from .utils import lttb_indices
 
-plt.style.use('seaborn-v0_8')
-sns.set_palette('husl')
+# Points kept per unit in a time series, about one per pixel of the figure width
+TIME_SERIES_POINTS = 1200
 
 class VehicleDataVisualizer:
-    def __init__(self, uri : str = "mongodb://localhost:27017", db_name: str = "fleet_db"):
+    def __init__(self, uri : str = "mongodb://localhost:27017", db_name: str = "fleet_db", plot_cache: Optional[PlotCache] = None,
+                 renderer: Optional[PlotRenderer] = None):
         self._db = FleetDatabase(uri, db_name)
+        self.plot_cache = plot_cache if plot_cache is not None else PlotCache()
+        # Renders in the calling thread unless given a renderer with worker processes
+        self.renderer = renderer if renderer is not None else PlotRenderer(workers=0)
 
         self.numeric_fields = [
             'engine-speed', 'vehicle-speed', 'intake-manifold-absolute-pressure',
@@ -50,271 +51,303 @@ class VehicleDataVisualizer:
         """ Get available fields"""
         return self.field_labels
 
-    def compute_distance_traveled(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
-        """Computes the daily distance traveled for each vehicle."""
-        vehicles = self._db.get_all_vehicles()
-        vehicles = self._db.get_vehicle_data(vehicles, start_date, end_date, True)
+    def compute_distance_traveled(self, units_id: Optional[List[str]] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+        """Computes the daily distance traveled for each vehicle, or only for units_id if given."""
+        if units_id is None:
+            units_id = self._db.get_all_vehicles()
 
-        if vehicles.empty:
-            return pd.DataFrame()
+        # Closed days come from the daily_distance rollup when materialized
+        return read_daily_distance(self._db, units_id, start_date, end_date)
+
+    def compute_daily_average(self, units_id: Optional[List[str]] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+        """Computes average speed and distance traveled per day for each vehicle, or only for units_id if given."""
+        if units_id is None:
+            units_id = self._db.get_all_vehicles()
 
-        vehicles['date'] = vehicles['timestamp'].dt.date
-        vehicles = vehicles.sort_values(by=['unit-id', 'timestamp'])
-
-        daily_distances = []
-        for unit_id in vehicles['unit-id'].unique():
-            unit_data = vehicles[vehicles['unit-id'] == unit_id].copy()
-
-            for date in unit_data['date'].unique():
-                day_data = unit_data[unit_data['date'] == date].copy()
-                if len(day_data) < 2:
-                    daily_distances.append({
-                        'unit-id': unit_id,
-                        'date': date,
-                        'distance_km': 0.0
-                    })
-                    continue
-                total_distance = 0.0
-                for i in range(1, len(day_data)):
-                    point_a = (day_data.iloc[i-1]['latitude'], day_data.iloc[i-1]['longitude'])
-                    point_b = (day_data.iloc[i]['latitude'], day_data.iloc[i]['longitude'])
-                    distance = geodesic_km(point_a, point_b)
-                    if np.isnan(distance):
-                        continue
-                    total_distance += distance
-                daily_distances.append({
-                    'unit-id': unit_id,
-                    'date': date,
-                    'distance_km': total_distance
-                })
-
-        return pd.DataFrame(daily_distances)
-
-    def compute_daily_average(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
-        """Computes average speed and distance traveled per day for each vehicle."""
-        vehicles = self._db.get_all_vehicles()
-        vehicles = self._db.get_vehicle_data(vehicles, start_date, end_date, True)
-
-        if vehicles.empty:
+        # Daily average speeds are aggregated by the database
+        speed_avg = self._db.get_daily_stats(units_id, ['speed'], start_date, end_date, True)
+        if speed_avg.empty:
             return pd.DataFrame()
+        speed_avg = speed_avg[['unit-id', 'date', 'speed_mean']].rename(columns={'speed_mean': 'avg_speed'})
 
         # Compute daily distances
-        distance = self.compute_distance_traveled(start_date, end_date)
-
-        # Compute daily average speeds
-        vehicles['date'] = vehicles['timestamp'].dt.date
-        speed_avg = vehicles.groupby(['unit-id', 'date'])['speed'].mean().reset_index()
-        speed_avg.columns = ['unit-id', 'date', 'avg_speed']
+        distance = self.compute_distance_traveled(units_id, start_date, end_date)
+        # The distance comes from another source (rollup or raw points) and may be empty
         if not distance.empty:
             result = pd.merge(speed_avg, distance, on=['unit-id', 'date'], how='outer')
             result['distance_km'] = result['distance_km'].fillna(0.0)
         else:
             result = speed_avg
             result['avg_speed'] = result['avg_speed'].fillna(0.0)
+            result['distance_km'] = 0.0
 
         return result
 
-    def plot_daily_distance(self, units_id: List[str], start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
-        """Creates a plot for daily distance traveled for the specified vehicles."""
-        daily_distance = self.compute_distance_traveled(start_date, end_date)
+    def daily_distance_data(self, units_id: List[str], start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Daily distance traveled per vehicle: unit-id, date and distance_km."""
+        daily_distance = self.compute_distance_traveled(units_id, start_date, end_date)
         if daily_distance.empty:
-            return ""
-
-        fig, ax = plt.subplots(figsize=(12, 6))
-        for unit_id in units_id:
-            data = daily_distance[daily_distance['unit-id'] == unit_id]
-            if len(data) == 0:
-                continue
-            ax.plot(data['date'], data['distance_km'], marker='o', label=f'Unit {unit_id}', linewidth=2)
+            return pd.DataFrame()
+        return daily_distance[daily_distance['unit-id'].isin(units_id)].reset_index(drop=True)
 
-        if len(ax.lines) == 0:
-            return ""
+    def daily_average_data(self, unit_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Daily average speed and distance traveled of a vehicle: unit-id, date, avg_speed and distance_km."""
+        daily_avg = self.compute_daily_average([unit_id], start_date, end_date)
+        if daily_avg.empty:
+            return pd.DataFrame()
+        return daily_avg[daily_avg['unit-id'] == unit_id].reset_index(drop=True)
 
-        ax.set_title("Daily Distance Traveled", fontsize=14, fontweight='bold')
-        ax.set_xlabel("Date", fontsize=12)
-        ax.set_ylabel("Distance Traveled (km)", fontsize=12)
-        ax.legend()
-        ax.grid(True, alpha=0.6)
+    def time_series_data(self, units_id: List[str], field: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                         max_points: Optional[int] = TIME_SERIES_POINTS) -> pd.DataFrame:
+        """Values of the field over time: unit-id, timestamp and the field.
 
-        plt.tight_layout()
-        return self._fig_to_base64(fig)
+        Units with more than max_points points are downsampled to max_points
+        with LTTB, which keeps the peaks and the shape of the series. None
+        returns every point.
+        """
+        vehicles_data = self._db.get_vehicle_data(units_id, start_date, end_date, field == 'distance-traveled', fields=[field])
+        if vehicles_data.empty or field not in vehicles_data.columns:
+            return pd.DataFrame()
 
-    def plot_daily_average(self, unit_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
-        """Creates a plot for daily average speed and distance traveled for the specified vehicle."""
-        daily_avg = self.compute_daily_average(start_date, end_date)
-        if daily_avg.empty:
-            return ""
+        vehicles_data = vehicles_data[['unit-id', 'timestamp', field]]
+        counts = vehicles_data['unit-id'].value_counts()
+        if max_points is None or counts.max() <= max_points:
+            return vehicles_data
 
-        vehicle_data = daily_avg[daily_avg['unit-id'] == unit_id]
-        if vehicle_data.empty:
-            return ""
+        units = [self._downsample(data, field, max_points) for _, data in vehicles_data.groupby('unit-id', sort=False)]
+        return pd.concat(units, ignore_index=True)
 
-        fig, axes = plt.subplots(1, 2, figsize=(12, 6))
+    def distribution_data(self, units_id: List[str], field: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, bins: int = 30) -> pd.DataFrame:
+        """Histogram of the field per vehicle: unit-id, bin_start, bin_end and count."""
+        vehicles_data = self._db.get_vehicle_data(units_id, start_date, end_date, field == 'distance-traveled', fields=[field])
+        if vehicles_data.empty or field not in vehicles_data.columns:
+            return pd.DataFrame()
 
-        axes[0].hist(vehicle_data['avg_speed'].dropna(), bins=20, color='skyblue', edgecolor='black')
-        axes[0].set_title("Average Speed Distribution", fontsize=12, fontweight='bold')
-        axes[0].set_xlabel("Time", fontsize=10)
-        axes[0].set_ylabel("Average Speed (km/h)", fontsize=10)
-        axes[0].grid(True, alpha=0.6)
+        histograms = []
+        for unit_id in units_id:
+            data = vehicles_data[vehicles_data['unit-id'] == unit_id]
+            values = pd.to_numeric(data[field], errors='coerce').dropna().to_numpy(dtype=float)
+            if len(values) == 0:
+                continue
+            counts, edges = np.histogram(values, bins=bins)
+            histograms.append(pd.DataFrame({
+                'unit-id': unit_id, 'bin_start': edges[:-1], 'bin_end': edges[1:], 'count': counts,
+            }))
 
-        axes[1].hist(vehicle_data['distance_km'].dropna(), bins=20, color='salmon', edgecolor='black')
-        axes[1].set_title("Distance Traveled Distribution", fontsize=12, fontweight='bold')
-        axes[1].set_xlabel("Time", fontsize=10)
-        axes[1].set_ylabel("Distance Traveled (km)", fontsize=10)
-        axes[1].grid(True, alpha=0.6)
+        if not histograms:
+            return pd.DataFrame()
+        return pd.concat(histograms, ignore_index=True)
 
-        fig.suptitle("Daily Average Speed and Distance Traveled", fontsize=14, fontweight='bold')
+    def box_plot_data(self, units_id: List[str], field: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Box plot statistics of the field per vehicle.
 
-        plt.tight_layout()
-        return self._fig_to_base64(fig)
+        Whiskers reach the most extreme values within 1.5 IQR of the quartiles,
+        the values beyond them are listed in outliers.
+        """
+        vehicles_data = self._db.get_vehicle_data(units_id, start_date, end_date, field == 'distance-traveled', fields=[field])
+        if vehicles_data.empty or field not in vehicles_data.columns:
+            return pd.DataFrame()
 
-    def create_time_series_plot(self, units_id: List[str], field: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
-        """Creates a time series plot for the specified field and vehicles."""
-        vehicles_data = self._db.get_vehicle_data(units_id, start_date, end_date, field == 'distance-traveled')
+        from matplotlib.cbook import boxplot_stats
 
-        if vehicles_data.empty or field not in vehicles_data.columns:
-            return ""
-    
-        fig, ax = plt.subplots(figsize=(12, 6))
+        rows = []
         for unit_id in units_id:
             data = vehicles_data[vehicles_data['unit-id'] == unit_id]
-            if len(data) == 0:
+            data_no_na = data[field].dropna()
+            if data_no_na.empty:
                 continue
-            ax.plot(data['timestamp'], data[field], label=f'Unit {unit_id}', linewidth=2)
-        
-        ax.set_title(f"{self.field_labels.get(field, field)} Over Time", fontsize=14, fontweight='bold')
-        ax.set_xlabel("Time", fontsize=12)
-        ax.set_ylabel(self.field_labels[field], fontsize=12)
-        ax.legend()
-        ax.grid(True, alpha=0.6)
+            stats = boxplot_stats(data_no_na.to_numpy(dtype=float))[0]
+            rows.append({
+                'unit-id': unit_id,
+                'count': len(data_no_na),
+                'whisker_low': stats['whislo'],
+                'q1': stats['q1'],
+                'median': stats['med'],
+                'q3': stats['q3'],
+                'whisker_high': stats['whishi'],
+                'mean': stats['mean'],
+                'outliers': list(stats['fliers']),
+            })
+
+        return pd.DataFrame(rows)
+
+    def scatter_data(self, units_id: List[str], field_x: str, field_y: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Pairs of values of the two fields: unit-id, field_x and field_y."""
+        vehicles_data = self._db.get_vehicle_data(units_id, start_date, end_date, False, fields=[field_x, field_y])
+        if vehicles_data.empty or field_x not in vehicles_data.columns or field_y not in vehicles_data.columns:
+            return pd.DataFrame()
+        return vehicles_data[['unit-id', field_x, field_y]]
 
-        plt.tight_layout()
-        return self._fig_to_base64(fig)
+    def correlation_data(self, unit_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Correlation matrix of the numeric fields of the vehicle, one row per field."""
+        vehicles_data = self._db.get_vehicle_data([unit_id], start_date, end_date, False, fields=self.numeric_fields[:-1])
+        if vehicles_data.empty:
+            return pd.DataFrame()
 
-    def create_distribution_plot(self, units_id: List[str], field: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
-        """Creates hisotgram/distribution plot for the specified field and vehicles."""
-        vehicles_data = self._db.get_vehicle_data(units_id, start_date, end_date, field == 'distance-traveled')
-        if vehicles_data.empty or field not in vehicles_data.columns:
+        # Do not create if NA values are present
+        try:
+            # All fields but 'distance-traveled'
+            corr_matrix = vehicles_data[self.numeric_fields[:-1]].corr()
+        except TypeError:
+            return pd.DataFrame()
+
+        return corr_matrix.rename_axis('field').reset_index()
+
+    @cached_plot('daily_distance')
+    def plot_daily_distance(self, units_id: List[str], start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
+        """Creates a plot for daily distance traveled for the specified vehicles."""
+        daily_distance = self.daily_distance_data(units_id, start_date, end_date)
+        if daily_distance.empty:
             return ""
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
 
+        series = []
         for unit_id in units_id:
-            data = vehicles_data[vehicles_data['unit-id'] == unit_id]
+            data = daily_distance[daily_distance['unit-id'] == unit_id]
             if len(data) == 0:
                 continue
-            ax.hist(data[field], bins=30, alpha=0.5, label=f'Unit {unit_id}')
-        
-        ax.set_title(f"{self.field_labels[field]} Distribution", fontsize=14, fontweight='bold')
-        ax.set_xlabel(self.field_labels[field], fontsize=12)
-        ax.set_ylabel("Frequency", fontsize=12)
-        ax.legend()
-        ax.grid(True, alpha=0.6)
-
-        plt.tight_layout()
-        return self._fig_to_base64(fig)
-
-    def create_box_plot(self, units_id: List[str], field: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
-        """Creates box plot for the specified field and vehicles."""
-        vehicles_data = self._db.get_vehicle_data(units_id, start_date, end_date, field == 'distance-traveled')
-        if vehicles_data.empty or field not in vehicles_data.columns:
+            series.append({'label': f'Unit {unit_id}', 'x': data['date'].to_numpy(), 'y': data['distance_km'].to_numpy()})
+
+        return self.renderer.render({
+            'kind': 'lines',
+            'series': series,
+            'marker': 'o',
+            'title': "Daily Distance Traveled",
+            'xlabel': "Date",
+            'ylabel': "Distance Traveled (km)",
+        })
+
+    @cached_plot('daily_average')
+    def plot_daily_average(self, unit_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
+        """Creates a plot for daily average speed and distance traveled for the specified vehicle."""
+        vehicle_data = self.daily_average_data(unit_id, start_date, end_date)
+        if vehicle_data.empty:
             return ""
 
-        fig, ax = plt.subplots(figsize=(10, 6))
-        data_for_plot = []
-        labels = []
+        return self.renderer.render({
+            'kind': 'histograms',
+            'title': "Daily Average Speed and Distance Traveled",
+            'panels': [
+                {'values': vehicle_data['avg_speed'].dropna().to_numpy(dtype=float), 'color': 'skyblue',
+                 'title': "Average Speed Distribution", 'xlabel': "Time", 'ylabel': "Average Speed (km/h)"},
+                {'values': vehicle_data['distance_km'].dropna().to_numpy(dtype=float), 'color': 'salmon',
+                 'title': "Distance Traveled Distribution", 'xlabel': "Time", 'ylabel': "Distance Traveled (km)"},
+            ],
+        })
+
+    @cached_plot('timeseries')
+    def create_time_series_plot(self, units_id: List[str], field: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                                max_points: Optional[int] = TIME_SERIES_POINTS) -> str:
+        """Creates a time series plot for the specified field and vehicles, see time_series_data for max_points."""
+        vehicles_data = self.time_series_data(units_id, field, start_date, end_date, max_points)
+        if vehicles_data.empty:
+            return ""
 
+        series = []
         for unit_id in units_id:
             data = vehicles_data[vehicles_data['unit-id'] == unit_id]
             if len(data) == 0:
                 continue
-            data_no_na = data[field].dropna()
-            if data_no_na.empty:
-                continue
-            data_for_plot.append(data_no_na)
-            labels.append(f'Unit {unit_id}')
+            values = pd.to_numeric(data[field], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            series.append({'label': f'Unit {unit_id}', 'x': data['timestamp'].to_numpy(), 'y': values})
+
+        return self.renderer.render({
+            'kind': 'lines',
+            'series': series,
+            'title': f"{self.field_labels.get(field, field)} Over Time",
+            'xlabel': "Time",
+            'ylabel': self.field_labels[field],
+        })
+
+    @cached_plot('distribution')
+    def create_distribution_plot(self, units_id: List[str], field: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
+        """Creates hisotgram/distribution plot for the specified field and vehicles."""
+        histograms = self.distribution_data(units_id, field, start_date, end_date)
+        if histograms.empty:
+            return ""
 
-        if len(data_for_plot) == 0:
+        series = []
+        for unit_id in units_id:
+            data = histograms[histograms['unit-id'] == unit_id]
+            if len(data) == 0:
+                continue
+            edges = np.append(data['bin_start'].to_numpy(), data['bin_end'].iloc[-1])
+            series.append({'label': f'Unit {unit_id}', 'edges': edges, 'counts': data['count'].to_numpy()})
+
+        return self.renderer.render({
+            'kind': 'binned',
+            'series': series,
+            'title': f"{self.field_labels[field]} Distribution",
+            'xlabel': self.field_labels[field],
+            'ylabel': "Frequency",
+        })
+
+    @cached_plot('boxplot')
+    def create_box_plot(self, units_id: List[str], field: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
+        """Creates box plot for the specified field and vehicles."""
+        box_stats = self.box_plot_data(units_id, field, start_date, end_date)
+        if box_stats.empty:
             return ""
 
-        ax.boxplot(data_for_plot, tick_labels=labels)
-        ax.set_title(f"{self.field_labels[field]} Comparison", fontsize=14, fontweight='bold')
-        ax.set_ylabel(self.field_labels[field], fontsize=12)
-        ax.grid(True, alpha=0.3)
+        stats = [
+            {'label': f"Unit {row['unit-id']}", 'whislo': row['whisker_low'], 'q1': row['q1'], 'med': row['median'],
+             'q3': row['q3'], 'whishi': row['whisker_high'], 'fliers': row['outliers']}
+            for row in box_stats.to_dict('records')
+        ]
+
+        return self.renderer.render({
+            'kind': 'box',
+            'stats': stats,
+            'title': f"{self.field_labels[field]} Comparison",
+            'ylabel': self.field_labels[field],
+        })
 
-        plt.tight_layout()
-        return self._fig_to_base64(fig)
-    
+    @cached_plot('scatter')
     def create_scatter_plot(self, units_id: List[str], field_x: str, field_y: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
         """Creates scatter plot for the specified fields and vehicles."""
-        vehicles_data = self._db.get_vehicle_data(units_id, start_date, end_date, False)
-
-        if vehicles_data.empty or field_x not in vehicles_data.columns or field_y not in vehicles_data.columns:
+        vehicles_data = self.scatter_data(units_id, field_x, field_y, start_date, end_date)
+        if vehicles_data.empty:
             return ""
 
-        fig, ax = plt.subplots(figsize=(10, 8))
-        colors = plt.cm.Set3(np.linspace(0, 1, len(units_id)))
-
-        for i, unit_id in enumerate(units_id):
+        series = []
+        for unit_id in units_id:
             data = vehicles_data[vehicles_data['unit-id'] == unit_id]
             try:
-                ax.scatter(data[field_x], data[field_y], alpha=0.6, label=f'Unit {unit_id}', color=colors[i])
+                series.append({'label': f'Unit {unit_id}', 'x': data[field_x].to_numpy(dtype=float), 'y': data[field_y].to_numpy(dtype=float)})
             except TypeError:
                 return ""
-        
-        ax.set_title(f"{self.field_labels.get(field_x, field_x)} vs {self.field_labels.get(field_y, field_y)}", fontsize=14, fontweight='bold')
-        ax.set_xlabel(self.field_labels.get(field_x, field_x), fontsize=12)
-        ax.set_ylabel(self.field_labels.get(field_y, field_y), fontsize=12)
-        ax.legend()
-        ax.grid(True, alpha=0.6)
 
-        plt.tight_layout()
-        return self._fig_to_base64(fig)
+        return self.renderer.render({
+            'kind': 'scatter',
+            'series': series,
+            'title': f"{self.field_labels.get(field_x, field_x)} vs {self.field_labels.get(field_y, field_y)}",
+            'xlabel': self.field_labels.get(field_x, field_x),
+            'ylabel': self.field_labels.get(field_y, field_y),
+        })
 
+    @cached_plot('heatmap')
     def create_correlation_heatmap(self, unit_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> str:
         """Creates a correlation heatmap for numeric fields of the specified vehicles."""
-        vehicles_data = self._db.get_vehicle_data([unit_id], start_date, end_date, False)
-
-        if vehicles_data.empty:
-            return ""
-
-        # Do not create if NA values are present
-        try:
-            # All fields but 'distance-traveled'
-            corr_matrix = vehicles_data[self.numeric_fields[:-1]].corr()
-        except TypeError:
+        corr_matrix = self.correlation_data(unit_id, start_date, end_date)
+        if corr_matrix.empty:
             return ""
-
-        fig, ax = plt.subplots(figsize=(12, 10))
-        # Create heatmap
-        im = ax.imshow(corr_matrix, cmap='coolwarm', aspect='auto', vmin=-1, vmax=1)
-        # Set ticks and labels
-        ax.set_xticks(range(len(corr_matrix.columns)))
-        ax.set_yticks(range(len(corr_matrix.columns)))
-        ax.set_xticklabels([self.field_labels[col] for col in corr_matrix.columns], rotation=45, ha='right')
-        ax.set_yticklabels([self.field_labels[col] for col in corr_matrix.columns])
-
-        # Add correlation values
-        for i in range(len(corr_matrix.columns)):
-            for j in range(len(corr_matrix.columns)):
-                text = ax.text(j, i, f'{corr_matrix.iloc[i, j]:.2f}', ha="center", va="center", color="black", fontweight='bold')
-
-        title = f'Engine Parameters Correlation Matrix'
-        title += f' - Vehicle {unit_id}'
-        ax.set_title(title, fontsize=14, fontweight='bold')
-
-        # Add colorbar
-        cbar = plt.colorbar(im)
-        cbar.set_label('Correlation Coefficient', rotation=270, labelpad=15)
-        plt.tight_layout()
-        return self._fig_to_base64(fig)
-
-    def _fig_to_base64(self, fig) -> bytes:
-        """Convert a Matplotlib figure to base64-encoded PNG bytes."""
-        image_buffer = io.BytesIO()
-        fig.savefig(image_buffer, format='png', bbox_inches='tight')
-        image_buffer.seek(0)
-        img_str = base64.b64encode(image_buffer.getvalue()).decode()
-        plt.close(fig)
-
-        return img_str
+        corr_matrix = corr_matrix.set_index('field')
+
+        return self.renderer.render({
+            'kind': 'heatmap',
+            'matrix': corr_matrix.to_numpy(dtype=float),
+            'labels': [self.field_labels[col] for col in corr_matrix.columns],
+            'title': f'Engine Parameters Correlation Matrix - Vehicle {unit_id}',
+            'colorbar_label': 'Correlation Coefficient',
+        })
+
+    @staticmethod
+    def _downsample(data: pd.DataFrame, field: str, max_points: int) -> pd.DataFrame:
+        """Keep max_points of the unit's series, dropping the missing values."""
+        if len(data) <= max_points:
+            return data
+        data = data.sort_values(by='timestamp', kind='mergesort')
+        values = pd.to_numeric(data[field], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        valid = np.flatnonzero(~np.isnan(values))
+        times = pd.to_datetime(data['timestamp'].iloc[valid], utc=True)
+        seconds = ((times - times.iloc[0]) / pd.Timedelta(seconds=1)).to_numpy() if len(valid) else np.empty(0)
+        return data.iloc[valid[lttb_indices(seconds, values[valid], max_points)]]
@@ -0,0 +1,69 @@
+"""
+Benchmark of the cursor to DataFrame conversion in FleetDatabase.get_vehicle_data.
+
+Compares the original `pd.DataFrame(list(cursor))` against the batched
+columnar loader, feeding both from a generator of wide OBD documents the
+way a pymongo cursor decodes them. Reports wall time and peak traced
+memory (the generator itself is included in both). Run from the repository root:
+
+    python -m benchmarks.bench_loader --rows 200000
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from backend_app.db_mongo import _load_frame
+
+FIELDS = [
+    'engine-speed', 'vehicle-speed', 'intake-manifold-absolute-pressure',
+    'relative-throttle-position', 'commanded-throttle-actuator',
+    'engine-coolant-temperature', 'accelerator-pedal-position',
+    'drivers-demanded-torque', 'actual-engine-torque',
+]
+
+
+def documents(rows: int):
+    basetime = datetime(2023, 1, 1)
+    for i in range(rows):
+        doc = {'unit-id': f'V{i % 50}', 'timestamp': basetime + timedelta(seconds=i)}
+        for j, field in enumerate(FIELDS):
+            doc[field] = (i * (j + 1)) % 997 / 3.0
+        yield doc
+
+
+def list_loader(cursor) -> pd.DataFrame:
+    """The original implementation, kept here as the baseline."""
+    return pd.DataFrame(list(cursor))
+
+
+def measure(loader, rows: int):
+    start = time.perf_counter()
+    frame = loader(documents(rows))
+    elapsed = time.perf_counter() - start
+
+    # Memory is traced on a separate run, tracing slows the loaders down
+    tracemalloc.start()
+    loader(documents(rows))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return frame, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{args.rows} documents, {len(FIELDS) + 2} fields each")
+    for name, loader in [('list + DataFrame', list_loader), ('columnar', _load_frame)]:
+        frame, elapsed, peak = measure(loader, args.rows)
+        rate = args.rows / elapsed
+        print(f"{name:17s} {elapsed:7.2f} s  {rate:10.0f} docs/s  peak {peak / 2**20:8.1f} MiB  "
+              f"frame {frame.memory_usage(deep=True).sum() / 2**20:7.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
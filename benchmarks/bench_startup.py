@@ -0,0 +1,53 @@
+"""
+Benchmark of the web app startup.
+
+Each run starts a fresh interpreter, as a worker boot does, and times the
+import of backend_app, create_app() and the first response of the app's
+test client (GET /, which needs neither the database nor the plotting
+libraries). Reports the median of the runs. Run from the repository root:
+
+    python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+STARTUP = '''
+import json, time
+start = time.perf_counter()
+import backend_app
+imported = time.perf_counter()
+app = backend_app.create_app({'TESTING': True})
+created = time.perf_counter()
+response = app.test_client().get('/')
+assert response.status_code == 200
+responded = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_response': responded - created,
+    'total': responded - start,
+}))
+'''
+
+
+def measure() -> dict:
+    output = subprocess.run([sys.executable, '-c', STARTUP], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    print(f"{args.runs} runs, median")
+    for step in ['import', 'create_app', 'first_response', 'total']:
+        print(f"{step:15s} {statistics.median(run[step] for run in runs) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark of the streaming path from a Kafka message to the 'gps data' event.
+
+Compares the original path (GPSData back to a dict, then json.dumps of the
+event) against encoding the event straight from the GPSData, both after
+the schema registry JSON deserializer, and reports messages per second.
+Then runs the whole path in each decode mode of backend_app.decoder.
+Messages are built in memory, no broker is needed. Run from the repository root:
+
+    python -m benchmarks.bench_stream_codec --messages 100000
+"""
+import argparse
+import json
+import time
+import uuid
+
+from backend_app.decoder import DECODE_MODES, PositionDecoder
+from backend_app.events import deserialize_position, gps_data_event
+from backend_app.schemas_objects import gpsdata_to_dict
+
+
+class Message:
+    __slots__ = ('_topic', '_value')
+
+    def __init__(self, topic, value):
+        self._topic = topic
+        self._value = value
+
+    def topic(self):
+        return self._topic
+
+    def value(self):
+        return self._value
+
+
+def messages(count: int, units: int = 100):
+    topics = [str(uuid.uuid4()) for _ in range(units)]
+    result = []
+    for i in range(count):
+        unit = topics[i % units]
+        payload = {'uuid': unit, 'latitude': 4.6 + i * 1e-6, 'longitude': -74.08 - i * 1e-6,
+                   'height': 2600.0, 'velocity': 12.5, 'datetime': 1700000000.0 + i}
+        # Schema registry framing: magic byte and schema id before the JSON payload
+        result.append(Message(unit, b'\x00' + (1).to_bytes(4, 'big') + json.dumps(payload).encode()))
+    return result
+
+
+def dict_event(message) -> str:
+    """The original implementation, kept here as the baseline."""
+    data = deserialize_position(message)
+    return json.dumps({'status': 200, 'code': 'new data', 'units': [gpsdata_to_dict(data, None)]})
+
+
+def direct_event(message) -> str:
+    return gps_data_event(deserialize_position(message))
+
+
+def measure(path, batch) -> float:
+    start = time.perf_counter()
+    for message in batch:
+        path(message)
+    return len(batch) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=50000)
+    args = parser.parse_args()
+
+    batch = messages(args.messages)
+    decoded = [deserialize_position(message) for message in batch]
+    print(f"{args.messages} messages")
+    for name, path in [('dict + json.dumps', dict_event), ('direct encoder', direct_event)]:
+        print(f"{name:27s} {measure(path, batch):10.0f} msg/s")
+
+    # The encoding step alone, without the deserializer
+    for name, encode in [('dict + json.dumps', lambda data: json.dumps({'status': 200, 'code': 'new data', 'units': [gpsdata_to_dict(data, None)]})),
+                         ('direct encoder', gps_data_event)]:
+        print(f"{name + ' (encode)':27s} {measure(encode, decoded):10.0f} msg/s")
+
+    for mode in DECODE_MODES:
+        decoder = PositionDecoder(mode)
+        rate = measure(lambda message: gps_data_event(decoder.decode(message)), batch)
+        print(f"{'decode ' + mode + ' + encode':27s} {rate:10.0f} msg/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Standalone Kafka ingestion for the live GPS stream.
+
+    python ingest.py [--workers N] [--address HOST:PORT ...] [--group ID]
+
+Runs N consumer processes in one consumer group, which Kafka assigns the
+partitions of the unit topics, and sends the latest positions to the web
+processes. The web processes receive them when stream_config['source'] is
+'ingest'.
+
+With several web processes (gunicorn workers, say) list one address per
+process in ingest_config['addresses']: each web process listens on the
+first address no other one holds and the ingestion workers send every
+position to all of them. --address overrides the list of the workers, once
+per address. A web process started when every address is taken fails to
+start the positions.
+"""
+import argparse
+
+from backend_app.config import ingest_config
+from backend_app.ingest import run
+
+
+def parse_address(value):
+    host, _, port = value.rpartition(':')
+    try:
+        return host or '127.0.0.1', int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not HOST:PORT") from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=ingest_config['workers'],
+                        help='consumer processes, one per CPU by default')
+    parser.add_argument('--address', type=parse_address, action='append', dest='addresses', metavar='HOST:PORT',
+                        help="a web process' address, once per process; ingest_config['addresses'] by default")
+    parser.add_argument('--group', default=ingest_config['group.id'], help='consumer group of the workers')
+    args = parser.parse_args(argv)
+    run(args.workers, args.addresses, args.group)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Maintenance commands for the fleet database.
+
+    python manage.py ensure-indexes
+    python manage.py explain
+    python manage.py backfill-distance [--units ID ...] [--since YYYY-MM-DD]
+    python manage.py update-distance [--units ID ...]
+
+The API creates the indexes itself when it first connects, unless
+MONGO_ENSURE_INDEXES is off; ensure-indexes creates them ahead of a deploy
+or for such an app. explain exits with status 1 if a canonical query does
+not use an index.
+update-distance is meant to run periodically (e.g. daily from cron) to
+materialize the days closed since the last run.
+"""
+import argparse
+import sys
+from datetime import date
+
+from backend_app.db_mongo import FleetDatabase
+from backend_app.rollup import backfill_daily_distance, update_daily_distance
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db', default='fleet_db')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('ensure-indexes', help='create the indexes the queries rely on')
+    commands.add_parser('explain', help='check that the canonical queries use an index')
+
+    backfill = commands.add_parser('backfill-distance', help='rebuild the daily distance rollup')
+    backfill.add_argument('--units', nargs='+', help='vehicles to rebuild, all by default')
+    backfill.add_argument('--since', type=date.fromisoformat, help='first day to materialize')
+    backfill.add_argument('--until', type=date.fromisoformat, help='last day to materialize, yesterday by default')
+
+    update = commands.add_parser('update-distance', help='materialize the days closed since the last run')
+    update.add_argument('--units', nargs='+', help='vehicles to update, all by default')
+    update.add_argument('--until', type=date.fromisoformat, help='last day to materialize, yesterday by default')
+
+    args = parser.parse_args(argv)
+    db = FleetDatabase(args.uri, args.db, cache_size=0)
+
+    if args.command == 'ensure-indexes':
+        for name in db.ensure_indexes():
+            print(name)
+    elif args.command == 'explain':
+        plans = db.explain_queries()
+        for name, plan in plans.items():
+            status = 'covered' if plan['covered'] else 'index' if plan['uses_index'] else 'COLLECTION SCAN'
+            print(f"{name:22s} {status:16s} {' <- '.join(plan['stages'])}")
+        if not all(plan['uses_index'] for plan in plans.values()):
+            sys.exit(1)
+    elif args.command == 'backfill-distance':
+        written = backfill_daily_distance(db, args.units, args.since, args.until)
+        print(f"{written} daily distance rows written")
+    else:
+        written = update_daily_distance(db, args.units, until=args.until)
+        print(f"{written} daily distance rows written")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ import os
 from datetime import datetime, timedelta
 import random
 from faker import Faker
+import pandas as pd
 
 import pytest
 from backend_app import create_app, socketio
@@ -13,36 +14,135 @@ faker = Faker()
 class DummyCollection:
     def __init__(self, documents):
         self._docs = documents
+        self.indexes = {}
 
     def distinct(self, field):
         return sorted(list({d[field] for d in self._docs if field in d}))
 
-    def find(self, query):
-        unit_ids = query.get("unit-id", {}).get("$in", [])
-        ts_filter = query.get("timestamp", {})
+    @staticmethod
+    def _matches(doc, query):
+        for field, condition in query.items():
+            value = doc.get(field)
+            if not isinstance(condition, dict):
+                if value != condition:
+                    return False
+                continue
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if condition.get("$gte") and value < condition["$gte"]:
+                return False
+            if condition.get("$lte") and value > condition["$lte"]:
+                return False
+        return True
+
+    def find(self, query, projection=None):
         results = []
         for d in self._docs:
-            if d["unit-id"] not in unit_ids:
+            if not self._matches(d, query):
                 continue
-            if ts_filter:
-                gte = ts_filter.get("$gte")
-                lte = ts_filter.get("$lte")
-                if gte and d["timestamp"] < gte:
-                    continue
-                if lte and d["timestamp"] > lte:
-                    continue
+            if projection and any(projection.values()):
+                d = {k: v for k, v in d.items() if projection.get(k)}
+            elif projection:
+                d = {k: v for k, v in d.items() if k not in projection}
             results.append(d)
+        indexes = self.indexes
         class Cursor(list):
+            def batch_size(self, size):
+                return self
+
+            def limit(self, count):
+                return Cursor(self[:count])
+
             def sort(self, field, direction):
                 reverse = direction == -1
                 return Cursor(sorted(self, key=lambda x: x[field], reverse=reverse))
+
+            def explain(self):
+                # Any index whose first key is filtered on is used
+                for name, keys in indexes.items():
+                    if keys[0][0] in query:
+                        plan = {"stage": "IXSCAN", "indexName": name}
+                        if not projection or set(projection) - {"_id"} - {k for k, _ in keys}:
+                            plan = {"stage": "FETCH", "inputStage": plan}
+                        return {"queryPlanner": {"winningPlan": plan}}
+                return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
         return Cursor(results)
 
+    def create_index(self, keys, **kwargs):
+        name = "_".join(f"{field}_{direction}" for field, direction in keys)
+        self.indexes[name] = keys
+        return name
+
+    def insert_many(self, documents):
+        self._docs.extend(dict(d) for d in documents)
+
+    def delete_many(self, query):
+        self._docs[:] = [d for d in self._docs if not self._matches(d, query)]
+
+    def aggregate(self, pipeline):
+        """Supports the $match / $group / $sort stages used by FleetDatabase."""
+        def value(doc, expr):
+            if isinstance(expr, str) and expr.startswith("$"):
+                return doc.get(expr[1:])
+            if isinstance(expr, dict) and "$dateTrunc" in expr:
+                ts = value(doc, expr["$dateTrunc"]["date"])
+                return pd.Timestamp(ts).floor("D").to_pydatetime()
+            if isinstance(expr, dict) and "$cond" in expr:
+                test, if_true, if_false = expr["$cond"]
+                field_value = value(doc, test["$isNumber"])
+                is_number = isinstance(field_value, (int, float)) and not isinstance(field_value, bool)
+                return if_true if is_number else if_false
+            if isinstance(expr, dict):
+                return {k: value(doc, v) for k, v in expr.items()}
+            return expr
+
+        docs = list(self._docs)
+        for stage in pipeline:
+            if "$match" in stage:
+                docs = list(DummyCollection(docs).find(stage["$match"]))
+            elif "$group" in stage:
+                spec = stage["$group"]
+                groups = {}
+                for d in docs:
+                    key = value(d, spec["_id"])
+                    groups.setdefault(tuple(sorted(key.items())), []).append(d)
+                docs = []
+                for key, members in groups.items():
+                    out = {"_id": dict(key)}
+                    for name, acc in spec.items():
+                        if name == "_id":
+                            continue
+                        op, expr = next(iter(acc.items()))
+                        values = [value(d, expr) for d in members]
+                        numbers = [v for v in values if isinstance(v, (int, float))]
+                        if op == "$sum":
+                            out[name] = sum(numbers)
+                        elif op == "$avg":
+                            out[name] = sum(numbers) / len(numbers) if numbers else None
+                        elif op == "$min":
+                            out[name] = min(numbers) if numbers else None
+                        elif op == "$max":
+                            out[name] = max(numbers) if numbers else None
+                    docs.append(out)
+            elif "$sort" in stage:
+                for field, direction in reversed(list(stage["$sort"].items())):
+                    path = field.split(".")
+                    def sort_key(d, path=path):
+                        for p in path:
+                            d = d[p]
+                        return d
+                    docs.sort(key=sort_key, reverse=direction == -1)
+        return iter(docs)
+
 
 class DummyDB:
     def __init__(self, vehicle_document, var_document):
         self.fleet_vehicle_data = DummyCollection(vehicle_document)
         self.vehicles_variables = DummyCollection(var_document)
+        self._collections = {}
+
+    def __getitem__(self, name):
+        return self._collections.setdefault(name, DummyCollection([]))
 
 
 class DummyClient:
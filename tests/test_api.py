@@ -1,3 +1,9 @@
+import base64
+import subprocess
+import sys
+
+import pytest
+
 from .conftest import DummyClient, FleetDatabase
 
 def test_home(app):
@@ -18,6 +24,26 @@ def test_get_vehicles(app):
     assert set(data["data"]) == {"V1", "V2"}
 
 
+def test_indexes_created_on_first_use(app):
+    client = app[0]
+    client.get("/api/vehicles")
+    db = client.application.extensions["visualizer"].db
+    assert list(db.vehicles.indexes.values()) == [[("unit-id", 1), ("timestamp", 1)]]
+    assert list(db.vehicles_variables.indexes.values()) == [[("unit-id", 1), ("timestamp", 1)]]
+
+
+def test_plot_cache_stats(app):
+    client = app[0]
+    client.post("/api/plot/timeseries", json={"units_id": ["V1", "V2"], "field": "engine-coolant-temperature"})
+    client.post("/api/plot/timeseries", json={"units_id": ["V2", "V1"], "field": "engine-coolant-temperature"})
+    response = client.get("/api/plot/cache")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["status"] == 200
+    assert data["data"]["hits"] >= 1
+    assert data["data"]["entries"] >= 1
+
+
 def test_speed_over_time_empty(app):
     client = app[0]
     response = client.post("/api/speed-over-time", json={"units_id": ["V3"]})
@@ -646,3 +672,146 @@ def test_plot_heatmap_with_time_range(app):
     assert data["status"] == 200
     assert "data" in data
     assert isinstance(data["data"], str)
+
+
+def test_plot_json_format(app):
+    client = app[0]
+    response = client.post('/api/plot/boxplot', json={
+        "units_id": ["V1", "V2"],
+        "field": "engine-speed",
+        "format": "json"
+    })
+    data = response.get_json()
+    assert data["status"] == 200
+    assert data["data"]["unit-id"] == ["V1", "V2"]
+    assert {"q1", "median", "q3", "whisker_low", "whisker_high"} <= set(data["data"])
+
+    response = client.post('/api/daily-distance', json={"units_id": ["V1"], "format": "json"})
+    data = response.get_json()
+    assert data["status"] == 200
+    assert set(data["data"]) == {"unit-id", "date", "distance_km"}
+    assert data["data"]["date"][0] == "2023-01-01"
+
+    response = client.post('/api/plot/timeseries', json={
+        "units_id": ["V3"],
+        "field": "engine-speed",
+        "format": "json"
+    })
+    data = response.get_json()
+    assert data["status"] == 400
+    assert data["data"] == "No data available for the selected parameters."
+
+
+def test_plot_arrow_format(app):
+    pa = pytest.importorskip("pyarrow")
+    client = app[0]
+    response = client.post('/api/plot/heatmap', json={"unit_id": "V1", "format": "arrow"})
+    data = response.get_json()
+    assert data["status"] == 200
+    table = pa.ipc.open_stream(base64.b64decode(data["data"])).read_all()
+    assert table.column_names[0] == "field"
+
+
+def test_plot_unsupported_format(app):
+    client = app[0]
+    response = client.post('/api/speed-over-time', json={"units_id": ["V1"], "format": "svg"})
+    data = response.get_json()
+    assert data["status"] == 400
+    assert data["data"].startswith("Unsupported format")
+
+
+def test_create_app_defers_heavy_imports():
+    # A fresh interpreter, the test session has imported everything already
+    script = (
+        "import sys, backend_app\n"
+        "backend_app.create_app({'TESTING': True})\n"
+        "print(','.join(m for m in ('matplotlib', 'seaborn', 'pandas', 'pymongo') if m in sys.modules))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    assert output.strip() == ""
+
+
+def test_visualizer_created_per_app(app):
+    client = app[0]
+    assert "visualizer" not in client.application.extensions
+    client.get("/api/vehicles")
+    visualizer = client.application.extensions["visualizer"]
+    client.get("/api/fields")
+    assert client.application.extensions["visualizer"] is visualizer
+
+
+def test_stream_metrics(app):
+    client = app[0]
+    response = client.get("/api/stream/metrics")
+    data = response.get_json()
+    assert data["status"] == 200
+    assert data["data"]["mode"] == "strict"
+    assert {"decoded", "validated", "validation_failures", "malformed"} <= set(data["data"])
+
+
+def test_stream_metrics_from_ingest_workers(app, monkeypatch):
+    from backend_app import events
+
+    # The decoding runs in the ingestion workers, their counters are reported
+    monkeypatch.setitem(events.stream_config, "source", "ingest")
+    monkeypatch.setattr(events.listener, "stats", lambda: {"decoded": 7, "validation_failures": 1, "workers": 2})
+    data = app[0].get("/api/stream/metrics").get_json()["data"]
+    assert data == {"decoded": 7, "validation_failures": 1, "workers": 2}
+
+
+def test_positions(app, monkeypatch):
+    from backend_app import events
+    from backend_app.schemas_objects import GPSData
+    from backend_app.stream import PositionStore
+
+    store = PositionStore()
+    monkeypatch.setattr(events, "store", store)
+    started = []
+    monkeypatch.setattr(events, "start_positions", lambda: started.append(True))
+    client = app[0]
+    assert client.get("/api/positions").get_json() == {"status": 200, "data": []}
+    # Without any Socket.IO client the request starts the stream that fills the store
+    assert started
+
+    for unit, latitude in (("b", 2.0), ("a", 1.0), ("c", 3.0)):
+        store.update(unit, GPSData(unit, latitude, 0.0, 0.0, 0.0, 0.0))
+    data = client.get("/api/positions").get_json()["data"]
+    assert [position["uuid"] for position in data] == ["a", "b", "c"]
+    assert data[0] == {"uuid": "a", "latitude": 1.0, "longitude": 0.0, "height": 0.0, "velocity": 0.0, "datetime": 0.0}
+
+    # Comma separated or repeated, unknown units are left out
+    data = client.get("/api/positions?units=c,a&units=x").get_json()["data"]
+    assert [position["uuid"] for position in data] == ["a", "c"]
+    data = client.get("/api/positions?units=c&units=b").get_json()["data"]
+    assert [position["uuid"] for position in data] == ["b", "c"]
+
+
+def test_positions_spatial(app, monkeypatch):
+    from backend_app import events
+    from backend_app.schemas_objects import GPSData
+    from backend_app.spatial import SpatialIndex
+    from backend_app.stream import PositionStore
+
+    monkeypatch.setattr(events, "store", PositionStore())
+    monkeypatch.setattr(events, "index", SpatialIndex())
+    monkeypatch.setattr(events, "start_positions", lambda: None)
+    for unit, latitude, longitude in (("a", 4.60, -74.08), ("b", 4.70, -74.05), ("c", 6.25, -75.56)):
+        position = GPSData(unit, latitude, longitude, 0.0, 0.0, 0.0)
+        events.store.update(unit, position)
+        events.index.update(unit, latitude, longitude)
+    client = app[0]
+
+    data = client.get("/api/positions?bbox=4,-75,5,-74").get_json()["data"]
+    assert [position["uuid"] for position in data] == ["a", "b"]
+    data = client.get("/api/positions?bbox=4,-76,7,-74&units=b,c").get_json()["data"]
+    assert [position["uuid"] for position in data] == ["b", "c"]
+
+    # Nearest first, with the distance to the point
+    data = client.get("/api/positions?lat=4.71&lon=-74.05&radius_km=50").get_json()["data"]
+    assert [position["uuid"] for position in data] == ["b", "a"]
+    assert data[0]["distance_km"] < data[1]["distance_km"] < 50
+    data = client.get("/api/positions?lat=4.71&lon=-74.05&radius_km=500&units=c").get_json()["data"]
+    assert [position["uuid"] for position in data] == ["c"]
+
+    for query in ("bbox=1,2,3", "lat=4&lon=-74", "lat=x&lon=-74&radius_km=1", "lat=4&lon=-74&radius_km=-1"):
+        assert client.get(f"/api/positions?{query}").get_json()["status"] == 400
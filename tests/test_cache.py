@@ -0,0 +1,200 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from backend_app.cache import FrameCache, PlotCache
+from backend_app.db_mongo import FleetDatabase
+from backend_app.vehicle_data import VehicleDataVisualizer
+
+
+def test_plot_cache_key():
+    start = datetime(2023, 1, 1, 0, 0, 0, 1234)
+    key = PlotCache.key("timeseries", {"units_id": ["V2", "V1"], "field": "speed", "start_date": start, "end_date": None})
+    same = PlotCache.key("timeseries", {"end_date": None, "start_date": start.replace(microsecond=0), "field": "speed", "units_id": ["V1", "V2"]})
+    assert key == same
+    assert key != PlotCache.key("boxplot", {"units_id": ["V2", "V1"], "field": "speed", "start_date": start, "end_date": None})
+    hash(key)
+
+    utc = PlotCache.key("timeseries", {"end_date": datetime.fromisoformat("2023-01-01T12:00:00Z")})
+    east = PlotCache.key("timeseries", {"end_date": datetime.fromisoformat("2023-01-01T14:00:00+02:00")})
+    assert utc == east == PlotCache.key("timeseries", {"end_date": datetime(2023, 1, 1, 12)})
+
+
+def test_plot_cache_key_mixed_values():
+    key = PlotCache.key("timeseries", {"units_id": ["V1", 2, None, ["V3", "V2"], {"b": [1], "a": 2}]})
+    same = PlotCache.key("timeseries", {"units_id": [{"a": 2, "b": [1]}, ["V2", "V3"], None, 2, "V1"]})
+    assert key == same
+    hash(key)
+
+
+def test_cached_plot_skips_unhashable_keys(monkeypatch):
+    visualizer = VehicleDataVisualizer()
+    calls = []
+    monkeypatch.setattr(PlotCache, "key", lambda self, plot_type, params: (plot_type, bytearray(b"x")))
+    monkeypatch.setattr(PlotCache, "get", lambda self, key: calls.append(key))
+    plot = visualizer.create_box_plot(["V1", "V2"], "engine-speed")
+    assert plot != ""
+    assert calls == []
+
+
+def test_plot_cache_hits_and_misses():
+    cache = PlotCache()
+    key = PlotCache.key("timeseries", {"units_id": ["V1"]})
+    assert cache.get(key) is None
+    cache.set(key, "plot")
+    assert cache.get(key) == "plot"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["size"] == len("plot")
+    cache.clear()
+    assert cache.get(key) is None
+
+
+def test_plot_cache_ttl():
+    cache = PlotCache(ttl=10, past_ttl=1000)
+    past = PlotCache.key("timeseries", {"end_date": datetime(2023, 1, 1)})
+    future = PlotCache.key("timeseries", {"end_date": datetime.now() + timedelta(days=1)})
+    open_ended = PlotCache.key("timeseries", {"end_date": None})
+    assert cache._time_to_use(past, "", 0) == 1000
+    assert cache._time_to_use(future, "", 0) == 10
+    assert cache._time_to_use(open_ended, "", 0) == 10
+
+    # Aware end dates are compared in UTC, whatever the local time zone
+    east = timezone(timedelta(hours=14))
+    just_ended = PlotCache.key("timeseries", {"end_date": datetime.now(east) - timedelta(minutes=5)})
+    ending = PlotCache.key("timeseries", {"end_date": datetime.now(timezone.utc) + timedelta(minutes=5)})
+    assert cache._time_to_use(just_ended, "", 0) == 1000
+    assert cache._time_to_use(ending, "", 0) == 10
+
+
+def test_plot_cache_maxsize():
+    cache = PlotCache(maxsize=10)
+    cache.set(("a",), "12345")
+    cache.set(("b",), "12345")
+    cache.get(("a",))
+    cache.set(("c",), "12345")
+    # Least recently used entry evicted
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == "12345"
+    # Larger than the whole cache, not stored
+    cache.set(("d",), "x" * 11)
+    assert cache.get(("d",)) is None
+
+
+def test_visualizer_uses_plot_cache(monkeypatch):
+    visualizer = VehicleDataVisualizer()
+    plot = visualizer.create_box_plot(["V1", "V2"], "engine-speed")
+    assert plot != ""
+
+    def no_query(self, *args, **kwargs):
+        raise AssertionError("cached plots should not query the database")
+
+    monkeypatch.setattr(FleetDatabase, "get_vehicle_data", no_query)
+    assert visualizer.create_box_plot(["V2", "V1"], field="engine-speed") == plot
+    assert visualizer.plot_cache.stats()["hits"] == 1
+
+    # Empty plots are not cached
+    monkeypatch.undo()
+    assert visualizer.create_box_plot(["V3"], "engine-speed") == ""
+    assert visualizer.plot_cache.stats()["entries"] == 1
+
+
+class Fetcher:
+    """Serves rows from a fixed frame and records the requested windows."""
+    def __init__(self, frame):
+        self.frame = frame
+        self.calls = []
+
+    def __call__(self, start, end):
+        self.calls.append((start, end))
+        frame = self.frame
+        if start is not None:
+            frame = frame[frame["timestamp"] >= start]
+        if end is not None:
+            frame = frame[frame["timestamp"] <= end]
+        return frame.reset_index(drop=True) if not frame.empty else pd.DataFrame()
+
+
+def hourly_frame(start, hours):
+    return pd.DataFrame({
+        "unit-id": ["V1"] * hours,
+        "timestamp": [start + timedelta(hours=i) for i in range(hours)],
+        "speed": range(hours),
+    })
+
+
+def test_frame_cache_slices_covered_window():
+    fetch = Fetcher(hourly_frame(datetime(2023, 1, 1), 48))
+    cache = FrameCache()
+    frame = cache.get("key", datetime(2023, 1, 1), datetime(2023, 1, 2, 23), fetch)
+    assert len(frame) == 48
+
+    sliced = cache.get("key", datetime(2023, 1, 1, 6), datetime(2023, 1, 1, 11), fetch)
+    assert len(fetch.calls) == 1
+    assert list(sliced["speed"]) == list(range(6, 12))
+    assert cache.get("key", datetime(2023, 1, 1, 6, 30), datetime(2023, 1, 1, 6, 45), fetch).empty
+
+    # Starting before the cached window, or another key, fetches again
+    cache.get("key", datetime(2022, 12, 31), datetime(2023, 1, 1, 11), fetch)
+    cache.get("other", datetime(2023, 1, 1, 6), datetime(2023, 1, 1, 11), fetch)
+    assert len(fetch.calls) == 3
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 3
+
+
+def test_frame_cache_fetches_tail_of_open_window():
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    frame = hourly_frame(now - timedelta(hours=10), 10)
+    fetch = Fetcher(frame)
+    cache = FrameCache()
+    assert len(cache.get("key", now - timedelta(hours=24), None, fetch)) == 10
+
+    # New rows arrive, only the rows after the cached window are fetched
+    fetch.frame = pd.concat([frame, hourly_frame(now + timedelta(minutes=1), 1)], ignore_index=True)
+    result = cache.get("key", now - timedelta(hours=5), None, fetch)
+    assert len(fetch.calls) == 2
+    assert fetch.calls[1][0] >= now - cache.lag and fetch.calls[1][1] is None
+    assert len(result) == 6
+    assert cache.stats()["tail_fetches"] == 1
+
+
+def test_frame_cache_tail_does_not_repeat_rows():
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    # Rows stamped after the fetch are in the window but past the covered time
+    fetch = Fetcher(hourly_frame(now - timedelta(seconds=30), 2))
+    cache = FrameCache()
+    for _ in range(3):
+        assert len(cache.get("key", now - timedelta(hours=1), None, fetch)) == 2
+
+
+def test_frame_cache_tail_picks_up_late_rows():
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    frame = hourly_frame(now - timedelta(hours=2), 2)
+    fetch = Fetcher(frame)
+    cache = FrameCache(lag=120)
+    assert len(cache.get("key", now - timedelta(hours=3), None, fetch)) == 2
+
+    # Stored after the fetch with an earlier timestamp, within the lag
+    fetch.frame = pd.concat([frame, hourly_frame(now - timedelta(seconds=30), 1)], ignore_index=True)
+    assert len(cache.get("key", now - timedelta(hours=3), None, fetch)) == 3
+
+
+def test_frame_cache_returns_copies():
+    fetch = Fetcher(hourly_frame(datetime(2023, 1, 1), 48))
+    cache = FrameCache()
+    frame = cache.get("key", datetime(2023, 1, 1), datetime(2023, 1, 2, 23), fetch)
+    frame["added"] = 1
+    frame.loc[0, "speed"] = -1
+    cached = cache.get("key", datetime(2023, 1, 1), datetime(2023, 1, 2, 23), fetch)
+    assert "added" not in cached.columns
+    assert cached.loc[0, "speed"] == 0
+
+
+def test_frame_cache_maxsize():
+    fetch = Fetcher(hourly_frame(datetime(2023, 1, 1), 48))
+    cache = FrameCache(maxsize=10)
+    cache.get("key", datetime(2023, 1, 1), datetime(2023, 1, 2), fetch)
+    assert cache.stats()["entries"] == 0
+    cache.get("key", datetime(2023, 1, 1), datetime(2023, 1, 2), fetch)
+    assert len(fetch.calls) == 2
+    cache.clear()
@@ -1,8 +1,10 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import numpy as np
 import pandas as pd
 import pytest
 
-from backend_app.db_mongo import FleetDatabase
+from backend_app.cache import FrameCache
+from backend_app.db_mongo import FleetDatabase, _ColumnarFrameBuilder, _load_frame, _plan_summary
 
 from .conftest import DummyClient
 
@@ -72,3 +74,152 @@ def test_get_range_data():
     assert set(vehicles['unit-id'].unique()) == {"V1", "V2"}
     assert vehicles['timestamp'].min() >= datetime.fromisoformat(start_date)
     assert vehicles['timestamp'].max() <= datetime.fromisoformat(end_date) + timedelta(days=1) - timedelta(seconds=1)
+
+
+def test_get_vehicle_data_fields():
+    db_instance = FleetDatabase()
+    vehicles = db_instance.get_vehicle_data(["V1"], fields=["engine-speed"])
+    assert not vehicles.empty
+    assert set(vehicles.columns) == {"unit-id", "timestamp", "engine-speed"}
+
+    vehicles = db_instance.get_vehicle_data(["V1"], is_distance=True, fields=["latitude", "longitude"])
+    assert set(vehicles.columns) == {"unit-id", "timestamp", "latitude", "longitude"}
+
+
+def test_get_daily_stats():
+    db_instance = FleetDatabase()
+    stats = db_instance.get_daily_stats(["V1", "V2"], ["speed"], is_distance=True)
+    assert list(stats.columns) == ["unit-id", "date", "speed_count", "speed_mean", "speed_min", "speed_max"]
+    assert list(stats["unit-id"]) == ["V1", "V2"]
+    v1 = stats.iloc[0]
+    assert v1["date"] == datetime(2023, 1, 1).date()
+    assert v1["speed_count"] == 10
+    assert v1["speed_mean"] == 72.5
+    assert v1["speed_min"] == 50
+    assert v1["speed_max"] == 95
+
+
+def test_get_daily_stats_empty():
+    db_instance = FleetDatabase()
+    stats = db_instance.get_daily_stats(["V3"], ["vehicle-speed"])
+    assert stats.empty
+
+
+def test_load_frame_matches_dataframe():
+    basetime = datetime(2023, 1, 1)
+    documents = []
+    for i in range(50):
+        doc = {"unit-id": f"V{i % 3}", "timestamp": basetime + timedelta(minutes=i), "speed": i}
+        if i >= 20:
+            doc["rpm"] = float(i) * 10.5  # column appearing late
+        if i % 7:
+            doc["gear"] = i % 5  # column with gaps
+        if i == 40:
+            doc["speed"] = 40.5  # int column widened to float
+        documents.append(doc)
+
+    frame = _load_frame(iter(documents), batch_size=8)
+    expected = pd.DataFrame(documents)
+    assert list(frame.columns) == list(expected.columns)
+    assert frame["speed"].dtype == np.float64
+    assert frame["rpm"].isna().sum() == 20
+    assert frame["gear"].dtype == np.float64
+    assert list(frame["unit-id"]) == list(expected["unit-id"])
+    assert (pd.to_datetime(frame["timestamp"]) == expected["timestamp"]).all()
+    for column in ["speed", "rpm", "gear"]:
+        assert np.allclose(frame[column], expected[column], equal_nan=True)
+
+
+def test_load_frame_types():
+    assert _load_frame(iter([])).empty
+
+    builder = _ColumnarFrameBuilder(capacity=2)
+    builder.append([{"a": 1, "b": None, "c": "x", "d": datetime(2023, 1, 1, tzinfo=timezone.utc)}])
+    builder.append([{"a": 2, "b": None, "c": 3, "d": datetime(2023, 1, 2, tzinfo=timezone.utc)}] * 3)
+    builder.append([{"a": 3, "b": None, "c": pd.NA, "e": True}])
+    frame = builder.frame()
+    assert len(frame) == 5
+    assert frame["a"].dtype == np.int64
+    assert list(frame["a"]) == [1, 2, 2, 2, 3]
+    assert frame["b"].isna().all()
+    assert frame["c"].dtype == object
+    assert frame["c"].iloc[1] == 3
+    assert frame["d"].iloc[0] == datetime(2023, 1, 1, tzinfo=timezone.utc)
+    assert frame["d"].isna().iloc[4]
+    assert frame["e"].iloc[4] is True
+    assert frame["e"].isna().iloc[0]
+
+
+def test_ensure_indexes_and_explain():
+    db_instance = FleetDatabase()
+    plans = db_instance.explain_queries()
+    assert not any(plan["uses_index"] for plan in plans.values())
+    assert plans["vehicles"]["stages"] == ["COLLSCAN"]
+
+    names = db_instance.ensure_indexes()
+    assert len(names) == 4
+    assert "unit-id_1_timestamp_1" in names
+    plans = db_instance.explain_queries()
+    assert all(plan["uses_index"] for plan in plans.values())
+    assert plans["vehicles"]["indexes"] == ["unit-id_1_timestamp_1"]
+    assert not plans["vehicles"]["covered"]
+    assert plans["first_timestamp"]["covered"]
+
+
+def test_explain_uses_app_projection(monkeypatch):
+    db_instance = FleetDatabase()
+    projections = []
+
+    def recording(find):
+        def recording_find(query, projection=None):
+            projections.append(projection)
+            return find(query, projection)
+        return recording_find
+
+    for collection in (db_instance.vehicles, db_instance.vehicles_variables):
+        monkeypatch.setattr(collection, "find", recording(collection.find))
+    db_instance.explain_queries()
+    # The same projections as get_vehicle_data with fields
+    assert {"_id": 0, "unit-id": 1, "timestamp": 1, "latitude": 1, "longitude": 1} in projections
+    assert {"_id": 0, "unit-id": 1, "timestamp": 1, "vehicle-speed": 1} in projections
+    assert None not in projections
+
+
+def test_plan_summary_slot_based_engine():
+    explain = {"queryPlanner": {"winningPlan": {"queryPlan": {
+        "stage": "SORT_MERGE",
+        "inputStages": [
+            {"stage": "IXSCAN", "indexName": "a"},
+            {"stage": "IXSCAN", "indexName": "b"},
+        ],
+    }}}}
+    summary = _plan_summary(explain)
+    assert sorted(summary["indexes"]) == ["a", "b"]
+    assert summary["uses_index"] and summary["covered"]
+
+
+def test_get_vehicle_data_frame_cache(monkeypatch):
+    db_instance = FleetDatabase()
+    db_instance.frame_cache = FrameCache()
+    full = db_instance.get_vehicle_data(["V1", "V2"], datetime(2023, 1, 1), datetime(2023, 1, 1, 23), fields=["engine-speed"])
+
+    def no_query(self, *args, **kwargs):
+        raise AssertionError("covered windows should not query the database")
+
+    monkeypatch.setattr(FleetDatabase, "_query_vehicle_data", no_query)
+    window = db_instance.get_vehicle_data(["V2", "V1"], datetime(2023, 1, 1, 1), datetime(2023, 1, 1, 2), fields=["engine-speed"])
+    assert len(window) == 6
+    assert set(window["unit-id"]) == {"V1", "V2"}
+    assert window["timestamp"].min() >= datetime(2023, 1, 1, 1)
+    assert (window["engine-speed"].to_numpy() == full.set_index(["unit-id", "timestamp"]).loc[
+        list(zip(window["unit-id"], window["timestamp"]))]["engine-speed"].to_numpy()).all()
+
+
+def test_get_vehicle_data_frame_cache_aware_window():
+    db_instance = FleetDatabase()
+    db_instance.frame_cache = FrameCache()
+    naive = db_instance.get_vehicle_data(["V1", "V2"], datetime(2023, 1, 1, 1), datetime(2023, 1, 1, 2), fields=["engine-speed"])
+    aware = db_instance.get_vehicle_data(
+        ["V1", "V2"], datetime.fromisoformat("2023-01-01T01:00:00Z"),
+        datetime(2023, 1, 1, 4, tzinfo=timezone(timedelta(hours=2))), fields=["engine-speed"])
+    pd.testing.assert_frame_equal(aware.reset_index(drop=True), naive.reset_index(drop=True))
@@ -0,0 +1,81 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend_app.decoder import PositionDecoder
+from backend_app.schemas_objects import gpsdata_to_dict
+
+TOPIC = "0b0e5a4c-4f6d-4c55-9f5c-2d3b1c7e8a90"
+POSITION = {"uuid": TOPIC, "latitude": 4.6, "longitude": -74.08, "height": 2600.0, "velocity": 12.5, "datetime": 1.0}
+
+
+class Message:
+    def __init__(self, value, topic=TOPIC):
+        self._value = value
+        self._topic = topic
+
+    def topic(self):
+        return self._topic
+
+    def value(self):
+        return self._value
+
+
+def framed(payload):
+    return Message(b"\x00" + (1).to_bytes(4, "big") + json.dumps(payload).encode())
+
+
+INVALID = framed(dict(POSITION, latitude="north"))
+
+
+def test_strict():
+    decoder = PositionDecoder("strict")
+    assert gpsdata_to_dict(decoder.decode(framed(POSITION)), None) == POSITION
+    assert decoder.decode(INVALID) is None
+    assert decoder.decode(Message(b"\x00\x00\x00\x00\x01{not json")) is None
+    stats = decoder.stats()
+    assert (stats["decoded"], stats["validated"], stats["validation_failures"], stats["malformed"]) == (1, 1, 1, 1)
+
+
+def test_fast():
+    decoder = PositionDecoder("fast")
+    assert gpsdata_to_dict(decoder.decode(framed(POSITION)), None) == POSITION
+    # Not validated, the wrong type goes through
+    assert decoder.decode(INVALID).latitude == "north"
+    assert decoder.decode(framed({"uuid": TOPIC})) is None
+    assert decoder.decode(Message(b'{"uuid": 1}')) is None
+    assert decoder.decode(Message(None)) is None
+    stats = decoder.stats()
+    assert (stats["decoded"], stats["validated"], stats["validation_failures"], stats["malformed"]) == (2, 0, 0, 3)
+
+
+def test_sampled():
+    decoder = PositionDecoder("sampled", sample_every=3)
+    results = [decoder.decode(INVALID) for _ in range(6)]
+    # Messages 1 and 4 are validated and dropped
+    assert [result is None for result in results] == [True, False, False, True, False, False]
+    stats = decoder.stats()
+    assert (stats["decoded"], stats["validation_failures"]) == (4, 2)
+
+
+def test_sampled_concurrent():
+    decoder = PositionDecoder("sampled", sample_every=10)
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: decoder.decode(framed(POSITION)), range(1000)))
+    stats = decoder.stats()
+    # One message in sample_every validated, whatever the interleaving
+    assert (stats["decoded"], stats["validated"]) == (1000, 100)
+
+
+def test_untrusted_topics_are_strict():
+    decoder = PositionDecoder("fast", trusted_topics=["trusted"])
+    assert decoder.decode(INVALID) is None
+    assert decoder.decode(Message(INVALID.value(), "trusted")) is not None
+
+
+def test_invalid_config():
+    with pytest.raises(ValueError):
+        PositionDecoder("lenient")
+    with pytest.raises(ValueError):
+        PositionDecoder("sampled", sample_every=0)
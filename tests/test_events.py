@@ -0,0 +1,395 @@
+import json
+import time
+import uuid
+
+import pytest
+
+from backend_app import events, socketio
+from backend_app.spatial import SpatialIndex, Viewports
+from backend_app.schemas_objects import GPSData, gpsdata_moved, gpsdata_to_dict
+from backend_app.stream import CoalescingEmitter, GPSStream, PositionStore, TopicRegistry, UNIT_TOPICS, drain_latest
+
+UNITS = [str(uuid.uuid4()) for _ in range(3)]
+
+
+class FakeMessage:
+    def __init__(self, topic, value, error=None):
+        self._topic = topic
+        self._value = value
+        self._error = error
+
+    def topic(self):
+        return self._topic
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return self._error
+
+
+class FakeConsumer:
+    def __init__(self, topics):
+        self.topics = topics
+        self.messages = []
+        self.subscription = None
+        self.on_assign = None
+        self.list_calls = 0
+        self.consume_calls = []
+        self.closed = False
+
+    def subscribe(self, topics, on_assign=None):
+        self.subscription = topics
+        self.on_assign = on_assign
+
+    def list_topics(self, *args, **kwargs):
+        self.list_calls += 1
+        class Metadata:
+            topics = {topic: None for topic in self.topics}
+        return Metadata()
+
+    def consume(self, num_messages=1, timeout=-1):
+        self.consume_calls.append((num_messages, timeout))
+        batch, self.messages = self.messages[:num_messages], self.messages[num_messages:]
+        if not batch:
+            time.sleep(0.01)
+        return batch
+
+    def close(self):
+        self.closed = True
+
+
+def position(unit, latitude=1.0):
+    return {"uuid": unit, "latitude": latitude, "longitude": 2.0, "height": 0.0, "velocity": 0.0, "datetime": 0.0}
+
+
+def gps(unit, latitude=1.0):
+    return GPSData(**position(unit, latitude))
+
+
+def json_message(unit, latitude=1.0):
+    return FakeMessage(unit, json.dumps(position(unit, latitude)))
+
+
+def registry_message(unit, latitude=1.0):
+    # Schema registry framing: magic byte and schema id before the JSON payload
+    return FakeMessage(unit, b"\x00" + (1).to_bytes(4, "big") + json.dumps(position(unit, latitude)).encode())
+
+
+def make_stream(consumer, published):
+    return GPSStream(lambda: consumer, lambda message: json.loads(message.value()),
+                     lambda unit, data: published.append((unit, data)))
+
+
+def test_gps_stream_poll():
+    consumer = FakeConsumer(UNITS + ["other-topic"])
+    published = []
+    stream = make_stream(consumer, published)
+    assert sorted(stream.list_units()) == sorted(UNITS)
+
+    stream.consumer = consumer
+    consumer.messages = [json_message(UNITS[0]), FakeMessage(UNITS[1], None, error="EOF"), json_message(UNITS[2])]
+    assert stream.poll() == 2
+    assert [unit for unit, _ in published] == [UNITS[0], UNITS[2]]
+
+    # Only the latest message of a unit is deserialized
+    published.clear()
+    deserialized = []
+    stream.deserialize = lambda message: deserialized.append(message) or json.loads(message.value())
+    consumer.messages = [json_message(UNITS[0], float(i)) for i in range(10)]
+    assert stream.poll() == 1
+    assert len(deserialized) == 1
+    assert published[0][1]["latitude"] == 9.0
+
+
+def test_drain_latest():
+    consumer = FakeConsumer(UNITS)
+    consumer.messages = [json_message(UNITS[i % 3], float(i)) for i in range(2500)]
+    latest = drain_latest(consumer, max_messages=1000, time_budget=10, timeout=0.5)
+    assert list(latest) == UNITS
+    assert [json.loads(latest[unit].value())["latitude"] for unit in UNITS] == [999.0, 997.0, 998.0]
+    assert len(consumer.messages) == 1500
+    # Waits for the first messages only
+    assert consumer.consume_calls[0] == (1000, 0.5)
+
+    # Keeps consuming without waiting until nothing is left
+    consumer.consume_calls.clear()
+    consumer.messages = [json_message(UNITS[0])]
+    assert list(drain_latest(consumer, max_messages=1000)) == [UNITS[0]]
+    assert len(consumer.consume_calls) == 2
+    assert consumer.consume_calls[1] == (999, 0)
+
+    # An exhausted time budget stops after the first batch
+    consumer.consume_calls.clear()
+    consumer.messages = [json_message(UNITS[0])] * 10
+    drain_latest(consumer, max_messages=1000, time_budget=0)
+    assert len(consumer.consume_calls) == 1
+
+
+def test_topic_registry(monkeypatch):
+    topics = [UNITS[0], "other-topic"]
+    calls = []
+    registry = TopicRegistry(lambda: calls.append(1) or list(topics), refresh_interval=60)
+    assert registry.units() == {UNITS[0]}
+    topics.append(UNITS[1])
+    assert registry.units() == {UNITS[0]}
+    assert len(calls) == 1
+
+    # Rebalances add the topics of the assigned partitions
+    registry.update([UNITS[2], "other-topic"])
+    assert registry.units() == {UNITS[0], UNITS[2]}
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert registry.units() == {UNITS[0], UNITS[1]}
+    assert len(calls) == 2
+    assert registry.units(max_age=0) == {UNITS[0], UNITS[1]}
+    assert len(calls) == 3
+
+
+def test_gps_stream_start_stop():
+    consumer = FakeConsumer(UNITS)
+    published = []
+    stream = make_stream(consumer, published)
+    stream.start()
+    stream.start()
+    assert stream.running
+    assert consumer.subscription == [UNIT_TOPICS]
+
+    class Partition:
+        def __init__(self, topic):
+            self.topic = topic
+
+    consumer.topics = UNITS[:1]
+    assert stream.list_units() == UNITS[:1]
+    # New topics show up on the next rebalance without listing them
+    consumer.on_assign(consumer, [Partition(unit) for unit in UNITS])
+    assert stream.list_units() == sorted(UNITS)
+    assert consumer.list_calls == 1
+
+    consumer.messages = [json_message(unit) for unit in UNITS]
+    deadline = time.monotonic() + 5
+    while len(published) < len(UNITS) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stream.stop()
+    assert not stream.running
+    assert consumer.closed
+    assert [unit for unit, _ in published] == UNITS
+
+
+def test_deserialize_position():
+    data = events.deserialize_position(registry_message(UNITS[0], 5.0))
+    assert gpsdata_to_dict(data, None) == position(UNITS[0], 5.0)
+
+
+def test_gps_data_event():
+    data = GPSData(UNITS[0], 10.123456789, -74.5, 2600, 0.0, 1700000000.25)
+    assert not hasattr(data, "__dict__")
+    expected = {"status": 200, "code": "new data", "units": [gpsdata_to_dict(data, None)]}
+    assert events.gps_data_event(data) == json.dumps(expected)
+    data = GPSData('quote"d', float("nan"), 1e300, -0.0, True, None)
+    expected = {"status": 200, "code": "new data", "units": [gpsdata_to_dict(data, None)]}
+    assert events.gps_data_event(data) == json.dumps(expected)
+    expected = {"status": 200, "code": "new data", "units": [position(UNITS[0]), position(UNITS[1])]}
+    assert events.gps_data_event(gps(UNITS[0]), gps(UNITS[1])) == json.dumps(expected)
+
+
+def test_position_store():
+    store = PositionStore()
+    store.update(UNITS[0], 1)
+    store.update(UNITS[1], 2)
+    store.update(UNITS[0], 3)
+    assert len(store) == 2
+    assert store.snapshot() == {UNITS[0]: 3, UNITS[1]: 2}
+    assert store.snapshot([UNITS[1], UNITS[2]]) == {UNITS[1]: 2}
+    # Snapshots are copies
+    store.snapshot()[UNITS[2]] = 4
+    assert len(store) == 2
+
+
+def test_coalescing_emitter():
+    emitted = []
+    emitter = CoalescingEmitter(lambda batch: emitted.append({unit: data["latitude"] for unit, data in batch.items()}),
+                                keyframe_every=3)
+    emitter.update(UNITS[0], position(UNITS[0], 1.0))
+    emitter.update(UNITS[0], position(UNITS[0], 2.0))
+    emitter.update(UNITS[1], position(UNITS[1], 1.0))
+    # Only the latest position of each unit is sent, in one batch per tick
+    assert emitter.flush() == 2
+    assert emitted == [{UNITS[0]: 2.0, UNITS[1]: 1.0}]
+
+    # Units that did not move are not sent again, a new timestamp alone is not a move
+    emitted.clear()
+    stationary = dict(position(UNITS[1], 1.0), datetime=1.0)
+    emitter.update(UNITS[1], stationary)
+    emitter.update(UNITS[0], position(UNITS[0], 3.0))
+    assert emitter.flush() == 1
+    assert emitted == [{UNITS[0]: 3.0}]
+
+    # Keyframes send every unit, nothing is emitted without positions
+    emitted.clear()
+    assert emitter.flush() == 2
+    assert emitted == [{UNITS[0]: 3.0, UNITS[1]: 1.0}]
+    emitted.clear()
+    assert emitter.flush() == 0
+    assert emitted == []
+
+
+def test_coalescing_emitter_ticks():
+    emitted = []
+    emitter = CoalescingEmitter(lambda batch: emitted.extend(batch), tick_hz=50)
+    emitter.start()
+    emitter.update(UNITS[0], position(UNITS[0]))
+    deadline = time.monotonic() + 5
+    while not emitted and time.monotonic() < deadline:
+        time.sleep(0.01)
+    emitter.stop()
+    assert not emitter.running
+    assert emitted == [UNITS[0]]
+
+
+@pytest.fixture
+def fake_stream(monkeypatch):
+    consumer = FakeConsumer(UNITS)
+    emitter = CoalescingEmitter(events.emit_positions, tick_hz=50, moved=gpsdata_moved)
+    stream = GPSStream(lambda: consumer, events.deserialize_position, events.publish_position)
+    monkeypatch.setattr(events, "emitter", emitter)
+    monkeypatch.setattr(events, "store", PositionStore())
+    monkeypatch.setattr(events, "index", SpatialIndex())
+    monkeypatch.setattr(events, "viewports", Viewports())
+    monkeypatch.setattr(events, "stream", stream)
+    yield stream
+    stream.stop()
+    emitter.stop()
+
+
+def gps_units(client):
+    return [unit["uuid"] for message in client.get_received() if message["name"] == "gps data"
+            for unit in json.loads(message["args"][0])["units"]]
+
+
+def test_subscribe_rooms(flask_app, fake_stream):
+    app, _ = flask_app
+    first = socketio.test_client(app)
+    second = socketio.test_client(app)
+    assert fake_stream.running
+    assert events.emitter.running
+
+    units = json.loads(first.get_received()[0]["args"][0]["data"])
+    assert sorted(unit["unit"] for unit in units["units"]) == sorted(UNITS)
+    second.get_received()
+    # Topics are listed once for every client
+    assert fake_stream.consumer.list_calls == 1
+
+    first.emit("subscribe", json.dumps({"units": [UNITS[0], UNITS[1]]}))
+    second.emit("subscribe", json.dumps({"units": [UNITS[1]]}))
+    assert "subscribed" in first.get_received()[0]["args"][0]
+    second.get_received()
+
+    events.emit_positions({unit: gps(unit) for unit in UNITS[:3]})
+    assert gps_units(first) == [UNITS[0], UNITS[1]]
+    assert gps_units(second) == [UNITS[1]]
+
+    # A new subscription replaces the previous one
+    first.emit("subscribe", json.dumps({"units": [UNITS[2], "not-a-unit"]}))
+    received = first.get_received()
+    assert "non existing units" in received[0]["args"][0]
+    events.emit_positions({UNITS[0]: gps(UNITS[0]), UNITS[2]: gps(UNITS[2])})
+    assert gps_units(first) == [UNITS[2]]
+
+    # One client leaving does not stop the stream for the others
+    first.disconnect()
+    assert fake_stream.running
+    events.emit_positions({UNITS[1]: gps(UNITS[1])})
+    assert gps_units(second) == [UNITS[1]]
+
+    # From Kafka to the room on the next tick
+    fake_stream.consumer.messages = [registry_message(UNITS[1], 7.0), registry_message(UNITS[2], 7.0)]
+    received = []
+    deadline = time.monotonic() + 5
+    while not received and time.monotonic() < deadline:
+        time.sleep(0.02)
+        received = gps_units(second)
+    assert received == [UNITS[1]]
+    second.disconnect()
+
+
+def test_subscribe_snapshot(flask_app, fake_stream):
+    app, _ = flask_app
+    client = socketio.test_client(app)
+    fake_stream.consumer.messages = [registry_message(UNITS[0], 4.0), registry_message(UNITS[1], 5.0)]
+    deadline = time.monotonic() + 5
+    while len(events.store) < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    client.get_received()
+
+    # The known positions are sent with the subscription, without waiting for an update
+    client.emit("subscribe", json.dumps({"units": [UNITS[0], UNITS[1], UNITS[2]]}))
+    received = client.get_received()
+    assert "subscribed" in received[0]["args"][0]
+    snapshot = [message for message in received if message["name"] == "gps data"]
+    assert len(snapshot) == 1
+    assert json.loads(snapshot[0]["args"][0])["units"] == [position(UNITS[0], 4.0), position(UNITS[1], 5.0)]
+    client.disconnect()
+
+
+def test_subscribe_bbox(flask_app, fake_stream):
+    app, _ = flask_app
+    client = socketio.test_client(app)
+    other = socketio.test_client(app)
+    # UNITS[0] and UNITS[1] are near Bogota, UNITS[2] in Madrid
+    for unit, latitude, longitude in ((UNITS[0], 4.6, -74.1), (UNITS[1], 4.7, -74.0), (UNITS[2], 40.4, -3.7)):
+        events.publish_position(unit, GPSData(unit, latitude, longitude, 0.0, 0.0, 0.0))
+    client.get_received()
+    other.get_received()
+
+    client.emit("subscribe", json.dumps({"bbox": [4, "west", 5, -73]}))
+    assert "invalid bounding box" in client.get_received()[0]["args"][0]
+
+    # The units inside the box are sent with the subscription, then as they are emitted
+    client.emit("subscribe", json.dumps({"units": [UNITS[2]], "bbox": [4, -75, 5, -73]}))
+    received = client.get_received()
+    assert "subscribed" in received[0]["args"][0]
+    assert [unit["uuid"] for unit in json.loads(received[1]["args"][0])["units"]] == [UNITS[2], *sorted(UNITS[:2])]
+    other.emit("subscribe", json.dumps({"units": [UNITS[0]]}))
+    other.get_received()
+
+    events.emit_positions({unit: GPSData(unit, latitude, longitude, 0.0, 0.0, 0.0) for unit, latitude, longitude
+                           in ((UNITS[0], 4.6, -74.1), (UNITS[1], 6.0, -74.0), (UNITS[2], 40.4, -3.7))})
+    # UNITS[1] left the box, UNITS[2] is subscribed by id
+    assert gps_units(client) == [UNITS[0], UNITS[2]]
+    assert gps_units(other) == [UNITS[0]]
+
+    # A subscription without a box stops the bounding box updates, and so does disconnecting
+    client.emit("subscribe", json.dumps({"units": [UNITS[2]]}))
+    client.get_received()
+    assert len(events.viewports) == 0
+    events.emit_positions({UNITS[0]: GPSData(UNITS[0], 4.6, -74.1, 0.0, 0.0, 0.0)})
+    assert gps_units(client) == []
+    other.emit("subscribe", json.dumps({"bbox": [-90, -180, 90, 180]}))
+    assert len(events.viewports) == 1
+    other.disconnect()
+    assert len(events.viewports) == 0
+    client.disconnect()
+
+
+def test_emit_positions_batches_per_client(flask_app, fake_stream):
+    app, _ = flask_app
+    first = socketio.test_client(app)
+    second = socketio.test_client(app)
+    first.emit("subscribe", json.dumps({"units": [UNITS[0], UNITS[1]]}))
+    second.emit("subscribe", json.dumps({"units": [UNITS[1]]}))
+    first.get_received()
+    second.get_received()
+
+    # One event per client per tick with every position it subscribed to, flushed here instead of on the ticks
+    events.emitter.stop()
+    events.emitter.update(UNITS[0], gps(UNITS[0]))
+    events.emitter.update(UNITS[1], gps(UNITS[1]))
+    events.emitter.update(UNITS[2], gps(UNITS[2]))
+    assert events.emitter.flush() == 3
+    received = [json.loads(message["args"][0])["units"] for message in first.get_received() if message["name"] == "gps data"]
+    assert received == [[position(UNITS[0]), position(UNITS[1])]]
+    assert gps_units(second) == [UNITS[1]]
+    first.disconnect()
+    second.disconnect()
@@ -0,0 +1,47 @@
+import base64
+import math
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from backend_app.formats import check_format, encode_frame, to_columns
+
+
+def test_check_format():
+    assert check_format("png") is None
+    assert check_format("json") is None
+    assert "Unsupported format" in check_format("svg")
+
+
+def test_to_columns():
+    frame = pd.DataFrame({
+        "unit-id": ["V1", "V2"],
+        "timestamp": [datetime(2023, 1, 1, 0, 30), pd.NaT],
+        "date": [date(2023, 1, 1), date(2023, 1, 2)],
+        "value": [1.5, float("nan")],
+        "missing": pd.Series([pd.NA, 2], dtype="object"),
+        "outliers": [[1.0, float("nan")], []],
+    })
+    columns = to_columns(frame)
+    assert columns == {
+        "unit-id": ["V1", "V2"],
+        "timestamp": ["2023-01-01T00:30:00", None],
+        "date": ["2023-01-01", "2023-01-02"],
+        "value": [1.5, None],
+        "missing": [None, 2],
+        "outliers": [[1.0, None], []],
+    }
+
+
+def test_encode_frame_empty():
+    assert encode_frame(pd.DataFrame(), "json") == ""
+
+
+def test_encode_frame_arrow():
+    pa = pytest.importorskip("pyarrow")
+    frame = pd.DataFrame({"unit-id": ["V1", "V1"], "bin_start": [0.0, 1.0], "count": [3, 4]})
+    encoded = encode_frame(frame, "arrow")
+    table = pa.ipc.open_stream(base64.b64decode(encoded)).read_all()
+    assert table.column_names == ["unit-id", "bin_start", "count"]
+    assert table.to_pydict()["count"] == [3, 4]
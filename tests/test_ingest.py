@@ -0,0 +1,160 @@
+import socket
+import time
+
+import pytest
+
+from backend_app import events, ingest
+from backend_app.decoder import PositionDecoder
+from backend_app.ingest import (PositionListener, _send_all, decode_datagram, encode_datagrams, encode_stats,
+                                forward, ingest_consumer_config)
+from backend_app.schemas_objects import GPSData, gpsdata_to_dict
+from tests.test_events import UNITS, FakeConsumer, FakeMessage, gps, position, registry_message
+
+
+def test_ingest_consumer_config():
+    # The workers share the partitions of one group
+    assert ingest_consumer_config("gps_ingest")["group.id"] == "gps_ingest"
+    assert ingest_consumer_config("gps_ingest")["auto.offset.reset"] == "latest"
+    # Each unit topic has one partition, the range assignor would give all of them to one worker
+    assert ingest_consumer_config("gps_ingest")["partition.assignment.strategy"] == "cooperative-sticky"
+
+
+def test_datagrams_round_trip():
+    positions = [(unit, gps(unit, latitude)) for latitude, unit in enumerate(UNITS)]
+    datagrams = list(encode_datagrams(positions))
+    assert len(datagrams) == 1
+    assert [(topic, gpsdata_to_dict(p, None)) for topic, p in decode_datagram(datagrams[0])] == \
+        [(unit, position(unit, latitude)) for latitude, unit in enumerate(UNITS)]
+
+    # Positions are split across datagrams, never within one
+    datagrams = list(encode_datagrams(positions * 10, max_size=300))
+    assert len(datagrams) > 1
+    assert all(len(datagram) <= 300 for datagram in datagrams)
+    assert sum(len(decode_datagram(datagram)) for datagram in datagrams) == 30
+
+
+def test_forward():
+    consumer = FakeConsumer(UNITS)
+    consumer.messages = [registry_message(UNITS[0], 1.0), registry_message(UNITS[1], 1.0),
+                         registry_message(UNITS[0], 2.0), FakeMessage(UNITS[2], b"not json")]
+    sent = []
+    assert forward(consumer, PositionDecoder("fast"), sent.append) == 2
+    assert len(sent) == 1
+    assert [(topic, gpsdata_to_dict(p, None)) for topic, p in decode_datagram(sent[0])] == \
+        [(UNITS[0], position(UNITS[0], 2.0)), (UNITS[1], position(UNITS[1], 1.0))]
+
+    assert forward(consumer, PositionDecoder("fast"), sent.append, timeout=0) == 0
+    assert len(sent) == 1
+
+
+def test_position_listener():
+    published = []
+    listener = PositionListener([("127.0.0.1", 0)], lambda unit, data: published.append((unit, data)), timeout=0.05)
+    listener.start()
+    assert listener.running
+    try:
+        address = listener.socket.getsockname()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender.sendto(b"garbage", address)
+        # Published under the topic, whatever the uuid of the payload says
+        spoofed = GPSData(UNITS[2], 5.0, 2.0, 0.0, 0.0, 0.0)
+        anonymous = GPSData(None, 6.0, 2.0, 0.0, 0.0, 0.0)
+        for datagram in encode_datagrams([(UNITS[0], gps(UNITS[0])), (UNITS[1], gps(UNITS[1], 3.0)),
+                                          (UNITS[1], spoofed), (UNITS[0], anonymous)]):
+            sender.sendto(datagram, address)
+        sender.close()
+        deadline = time.monotonic() + 2
+        while len(published) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        listener.stop()
+    assert not listener.running
+    assert listener.socket is None
+    assert [(unit, data.latitude) for unit, data in published] == \
+        [(UNITS[0], 1.0), (UNITS[1], 3.0), (UNITS[1], 5.0), (UNITS[0], 6.0)]
+
+
+def test_position_listener_stats(monkeypatch):
+    listener = PositionListener([("127.0.0.1", 0)], lambda unit, data: None, timeout=0.05)
+    assert listener.stats()["workers"] == 0
+    listener.start()
+    try:
+        address = listener.socket.getsockname()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        decoder = PositionDecoder("sampled", sample_every=2)
+        decoder.decode(registry_message(UNITS[0]))
+        decoder.decode(FakeMessage(UNITS[1], b"not json"))
+        # Counters are cumulative, a worker's latest report replaces its previous one
+        sender.sendto(encode_stats({"decoded": 5, "validated": 5, "validation_failures": 0, "malformed": 0,
+                                    "mode": "sampled", "sample_every": 2}, 1), address)
+        sender.sendto(encode_stats(decoder.stats(), 1), address)
+        sender.sendto(encode_stats(dict(decoder.stats(), validation_failures=3), 2), address)
+        sender.close()
+        deadline = time.monotonic() + 2
+        while listener.stats()["workers"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        listener.stop()
+    assert listener.stats() == {"decoded": 2, "validated": 2, "validation_failures": 3, "malformed": 2,
+                                "mode": "sampled", "sample_every": 2, "workers": 2}
+
+    # A restarted worker replaces the report of its index, stopped workers expire
+    listener._worker_stats[1] = (time.monotonic(), dict(decoder.stats(), decoded=10))
+    assert listener.stats()["decoded"] == 11
+    monkeypatch.setattr(ingest, "STATS_TTL", 0.0)
+    assert listener.stats()["workers"] == 0
+
+
+def test_position_listener_binds_a_free_address():
+    first = PositionListener([("127.0.0.1", 0)], lambda unit, data: None, timeout=0.05)
+    first.start()
+    try:
+        # Each web process takes the next address the workers send to
+        second = PositionListener([first.address, ("127.0.0.1", 0)], lambda unit, data: None, timeout=0.05)
+        second.start()
+        try:
+            assert second.address != first.address
+            third = PositionListener([first.address, second.address], lambda unit, data: None)
+            with pytest.raises(OSError):
+                third.start()
+        finally:
+            second.stop()
+    finally:
+        first.stop()
+    assert first.address is None
+
+
+def test_send_all():
+    listeners = [PositionListener([("127.0.0.1", 0)], lambda unit, data: None, timeout=0.05) for _ in range(2)]
+    for listener in listeners:
+        listener.start()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        _send_all(sender, [listener.address for listener in listeners])(encode_stats({"decoded": 1}, 0))
+        deadline = time.monotonic() + 2
+        while any(listener.stats()["workers"] < 1 for listener in listeners) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        sender.close()
+        for listener in listeners:
+            listener.stop()
+    assert [listener.stats()["decoded"] for listener in listeners] == [1, 1]
+
+
+def test_start_positions_from_ingest(monkeypatch):
+    started = []
+
+    class Fake:
+        def __init__(self, name):
+            self.name = name
+
+        def start(self, start_task):
+            started.append(self.name)
+
+    monkeypatch.setattr(events, "emitter", Fake("emitter"))
+    monkeypatch.setattr(events, "stream", Fake("stream"))
+    monkeypatch.setattr(events, "listener", Fake("listener"))
+    events.start_positions()
+    monkeypatch.setitem(events.stream_config, "source", "ingest")
+    events.start_positions()
+    assert started == ["emitter", "stream", "emitter", "listener"]
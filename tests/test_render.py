@@ -0,0 +1,73 @@
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from backend_app.render import PlotRenderer, render_png
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+SPECS = {
+    "lines": {
+        "kind": "lines",
+        "series": [{"label": "Unit V1", "x": np.array([datetime(2023, 1, 1) + timedelta(minutes=i) for i in range(5)]),
+                    "y": np.arange(5.0)}],
+        "title": "Lines", "xlabel": "Time", "ylabel": "Value",
+    },
+    "histograms": {
+        "kind": "histograms", "title": "Histograms",
+        "panels": [{"values": np.arange(10.0), "color": "skyblue", "title": "A", "xlabel": "x", "ylabel": "y"},
+                   {"values": np.arange(10.0), "color": "salmon", "title": "B", "xlabel": "x", "ylabel": "y"}],
+    },
+    "binned": {
+        "kind": "binned",
+        "series": [{"label": "Unit V1", "edges": np.array([0.0, 1.0, 2.0]), "counts": np.array([3, 4])}],
+        "title": "Binned", "xlabel": "Value", "ylabel": "Frequency",
+    },
+    "box": {
+        "kind": "box",
+        "stats": [{"label": "Unit V1", "whislo": 0.0, "q1": 1.0, "med": 2.0, "q3": 3.0, "whishi": 4.0, "fliers": [9.0]}],
+        "title": "Box", "ylabel": "Value",
+    },
+    "scatter": {
+        "kind": "scatter",
+        "series": [{"label": "Unit V1", "x": np.arange(5.0), "y": np.arange(5.0)}],
+        "title": "Scatter", "xlabel": "x", "ylabel": "y",
+    },
+    "heatmap": {
+        "kind": "heatmap", "matrix": np.eye(3), "labels": ["a", "b", "c"],
+        "title": "Heatmap", "colorbar_label": "Correlation",
+    },
+}
+
+
+@pytest.mark.parametrize("kind", SPECS)
+def test_render_png(kind):
+    assert base64.b64decode(render_png(SPECS[kind])).startswith(PNG_SIGNATURE)
+
+
+def test_render_png_threads():
+    # Figures are not registered with pyplot, threads do not share them
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        images = list(pool.map(render_png, [SPECS[kind] for kind in SPECS] * 2))
+    assert all(base64.b64decode(image).startswith(PNG_SIGNATURE) for image in images)
+    assert plt.get_fignums() == []
+
+
+def test_plot_renderer_inline():
+    renderer = PlotRenderer(workers=0)
+    assert base64.b64decode(renderer.render(SPECS["box"])).startswith(PNG_SIGNATURE)
+    assert renderer._pool is None
+
+
+def test_plot_renderer_pool():
+    renderer = PlotRenderer(workers=1)
+    try:
+        assert base64.b64decode(renderer.render(SPECS["heatmap"])).startswith(PNG_SIGNATURE)
+        assert renderer._pool is not None
+    finally:
+        renderer.shutdown()
+    assert renderer._pool is None
@@ -0,0 +1,123 @@
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from backend_app.db_mongo import FleetDatabase
+from backend_app.rollup import (daily_distance, read_daily_distance, update_daily_distance,
+                                backfill_daily_distance)
+
+
+def raw_daily_distance(db, units, start=None, end=None):
+    return daily_distance(db.get_vehicle_data(units, start, end, True))
+
+
+def tag_rollup(db, unit_id, day):
+    tagged = pd.DataFrame({"unit-id": [unit_id], "date": [day], "distance_km": [123.0]})
+    db.save_daily_distance([unit_id], day, day, tagged)
+
+
+def test_update_daily_distance():
+    db = FleetDatabase()
+    written = update_daily_distance(db, until=date(2023, 1, 1))
+    assert written == 2
+    assert db.get_rollup_watermarks(["V1", "V2", "V3"]) == {"V1": date(2023, 1, 1), "V2": date(2023, 1, 1)}
+
+    rollup = db.get_daily_distance(["V1", "V2"])
+    expected = raw_daily_distance(db, ["V1", "V2"])
+    assert list(rollup["unit-id"]) == list(expected["unit-id"])
+    assert list(rollup["date"]) == list(expected["date"])
+    assert np.allclose(rollup["distance_km"], expected["distance_km"])
+
+    # Nothing left to materialize
+    assert update_daily_distance(db, until=date(2023, 1, 1)) == 0
+    assert update_daily_distance(db, ["V3"], until=date(2023, 1, 1)) == 0
+
+
+def test_read_daily_distance_uses_rollup(monkeypatch):
+    db = FleetDatabase()
+    update_daily_distance(db, ["V1"], until=date(2023, 1, 1))
+    # Tag the materialized value to tell where the result comes from
+    tag_rollup(db, "V1", date(2023, 1, 1))
+
+    calls = []
+    get_vehicle_data = FleetDatabase.get_vehicle_data
+
+    def counting_get_vehicle_data(self, units, start=None, end=None, *args, **kwargs):
+        calls.append((units, start, end))
+        return get_vehicle_data(self, units, start, end, *args, **kwargs)
+
+    monkeypatch.setattr(FleetDatabase, "get_vehicle_data", counting_get_vehicle_data)
+
+    distance = read_daily_distance(db, ["V1", "V2"])
+    assert list(distance["unit-id"]) == ["V1", "V2"]
+    assert distance.iloc[0]["distance_km"] == 123.0
+    # V1 only reads raw points after its watermark, V2 reads the whole window
+    assert (["V1"], datetime(2023, 1, 2), None) in calls
+    assert (["V2"], None, None) in calls
+
+    # A window starting in the middle of a closed day reads that day from the raw points
+    calls.clear()
+    start = datetime(2023, 1, 1, 2, 0)
+    distance = read_daily_distance(db, ["V1"], start, datetime(2023, 1, 1, 23, 59, 59))
+    assert len(calls) == 1
+    expected = raw_daily_distance(db, ["V1"], start)
+    assert np.isclose(distance.iloc[0]["distance_km"], expected.iloc[0]["distance_km"])
+
+
+def test_read_daily_distance_aware_window():
+    db = FleetDatabase()
+    update_daily_distance(db, ["V1"], until=date(2023, 1, 1))
+    tag_rollup(db, "V1", date(2023, 1, 1))
+
+    # The whole UTC day 2023-01-01, given as UTC and as UTC+2
+    for start, end in [
+        (datetime.fromisoformat("2023-01-01T00:00:00Z"), datetime.fromisoformat("2023-01-01T23:59:59Z")),
+        (datetime(2023, 1, 1, 2, tzinfo=timezone(timedelta(hours=2))),
+         datetime(2023, 1, 2, 1, 59, 59, tzinfo=timezone(timedelta(hours=2)))),
+    ]:
+        distance = read_daily_distance(db, ["V1"], start, end)
+        assert list(distance["date"]) == [date(2023, 1, 1)]
+        assert distance.iloc[0]["distance_km"] == 123.0
+
+    # Starting mid-day the day is read from the raw points
+    start = datetime.fromisoformat("2023-01-01T02:00:00+00:00")
+    distance = read_daily_distance(db, ["V1"], start, datetime.fromisoformat("2023-01-01T23:59:59Z"))
+    expected = raw_daily_distance(db, ["V1"], datetime(2023, 1, 1, 2))
+    assert np.isclose(distance.iloc[0]["distance_km"], expected.iloc[0]["distance_km"])
+
+
+def test_read_daily_distance_empty():
+    db = FleetDatabase()
+    assert read_daily_distance(db, ["V3"]).empty
+    update_daily_distance(db, ["V1"], until=date(2023, 1, 1))
+    assert read_daily_distance(db, ["V1"], datetime(2100, 1, 1), datetime(2100, 1, 2)).empty
+
+
+def test_backfill_daily_distance():
+    db = FleetDatabase()
+    update_daily_distance(db, until=date(2023, 1, 1))
+    tag_rollup(db, "V1", date(2023, 1, 1))
+
+    written = backfill_daily_distance(db, since=date(2022, 12, 31), until=date(2023, 1, 2))
+    assert written == 2
+    assert db.get_rollup_watermarks(["V1", "V2"]) == {"V1": date(2023, 1, 2), "V2": date(2023, 1, 2)}
+    rollup = db.get_daily_distance(["V1", "V2"])
+    assert 123.0 not in list(rollup["distance_km"])
+
+
+def test_read_daily_distance_before_backfill_start():
+    db = FleetDatabase()
+    # The GPS points are on 2023-01-01, the backfill starts the day after
+    backfill_daily_distance(db, since=date(2023, 1, 2), until=date(2023, 1, 2))
+    assert db.get_rollup_ranges(["V1"]) == {"V1": (date(2023, 1, 2), date(2023, 1, 2))}
+
+    distance = read_daily_distance(db, ["V1", "V2"])
+    expected = raw_daily_distance(db, ["V1", "V2"])
+    assert list(distance["date"]) == [date(2023, 1, 1)] * 2
+    assert np.allclose(distance["distance_km"], expected["distance_km"])
+    assert not read_daily_distance(db, ["V1"], datetime(2023, 1, 1), datetime(2023, 1, 3)).empty
+
+    # Updates keep the first materialized day
+    update_daily_distance(db, ["V1"], until=date(2023, 1, 3))
+    assert db.get_rollup_ranges(["V1"]) == {"V1": (date(2023, 1, 2), date(2023, 1, 3))}
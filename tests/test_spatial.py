@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from backend_app.spatial import SpatialIndex, Viewports, bbox_contains, parse_bbox, radius_bbox
+from backend_app.utils import geodesic_km
+
+
+def test_parse_bbox():
+    assert parse_bbox([4, -75, 5, -74]) == (4.0, -75.0, 5.0, -74.0)
+    assert parse_bbox("4,-75,5,-74") == (4.0, -75.0, 5.0, -74.0)
+    # Across the antimeridian
+    assert parse_bbox([0, 170, 10, -170]) == (0.0, 170.0, 10.0, -170.0)
+    for values in ([1, 2, 3], "a,b,c,d", None, [5, 0, 4, 1], [0, -181, 1, 0], [-91, 0, 0, 1]):
+        with pytest.raises(ValueError):
+            parse_bbox(values)
+
+
+def test_bbox_contains():
+    assert bbox_contains((4, -75, 5, -74), 4.5, -74.5)
+    assert not bbox_contains((4, -75, 5, -74), 5.5, -74.5)
+    assert not bbox_contains((4, -75, 5, -74), 4.5, -73.5)
+    assert bbox_contains((0, 170, 10, -170), 5, 179)
+    assert bbox_contains((0, 170, 10, -170), 5, -175)
+    assert not bbox_contains((0, 170, 10, -170), 5, 0)
+
+
+def test_radius_bbox():
+    south, west, north, east = radius_bbox(4.6, -74.1, 10)
+    assert south < 4.6 < north and west < -74.1 < east
+    # The box holds the points at the radius in every direction
+    assert geodesic_km((4.6, -74.1), (north, -74.1)) == pytest.approx(10, rel=1e-3)
+    assert geodesic_km((4.6, -74.1), (4.6, east)) >= 10 * (1 - 1e-3)
+    # Wraps around the antimeridian and covers every longitude around a pole
+    south, west, north, east = radius_bbox(0, 179.99, 10)
+    assert west > east
+    assert radius_bbox(89.99, 0, 10)[1:4:2] == (-180.0, 180.0)
+
+
+def test_spatial_index_moves():
+    index = SpatialIndex(cell_deg=1.0)
+    index.update("a", 4.5, -74.5)
+    index.update("b", 4.6, -74.4)
+    index.update("c", 40.0, 3.0)
+    assert len(index) == 3
+    assert index.within_bbox((4, -75, 5, -74)) == ["a", "b"]
+
+    index.update("a", 40.1, 3.1)
+    assert index.within_bbox((4, -75, 5, -74)) == ["b"]
+    assert index.within_bbox((39, 2, 41, 4)) == ["a", "c"]
+
+    index.remove("c")
+    index.update("b", None, None)
+    assert len(index) == 1
+    assert index.within_bbox((-90, -180, 90, 180)) == ["a"]
+    # Empty cells are dropped
+    assert len(index._cells) == 1
+
+
+def test_spatial_index_queries_match_brute_force():
+    rng = np.random.default_rng(3)
+    latitudes = rng.uniform(-80, 80, 2000)
+    longitudes = rng.uniform(-180, 180, 2000)
+    index = SpatialIndex()
+    for i, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+        index.update(str(i), latitude, longitude)
+
+    for bbox in ((-10, -20, 10, 20), (30, 150, 60, -150), (-90, -180, 90, 180)):
+        expected = sorted(str(i) for i in range(2000) if bbox_contains(bbox, latitudes[i], longitudes[i]))
+        assert index.within_bbox(bbox) == expected
+
+    for latitude, longitude, radius in ((0, 0, 1500), (10, 179.5, 800), (-75, 20, 2000), (45, -90, 0)):
+        result = index.within_radius(latitude, longitude, radius)
+        distances = [geodesic_km((latitude, longitude), point) for point in zip(latitudes, longitudes)]
+        expected = sorted(str(i) for i, distance in enumerate(distances) if distance <= radius)
+        assert sorted(unit for unit, _ in result) == expected
+        assert [distance for _, distance in result] == sorted(distance for _, distance in result)
+        for unit, distance in result:
+            assert distance == pytest.approx(distances[int(unit)])
+
+
+def test_viewports():
+    viewports = Viewports()
+    viewports.set("first", (4, -75, 5, -74))
+    viewports.set("second", (0, -80, 10, -70))
+    assert viewports.containing(4.5, -74.5) == ["first", "second"]
+    assert viewports.containing(8, -72) == ["second"]
+    assert viewports.containing(None, None) == []
+    viewports.set("second", None)
+    assert len(viewports) == 1
+    assert viewports.get("first") == (4, -75, 5, -74)
@@ -1,6 +1,10 @@
 import math
+from datetime import datetime, timedelta, timezone
 
-from backend_app.utils import is_valid_uuid, geodesic_km, get_color_palette
+import numpy as np
+
+from backend_app.utils import (is_valid_uuid, geodesic_km, get_color_palette, haversine_km,
+                               segment_distances_km, path_length_km, lttb_indices, to_naive_utc)
 
 
 def test_is_valid_uuid():
@@ -17,6 +21,48 @@ def test_geodesic_km():
     assert math.isclose(geodesic_km((0, 0), (0, 1)), 111.32, rel_tol=1e-2)
 
 
+def test_haversine_km_matches_geodesic_km():
+    points_a = np.array([(0, 0), (0, 0), (10.5, -3.2), (np.nan, 1)])
+    points_b = np.array([(0, 0), (1, 0), (11.0, -3.0), (0, 1)])
+    distances = haversine_km(points_a, points_b)
+    assert distances.shape == (4,)
+    for i in range(3):
+        assert math.isclose(distances[i], geodesic_km(tuple(points_a[i]), tuple(points_b[i])), abs_tol=1e-9)
+    assert np.isnan(distances[3])
+
+
+def test_segment_distances_km():
+    assert segment_distances_km([], []).shape == (0,)
+    assert segment_distances_km([0.0], [0.0]).shape == (0,)
+    segments = segment_distances_km([0, 0, np.nan, 0], [0, 1, 1, 2])
+    assert segments.shape == (3,)
+    assert math.isclose(segments[0], geodesic_km((0, 0), (0, 1)))
+    assert np.isnan(segments[1]) and np.isnan(segments[2])
+
+
+def test_path_length_km():
+    lat = [0, 0, 0, np.nan]
+    lon = [0, 1, 2, 3]
+    one_degree = geodesic_km((0, 0), (0, 1))
+    assert math.isclose(path_length_km(lat, lon), 2 * one_degree)
+    cumulative = path_length_km(lat, lon, cumulative=True)
+    assert np.allclose(cumulative, [0, one_degree, 2 * one_degree, 2 * one_degree])
+
+
+def test_lttb_indices():
+    x = np.arange(10)
+    y = np.array([0, 0, 0, 9, 0, 0, 0, 0, -5, 0])
+    # The spikes survive, the endpoints are always kept
+    assert list(lttb_indices(x, y, 4)) == [0, 3, 8, 9]
+
+    x = np.arange(100000)
+    indices = lttb_indices(x, np.sin(x / 500), 1200)
+    assert len(indices) == 1200
+    assert np.all(np.diff(indices) > 0)
+
+    assert list(lttb_indices(x[:5], x[:5], 10)) == [0, 1, 2, 3, 4]
+
+
 def test_get_color_palette_base_branch():
     """Covers the early return branch of get_color_palette when requested colors <= base palette size."""
     palette = get_color_palette(5)
@@ -31,3 +77,11 @@ def test_get_color_palette_extension():
     colors = get_color_palette(15)
     assert len(colors) == 15
     assert len(set(colors)) == 15
+
+
+def test_to_naive_utc():
+    assert to_naive_utc(None) is None
+    assert to_naive_utc(datetime(2023, 1, 1, 12)) == datetime(2023, 1, 1, 12)
+    assert to_naive_utc(datetime.fromisoformat("2023-01-01T12:00:00Z")) == datetime(2023, 1, 1, 12)
+    east = datetime(2023, 1, 1, 1, tzinfo=timezone(timedelta(hours=2)))
+    assert to_naive_utc(east) == datetime(2022, 12, 31, 23)
@@ -3,9 +3,11 @@ import numpy as np
 import pandas as pd
 import random
 import base64
+import pytest
 
 from backend_app.vehicle_data import VehicleDataVisualizer
 from backend_app.db_mongo import FleetDatabase
+from backend_app.utils import geodesic_km
 
 from .conftest import DummyClient
 
@@ -34,6 +36,20 @@ def test_compute_distance_traveled():
     assert distance[distance['distance_km'] >= 0].shape[0] == distance.shape[0]
 
 
+def test_compute_distance_traveled_units(monkeypatch):
+    # Requested units are pushed down to the query, the fleet is never listed
+    def no_fleet_scan(self):
+        raise AssertionError("get_all_vehicles should not be called")
+
+    monkeypatch.setattr(FleetDatabase, "get_all_vehicles", no_fleet_scan)
+    visualizer = VehicleDataVisualizer()
+    distance = visualizer.compute_distance_traveled(['V1'])
+    assert set(distance['unit-id']) == {'V1'}
+
+    avgs = visualizer.compute_daily_average(['V2'])
+    assert set(avgs['unit-id']) == {'V2'}
+
+
 def test_compute_distance_traveled_empty(monkeypatch):
     empty_client = DummyClient([], [])
 
@@ -137,6 +153,32 @@ def test_compute_distance_traveled_exception_branch(monkeypatch):
     assert distance.iloc[0]['distance_km'] == 0.0
 
 
+def test_compute_distance_traveled_day_boundary(monkeypatch):
+    # The segment between the last point of a day and the first of the next is not counted
+    data = [
+        {"unit-id": "vehicle_1", "timestamp": datetime(2023, 10, 1, 8, 0), "latitude": 0.0, "longitude": 0.0},
+        {"unit-id": "vehicle_1", "timestamp": datetime(2023, 10, 1, 9, 0), "latitude": 0.0, "longitude": 1.0},
+        {"unit-id": "vehicle_1", "timestamp": datetime(2023, 10, 2, 8, 0), "latitude": 1.0, "longitude": 1.0},
+        {"unit-id": "vehicle_2", "timestamp": datetime(2023, 10, 1, 8, 0), "latitude": 5.0, "longitude": 5.0},
+    ]
+    boundary_client = DummyClient(data, [])
+
+    def boundary_init(self, connection_str: str = "mongodb://localhost:27017", db_name: str = "fleet_db"):
+        self.client = boundary_client
+        self.db = self.client[db_name]
+        self.vehicles = self.db.fleet_vehicle_data
+        self.vehicles_variables = []
+
+    monkeypatch.setattr(FleetDatabase, "__init__", boundary_init)
+
+    visualizer = VehicleDataVisualizer()
+    distance = visualizer.compute_distance_traveled()
+    assert list(distance['unit-id']) == ["vehicle_1", "vehicle_1", "vehicle_2"]
+    assert np.isclose(distance.iloc[0]['distance_km'], geodesic_km((0.0, 0.0), (0.0, 1.0)))
+    assert distance.iloc[1]['distance_km'] == 0.0
+    assert distance.iloc[2]['distance_km'] == 0.0
+
+
 def test_compute_daily_average():
     visualizer = VehicleDataVisualizer()
     avgs = visualizer.compute_daily_average()
@@ -148,6 +190,21 @@ def test_compute_daily_average():
     assert all(avgs['distance_km'] >= 0)
 
 
+def test_compute_daily_average_single_fetch(monkeypatch):
+    calls = []
+    get_vehicle_data = FleetDatabase.get_vehicle_data
+
+    def counting_get_vehicle_data(self, *args, **kwargs):
+        calls.append(args)
+        return get_vehicle_data(self, *args, **kwargs)
+
+    monkeypatch.setattr(FleetDatabase, "get_vehicle_data", counting_get_vehicle_data)
+    visualizer = VehicleDataVisualizer()
+    avgs = visualizer.compute_daily_average(['V1'])
+    assert not avgs.empty
+    assert len(calls) == 1
+
+
 def test_compute_daily_average_empty(monkeypatch):
     empty_client = DummyClient([], [])
 
@@ -210,6 +267,16 @@ def test_compute_daily_average_merge_branch(monkeypatch):
     assert set(avgs.columns) == {'unit-id', 'date', 'avg_speed', 'distance_km'}
 
 
+def test_compute_daily_average_without_distance(monkeypatch):
+    # The speed is aggregated while the distance source has no rows
+    monkeypatch.setattr(VehicleDataVisualizer, "compute_distance_traveled", lambda self, *args: pd.DataFrame())
+    visualizer = VehicleDataVisualizer()
+    avgs = visualizer.compute_daily_average(['V1'])
+    assert len(avgs) == 1
+    assert list(avgs['distance_km']) == [0.0]
+    assert visualizer.plot_daily_average('V1') != ""
+
+
 def test_create_time_series_plot_empty():
     # It can be emtpy either due to invalid vehicle ids, no valid field, or date out of range
     visualizer = VehicleDataVisualizer()
@@ -608,4 +675,69 @@ def test_plot_daily_average_valid():
         decoded_success = True
     except Exception:
         decoded_success = False
-    assert decoded_success
\ No newline at end of file
+    assert decoded_success
+
+def test_time_series_data():
+    visualizer = VehicleDataVisualizer()
+    data = visualizer.time_series_data(['V1', 'V3'], 'engine-speed')
+    assert list(data.columns) == ['unit-id', 'timestamp', 'engine-speed']
+    assert set(data['unit-id']) == {'V1'}
+    assert visualizer.time_series_data(['V1'], 'invalid-field').empty
+
+
+def test_distribution_data():
+    visualizer = VehicleDataVisualizer()
+    data = visualizer.distribution_data(['V1', 'V2'], 'engine-speed', bins=5)
+    assert list(data.columns) == ['unit-id', 'bin_start', 'bin_end', 'count']
+    for unit_id in ['V1', 'V2']:
+        unit = data[data['unit-id'] == unit_id]
+        points = visualizer.time_series_data([unit_id], 'engine-speed')
+        assert len(unit) == 5
+        assert unit['count'].sum() == len(points)
+        assert np.allclose(unit['bin_end'].iloc[:-1], unit['bin_start'].iloc[1:])
+
+
+def test_box_plot_data():
+    visualizer = VehicleDataVisualizer()
+    data = visualizer.box_plot_data(['V1', 'V3'], 'engine-speed')
+    assert list(data['unit-id']) == ['V1']
+    row = data.iloc[0]
+    values = visualizer.time_series_data(['V1'], 'engine-speed')['engine-speed']
+    assert row['median'] == pytest.approx(values.median())
+    assert row['whisker_low'] <= row['q1'] <= row['median'] <= row['q3'] <= row['whisker_high']
+    assert row['count'] == len(values)
+
+
+def test_correlation_data():
+    visualizer = VehicleDataVisualizer()
+    data = visualizer.correlation_data('V1')
+    assert list(data['field']) == visualizer.numeric_fields[:-1]
+    assert list(data.columns) == ['field'] + visualizer.numeric_fields[:-1]
+    assert visualizer.correlation_data('V3').empty
+
+
+def test_time_series_data_downsampled(monkeypatch):
+    basetime = datetime(2023, 1, 1, 0, 0)
+    vehicle_variables = [
+        {"unit-id": vid, "engine-speed": float(i % 100), "timestamp": basetime + timedelta(seconds=i)}
+        for vid in ["V1", "V2"] for i in range(5000)
+    ]
+    vehicle_variables[1234]["engine-speed"] = 10000.0
+    vehicle_variables[2000]["engine-speed"] = pd.NA
+    dummy_client = DummyClient([], vehicle_variables)
+    def long_init(self, connection_str: str = "mongodb://localhost:27017", db_name: str = "fleet_db"):
+        self.client = dummy_client
+        self.db = self.client[db_name]
+        self.vehicles = self.db.fleet_vehicle_data
+        self.vehicles_variables = self.db.vehicles_variables
+
+    monkeypatch.setattr(FleetDatabase, "__init__", long_init)
+    visualizer = VehicleDataVisualizer()
+    data = visualizer.time_series_data(['V1', 'V2'], 'engine-speed', max_points=500)
+    assert (data['unit-id'] == 'V1').sum() == 500
+    assert (data['unit-id'] == 'V2').sum() == 500
+    assert data['engine-speed'].max() == 10000.0
+    assert data['engine-speed'].notna().all()
+
+    assert len(visualizer.time_series_data(['V1'], 'engine-speed', max_points=None)) == 5000
+    assert visualizer.create_time_series_plot(['V1', 'V2'], 'engine-speed', max_points=500) != ""